@@ -0,0 +1,178 @@
+""" Dedicated actuation thread.
+
+Every valve and relay command is executed on a single thread from a priority
+queue, so the thread receiving an abort (the network receiver or the
+acquisition loop for redlines) never waits on the hardware. Safing commands
+jump ahead of everything else and discard anything queued before them, and
+program updates are locked out until the next program is started. An abort
+therefore waits for at most the one command already in progress.
+
+The time from an abort being received to its safing commands completing is
+recorded for every abort. Callers which measure their own latency (e.g. the
+redlines) can pass on_complete, which is called on the actuation thread with
+the time the command completed.
+"""
+import heapq
+import itertools
+import logging
+
+from threading import Condition, Thread
+
+import timing
+from instrumentation import LatencyHistogram, format_duration
+
+logger = logging.getLogger(__name__)
+
+# Command priorities, lowest first
+SAFING = 0
+MANUAL = 1
+PROGRAM = 2
+
+PRIORITY_NAMES = {SAFING : "safing", MANUAL : "manual", PROGRAM : "program"}
+
+
+class Actuator:
+    """ Executes hardware commands in priority order on its own thread.
+    """
+    def __init__(self):
+        self.queue = []
+        self.sequence = itertools.count()
+        self.condition = Condition()
+        self.thread = None
+        self.running = False
+        # True while a command is executing
+        self.busy = False
+
+        # Program commands are rejected after a safing command until the next
+        # program is started.
+        self.program_enabled = False
+
+        # Time from receipt to completion of each command, per priority
+        self.latency = {
+            priority : LatencyHistogram() for priority in PRIORITY_NAMES
+        }
+        self.dropped = 0
+
+    def start(self):
+        self.running = True
+        self.thread = Thread(target=self.run, daemon=True, name="ActuationThread")
+        self.thread.start()
+
+    def stop(self):
+        with self.condition:
+            self.running = False
+            self.condition.notify_all()
+        if self.thread is not None:
+            self.thread.join()
+            self.thread = None
+
+    def submit(self, fn, priority=MANUAL, received=None, on_complete=None):
+        """
+        Queue fn for execution. received is when the request arrived (defaults
+        to now), for the latency statistics. Returns False if the command was
+        rejected.
+        """
+        received = timing.now() if received is None else received
+
+        with self.condition:
+            if priority == PROGRAM:
+                if not self.program_enabled:
+                    return False
+                # Only the latest program state matters, so a queued program
+                # command is superseded rather than executed late.
+                self.discard(PROGRAM)
+
+            heapq.heappush(
+                self.queue,
+                (priority, next(self.sequence), received, fn, on_complete)
+            )
+            self.condition.notify_all()
+        return True
+
+    def safe(self, fn, received=None, on_complete=None):
+        """
+        Queue a safing command ahead of everything else. Commands queued before
+        it are discarded and program commands are locked out.
+        """
+        received = timing.now() if received is None else received
+
+        with self.condition:
+            self.program_enabled = False
+            self.discard(MANUAL, PROGRAM)
+
+            heapq.heappush(
+                self.queue,
+                (SAFING, next(self.sequence), received, fn, on_complete)
+            )
+            self.condition.notify_all()
+
+    def discard(self, *priorities):
+        # Must hold the condition
+        kept = [entry for entry in self.queue if entry[0] not in priorities]
+        self.dropped += len(self.queue) - len(kept)
+        self.queue = kept
+        heapq.heapify(self.queue)
+
+    def flush(self, timeout=None):
+        """
+        Wait until every queued command has executed, e.g. so that slow work
+        does not compete with safing commands. Returns False on timeout.
+        """
+        with self.condition:
+            return self.condition.wait_for(
+                lambda: not (self.queue or self.busy) or not self.running,
+                timeout
+            )
+
+    def enable_program(self):
+        with self.condition:
+            self.program_enabled = True
+
+    def disable_program(self):
+        with self.condition:
+            self.program_enabled = False
+            self.discard(PROGRAM)
+
+    def run(self):
+        while True:
+            with self.condition:
+                while self.running and not self.queue:
+                    self.condition.wait()
+                if not self.running:
+                    return
+                priority, _, received, fn, on_complete = heapq.heappop(self.queue)
+                self.busy = True
+
+            try:
+                fn()
+            except Exception:
+                logger.exception(
+                    f"Failed to execute {PRIORITY_NAMES[priority]} command!"
+                )
+
+            completed = timing.now()
+            latency = completed - received
+            self.latency[priority].record(latency)
+
+            if on_complete is not None:
+                try:
+                    on_complete(completed)
+                except Exception:
+                    logger.exception("Command completion callback failed!")
+
+            with self.condition:
+                self.busy = False
+                self.condition.notify_all()
+
+            if priority == SAFING:
+                logger.warning(
+                    f"Safing commands applied {format_duration(latency)} after "
+                    f"the request (worst {format_duration(self.latency[SAFING].worst)})."
+                )
+
+    def format(self):
+        return ", ".join([
+            f"{name} {self.latency[priority].format()}"
+            for priority, name in PRIORITY_NAMES.items()
+            if self.latency[priority].count
+        ] + [f"{self.dropped} dropped"])
@@ -0,0 +1,264 @@
+""" Full-rate event captures.
+
+The CaptureBuffer keeps the last PRE_TRIGGER seconds of every raw sample in
+per-sensor ring buffers. When a trigger occurs (an action, a redline, or a
+sensor crossing its Capture Threshold), the pre-trigger data is frozen and
+samples keep being collected for POST_TRIGGER seconds. The raw buffers are then
+handed to a streaming thread, which merges them into a Capture, writes it to
+its own file and streams it to the monitor in chunks over the reliable link,
+so transients are available at the full rate without a full rate downlink.
+
+Only the acquisition thread touches the buffers. Triggers from other threads
+are queued and handled on the next tick.
+"""
+import datetime
+import logging
+import time
+import zlib
+
+from collections import deque
+from threading import Thread
+
+import numpy as np
+
+from zerolib.message import CaptureDataMessage
+
+logger = logging.getLogger(__name__)
+
+# Seconds kept before and after the trigger
+PRE_TRIGGER = 5
+POST_TRIGGER = 10
+
+# Points per chunk sent to the monitor, and the time between chunks. Chunks
+# are queued until delivered, the pacing only leaves bandwidth for the
+# telemetry. Chunks are numbered, so the monitor reports any which are lost
+# (e.g. if the connection drops).
+CHUNK_SIZE = 2000
+CHUNK_PERIOD = 0.01
+
+
+class Capture:
+    """ A completed capture, as flat arrays sorted by time.
+    """
+    def __init__(self, session, capture_id, reason, trigger_time, sensor_ids,
+            times, values):
+        self.session = session
+        self.capture_id = capture_id
+        self.reason = reason
+        self.trigger_time = trigger_time
+        self.sensor_ids = sensor_ids
+        self.times = times
+        self.values = values
+
+    def __len__(self):
+        return len(self.times)
+
+    def get_filename(self):
+        date = datetime.datetime.today().strftime('%Y %b %d %I.%M.%S %p')
+        return f"CAPTURE {date} {self.reason}.csv.gz"
+
+    def save(self, directory="Data"):
+        compressor = zlib.compressobj(level=3)
+        rows = "\n".join(["Time [s],Sensor ID,Reading"] + [
+            f"{t},{s},{v}" for t, s, v in zip(
+                self.times.tolist(), self.sensor_ids.tolist(),
+                self.values.tolist()
+            )
+        ]) + "\n"
+
+        filename = f"{directory}/{self.get_filename()}"
+        with open(filename, mode="wb") as file:
+            file.write(compressor.compress(rows.encode()))
+            file.write(compressor.flush())
+        logger.info(f"Saved capture to {filename}.")
+
+    def get_chunks(self, size=CHUNK_SIZE):
+        for i in range(0, len(self), size):
+            yield list(zip(
+                self.sensor_ids[i:i+size].tolist(),
+                self.times[i:i+size].tolist(),
+                self.values[i:i+size].tolist()
+            ))
+
+
+class RawCapture:
+    """ The buffers of a completed capture, as collected.
+
+    merge is slow for long captures, so it is called off the acquisition
+    thread.
+    """
+    def __init__(self, session, capture_id, reason, trigger_time, start_time,
+            frozen, post_data):
+        self.session = session
+        self.capture_id = capture_id
+        self.reason = reason
+        self.trigger_time = trigger_time
+        self.start_time = start_time
+        # Pre-trigger (times, values) and post-trigger [(t, value)] per sensor
+        self.frozen = frozen
+        self.post_data = post_data
+
+    def merge(self):
+        ids, times, values = [], [], []
+
+        for sensor, (pre_t, pre_v) in self.frozen.items():
+            mask = pre_t >= self.start_time
+            post = np.array(self.post_data[sensor]).reshape(-1, 2)
+
+            t = np.concatenate((pre_t[mask], post[:, 0]))
+            ids.append(np.full(len(t), sensor.get_id()))
+            times.append(t)
+            values.append(np.concatenate((pre_v[mask], post[:, 1])))
+
+        ids = np.concatenate(ids)
+        times = np.concatenate(times)
+        values = np.concatenate(values)
+        order = np.argsort(times, kind="stable")
+
+        capture = Capture(
+            self.session, self.capture_id, self.reason, self.trigger_time,
+            ids[order], times[order], values[order]
+        )
+        logger.info(f"Captured {len(capture)} samples of {self.reason}.")
+        return capture
+
+
+class SensorRing:
+    """ Fixed size ring buffer of (time, value) samples.
+    """
+    def __init__(self, size):
+        self.times = np.empty(size)
+        self.values = np.empty(size)
+        self.size = size
+        self.index = 0
+        self.count = 0
+
+    def add(self, t, value):
+        self.times[self.index] = t
+        self.values[self.index] = value
+        self.index = (self.index + 1) % self.size
+        if self.count < self.size:
+            self.count += 1
+
+    def get_ordered(self):
+        if self.count < self.size:
+            return self.times[:self.count].copy(), self.values[:self.count].copy()
+
+        order = np.r_[self.index:self.size, 0:self.index]
+        return self.times[order], self.values[order]
+
+
+class CaptureBuffer:
+    """ Pre/post trigger capture of every raw sample.
+
+    on_complete is called with the RawCapture of each completed capture on
+    the acquisition thread, so it should hand off any slow work (including
+    merging it).
+    """
+    def __init__(self, sensors, on_complete, pre=PRE_TRIGGER, post=POST_TRIGGER):
+        self.pre = pre
+        self.post = post
+        self.on_complete = on_complete
+
+        self.rings = {
+            sensor : SensorRing(max(int(pre * sensor.get_rate() * 1.2), 1))
+            for sensor in sensors
+        }
+        self.thresholds = {
+            sensor : sensor.get_capture_threshold() for sensor in sensors
+            if sensor.get_capture_threshold() is not None
+        }
+        self.last_values = {}
+
+        # (reason, time) of triggers not yet handled
+        self.pending = deque()
+        self.captures = 0
+        # Capture IDs restart with every run, the session tells runs apart
+        self.session = int(time.time()) & 0xFFFFFFFF
+
+        # State of the capture in progress
+        self.active = False
+        self.reason = None
+        self.trigger_time = None
+        self.frozen = None
+        self.post_data = None
+
+    def trigger(self, reason, t):
+        # Thread-safe
+        self.pending.append((reason, t))
+
+    def add(self, sensor, t, value):
+        self.rings[sensor].add(t, value)
+
+        if self.active:
+            self.post_data[sensor].append((t, value))
+
+        if sensor in self.thresholds:
+            threshold = self.thresholds[sensor]
+            last = self.last_values.get(sensor)
+            if last is not None and last < threshold <= value:
+                self.trigger(f"{sensor.get_name()} above {threshold:g}", t)
+            self.last_values[sensor] = value
+
+    def tick(self, t):
+        """
+        Called once per loop iteration with the current time.
+        """
+        while self.pending:
+            reason, trigger_time = self.pending.popleft()
+            if self.active:
+                logger.info(f"Capture already in progress, not capturing {reason}.")
+            else:
+                self.start(reason, trigger_time)
+
+        if self.active and t >= self.trigger_time + self.post:
+            self.finish()
+
+    def start(self, reason, trigger_time):
+        logger.info(f"Capturing {reason} at {trigger_time:.3f} s.")
+        self.active = True
+        self.reason = reason
+        self.trigger_time = trigger_time
+        self.frozen = {sensor : ring.get_ordered() for sensor, ring in self.rings.items()}
+        self.post_data = {sensor : [] for sensor in self.rings}
+
+    def finish(self):
+        # The buffers are handed off as they are, the merge is done later
+        self.captures += 1
+        raw = RawCapture(
+            self.session, self.captures, self.reason, self.trigger_time,
+            self.trigger_time - self.pre, self.frozen, self.post_data
+        )
+
+        self.active = False
+        self.frozen = None
+        self.post_data = None
+
+        self.on_complete(raw)
+
+
+def stream_capture(raw, dispatch):
+    """
+    Merge a RawCapture, save it and send it to the monitor in a background
+    thread. dispatch(msg) must deliver every message (not only the latest).
+    """
+    def run():
+        capture = raw.merge()
+        try:
+            capture.save()
+        except OSError as e:
+            logger.error(f"Could not save capture: {e}")
+
+        chunks = list(capture.get_chunks())
+        for i, chunk in enumerate(chunks):
+            dispatch(CaptureDataMessage(
+                capture.session, capture.capture_id, i, len(chunks),
+                capture.trigger_time, capture.reason, chunk
+            ))
+            time.sleep(CHUNK_PERIOD)
+
+        logger.info(f"Sent capture of {capture.reason} in {len(chunks)} chunks.")
+
+    thread = Thread(target=run, daemon=True, name="CaptureStreamThread")
+    thread.start()
+    return thread
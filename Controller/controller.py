@@ -1,26 +1,50 @@
 import time
 import logging
 
-from zerolib.message import MessageType, ActionType, SensorDataMessage, EngineProgramSettingsMessage
+from threading import Lock
+
+from zerolib.message import MessageType, ActionType, SensorDataMessage, EngineProgramSettingsMessage, SpectrumMessage
 
 from sensor_controller import SensorController
+from actuation import MANUAL
+from capture import stream_capture
+import timing
 
 logger = logging.getLogger(__name__)
 
+# Actions which trigger a full rate capture
+CAPTURE_ACTIONS = [
+    ActionType.BEGIN_BURN_PHASE,
+    ActionType.ABORT,
+    ActionType.ABORT_BURN_PHASE,
+    ActionType.FIRE_IGNITOR
+]
+
 class TestBenchController:
     """
     Handle the mainloop of the controller logic
     """
 
-    def __init__(self, peripheral_manager, dispatcher, sens_cfg, test_program):
+    def __init__(self, peripheral_manager, dispatcher, sens_cfg, test_program,
+            sensor_array=None):
         self.peripheral_manager = peripheral_manager
         self.sens_cfg = sens_cfg
 
         self.dispatcher = dispatcher
         self.test_program = test_program
+        # Valve and relay commands are executed on the actuation thread
+        self.actuator = peripheral_manager.actuator
+        # Actions come from both the network and the redlines
+        self.action_lock = Lock()
 
-        self.sb_rx = SensorController(sens_cfg, peripheral_manager)
+        self.sb_rx = SensorController(sens_cfg, peripheral_manager, sensor_array)
         self.sb_rx.register_callback(self.data_handler)
+        self.sb_rx.register_spectrum_callback(self.spectrum_handler)
+        # Redlines execute their action directly, bypassing the network
+        self.sb_rx.register_redline_callback(self.execute)
+        self.sb_rx.register_capture_callback(self.capture_handler)
+        # Closed-loop programs read their sensor straight from the acquisition
+        self.test_program.connect_sensors(self.sb_rx, sens_cfg)
         
         self.initialization_time = time.perf_counter()
 
@@ -30,7 +54,17 @@ class TestBenchController:
         """
         msg = SensorDataMessage(timestamp, data)
         self.dispatcher.dispatch(msg)
+
+    def spectrum_handler(self, timestamp, sensor, bin_width, powers):
+        msg = SpectrumMessage(timestamp, sensor.get_id(), bin_width, powers)
+        self.dispatcher.dispatch(msg)
     
+    def capture_handler(self, raw):
+        # Merged, saved and sent over the reliable link in the background
+        stream_capture(
+            raw, lambda msg: self.dispatcher.dispatch(msg, reliable=True)
+        )
+
     def send_engine_program_list(self, status):
         if status is True:
             logger.info("Sending engine program list to monitor...")
@@ -50,7 +84,8 @@ class TestBenchController:
                 logger.error("No program is specified!")
                 return
             
-            self.test_program.load(f"../Engine Test Programs/{msg.payload}.prog")
+            # Programs are compiled when the controller starts
+            self.test_program.select(msg.payload)
             return
 
         if msg.get_type() != MessageType.ACTION:
@@ -59,33 +94,69 @@ class TestBenchController:
         
         action = msg.action
         logger.info(f"Received action type {action}.")
+        self.execute(action)
+
+    def execute(self, action, received=None, on_complete=None):
+        """
+        Execute an action. received is when it was requested (defaults to
+        now), and on_complete, if given, is called with the time the hardware
+        commands completed.
+        """
+        received = timing.now() if received is None else received
+
+        if action in CAPTURE_ACTIONS:
+            self.sb_rx.trigger_capture(action.name)
+
+        with self.action_lock:
+            self._execute(action, received, on_complete)
+
+    def abort_sequence(self):
+        ### GENERAL ABORT SEQUENCE
+        # Ensure that the propellant valves and fill valves are closed.
+        # Then, open the vent valve.
+        self.test_program.halt()
+        self.peripheral_manager.close_propellant_valves()
+        self.peripheral_manager.fill_valve.close()
+        self.peripheral_manager.vent_valve.open()
+
+    def abort_burn_phase_sequence(self):
+        ### BURN PHASE ABORT
+        # Similar to the general abort sequence, but we will make sure that
+        # the ignitor is safed and the vent valve is not opened (in case a
+        # recycle is possible)
+        self.test_program.halt()
+        self.peripheral_manager.ignitor.safe()
+        self.peripheral_manager.close_propellant_valves()
+
+    def _execute(self, action, received, on_complete=None):
+        # Aborts jump the actuation queue. The program thread is only told to
+        # stop (before the safing is queued), the valves do not wait for it.
         match action:
-            ### GENERAL ABORT SEQUENCE
-            # Ensure that the propellant valves and fill valves are closed.
-            # Then, open the vent valve.
             case ActionType.ABORT:
                 self.test_program.abort()
-                self.peripheral_manager.close_propellant_valves()
-                self.peripheral_manager.fill_valve.close()
-                self.peripheral_manager.vent_valve.open()
+                self.actuator.safe(self.abort_sequence, received, on_complete)
             
-            ### BURN PHASE ABORT
-            # Similar to the general abort sequence, but we will make sure that
-            # the ignitor is safed and the vent valve is not opened (in case a
-            # recycle is possible)
             case ActionType.ABORT_BURN_PHASE:
                 self.test_program.abort()
-                self.peripheral_manager.ignitor.safe()
-                self.peripheral_manager.close_propellant_valves()
+                self.actuator.safe(
+                    self.abort_burn_phase_sequence, received, on_complete
+                )
             
             ### INITIATE BURN PHASE
             # This is used to start the testing program (burn or cold flow)
             case ActionType.BEGIN_BURN_PHASE:
+                # Redlines still violated will trip again straight away
+                self.sb_rx.redlines.rearm()
                 self.test_program.run_program()
+                if on_complete:
+                    on_complete(timing.now())
 
             ### All other cases are simple and handled by the hw interface.
             case _:
-                self.peripheral_manager.execute_action(action)
+                self.actuator.submit(
+                    lambda: self.peripheral_manager.execute_action(action),
+                    MANUAL, received, on_complete
+                )
 
     def mainloop(self):
         self.sb_rx.start_collection()
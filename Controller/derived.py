@@ -0,0 +1,229 @@
+""" Derived (computed) sensors.
+
+Computed sensors such as the tank mass or mass flow rate are declared in
+sensors.cfg with a Derived operator and a list of Sources (sensor IDs). The
+DerivedSensorEngine evaluates them on the controller at the rate of their
+sources, so they are logged and transmitted like any physical sensor.
+
+Operators:
+    sum        - Sum of all sources.
+    scale      - A single source multiplied by Scale.
+    ratio      - First source divided by the second.
+    derivative - Time derivative of a single source, estimated with a streaming
+                 Savitzky-Golay filter over the last Window samples.
+Scale is applied to the result of every operator.
+"""
+import logging
+
+from abc import ABC, abstractmethod
+from collections import deque
+
+import numpy as np
+
+from scipy import signal
+
+logger = logging.getLogger(__name__)
+
+DEFAULT_DERIVATIVE_WINDOW = 41
+DERIVATIVE_POLYORDER = 2
+
+
+class DerivedNode(ABC):
+    """ A single computed sensor. Subclasses implement compute.
+    """
+    num_sources = None
+
+    def __init__(self, sensor, sources, rate):
+        self.sensor = sensor
+        self.sources = sources
+        self.scale = sensor.get_derivation().scale
+        self.rate = rate
+        self.next_time = 0
+
+        if self.num_sources is not None and len(sources) != self.num_sources:
+            raise RuntimeError(
+                f"{sensor.get_name()} requires {self.num_sources} source(s)!"
+            )
+
+    def evaluate(self, timestamp, values):
+        # Sources are held, so limit evaluation to the fastest source rate.
+        if timestamp < self.next_time:
+            return None
+        self.next_time = timestamp + 0.9 / self.rate
+
+        result = self.compute(timestamp, [values[s] for s in self.sources])
+        if result is None:
+            return None
+        return result * self.scale
+
+    @abstractmethod
+    def compute(self, timestamp, inputs):
+        # Value before scaling from the source values, None if not available
+        pass
+
+
+class SumNode(DerivedNode):
+    def compute(self, timestamp, inputs):
+        return sum(inputs)
+
+
+class ScaleNode(DerivedNode):
+    num_sources = 1
+
+    def compute(self, timestamp, inputs):
+        return inputs[0]
+
+
+class RatioNode(DerivedNode):
+    num_sources = 2
+
+    def compute(self, timestamp, inputs):
+        if inputs[1] == 0:
+            return None
+        return inputs[0] / inputs[1]
+
+
+class DerivativeNode(DerivedNode):
+    """ Streaming Savitzky-Golay derivative, evaluated at the newest sample.
+
+    The coefficients are computed once for unit spacing and scaled by the mean
+    sample spacing of the window, which tolerates small timing jitter.
+    """
+    num_sources = 1
+
+    def __init__(self, sensor, sources, rate):
+        super().__init__(sensor, sources, rate)
+
+        window = sensor.get_derivation().window or DEFAULT_DERIVATIVE_WINDOW
+        self.coeffs = signal.savgol_coeffs(
+            window, DERIVATIVE_POLYORDER, deriv=1, pos=window-1, use="dot"
+        )
+        self.times = deque(maxlen=window)
+        self.values = deque(maxlen=window)
+
+    def compute(self, timestamp, inputs):
+        self.times.append(timestamp)
+        self.values.append(inputs[0])
+
+        if len(self.values) < self.values.maxlen:
+            return None
+
+        spacing = (self.times[-1] - self.times[0]) / (len(self.times) - 1)
+        if spacing <= 0:
+            return None
+        return float(np.dot(self.coeffs, self.values)) / spacing
+
+
+NODE_TYPES = {
+    "sum" : SumNode,
+    "scale" : ScaleNode,
+    "ratio" : RatioNode,
+    "derivative" : DerivativeNode
+}
+
+
+class DerivedSensorEngine:
+    """ Evaluates every derived sensor in dependency order.
+    """
+    def __init__(self, sensor_config, source_rates=None):
+        self.sens_cfg = sensor_config
+        self.nodes = []
+        # Latest value of every sensor, physical or derived
+        self.latest = {}
+
+        self.build(source_rates)
+
+    def get_rate(self, sensor, rates):
+        if sensor.is_derived():
+            return rates[sensor]
+        return rates.get(sensor, sensor.get_rate())
+
+    def build(self, source_rates=None):
+        # source_rates holds the sample rates of physical sensors which differ
+        # from their configured rates.
+        derived = [s for s in self.sens_cfg.get_sensors() if s.is_derived()]
+        rates = dict(source_rates or {})
+        pending = list(derived)
+
+        # Simple topological sort: repeatedly add nodes whose sources are all
+        # physical sensors or already built.
+        while pending:
+            progress = False
+            for sensor in list(pending):
+                derivation = sensor.get_derivation()
+                try:
+                    sources = [self.sens_cfg.get(s_id=i) for i in derivation.sources]
+                except KeyError as e:
+                    raise RuntimeError(
+                        f"{sensor.get_name()} has an unknown source {e}!"
+                    )
+
+                if any(s.is_derived() and s not in rates for s in sources):
+                    continue
+
+                if derivation.operator not in NODE_TYPES:
+                    raise RuntimeError(
+                        f"Unknown operator {derivation.operator} for "
+                        f"{sensor.get_name()}!"
+                    )
+
+                rates[sensor] = max(self.get_rate(s, rates) for s in sources)
+                self.nodes.append(
+                    NODE_TYPES[derivation.operator](sensor, sources, rates[sensor])
+                )
+                pending.remove(sensor)
+                progress = True
+
+            if not progress:
+                raise RuntimeError(
+                    "Circular dependency between derived sensors: " +
+                    ", ".join(s.get_name() for s in pending)
+                )
+
+        for node in self.nodes:
+            logger.info(
+                f"Derived sensor {node.sensor.get_name()} = "
+                f"{node.sensor.get_derivation().operator}("
+                f"{', '.join(s.get_name() for s in node.sources)}) at "
+                f"{node.rate} Hz."
+            )
+
+    def get_sensors(self):
+        return [node.sensor for node in self.nodes]
+
+    def get_rates(self, source_rates=None):
+        """
+        Rate of each derived sensor, given the effective rates of any physical
+        sensors which differ from their configured rates.
+        """
+        rates = dict(source_rates or {})
+        for node in self.nodes:
+            rates[node.sensor] = max(
+                rates.get(s, s.get_rate()) for s in node.sources
+            )
+        return {node.sensor : rates[node.sensor] for node in self.nodes}
+
+    def update(self, timestamp, readings):
+        """
+        readings maps sensors to their new values for this iteration. Returns a
+        dict of the derived sensors that were updated and their new values.
+        """
+        self.latest.update(readings)
+        updated = set(readings)
+        outputs = {}
+
+        for node in self.nodes:
+            if not any(s in updated for s in node.sources):
+                continue
+            if not all(s in self.latest for s in node.sources):
+                continue
+
+            value = node.evaluate(timestamp, self.latest)
+            if value is None:
+                continue
+
+            outputs[node.sensor] = value
+            self.latest[node.sensor] = value
+            updated.add(node.sensor)
+
+        return outputs
@@ -0,0 +1,189 @@
+""" Lightweight timing instrumentation for the acquisition loop.
+
+Recording a sample only involves a bisect into a short list of bin edges and a
+few integer/float updates, so it is cheap enough to be called on every sensor
+read. Summaries are produced periodically and sent through the standard logger
+(which forwards them to the monitor and writes them to disk).
+"""
+import bisect
+import logging
+
+logger = logging.getLogger(__name__)
+
+# Upper edges of the latency histogram bins in seconds. The last bin catches
+# everything above the final edge.
+HISTOGRAM_EDGES = [
+    25e-6, 50e-6, 100e-6, 250e-6, 500e-6, 1e-3, 2.5e-3, 5e-3, 10e-3, 25e-3
+]
+
+# Time in seconds between published summaries.
+REPORT_PERIOD = 10
+
+
+def format_duration(seconds):
+    if seconds < 1e-3:
+        return f"{seconds*1e6:.0f}us"
+    return f"{seconds*1e3:.3g}ms"
+
+
+class LatencyHistogram:
+    """ Fixed-bin histogram of durations. Also tracks the count, sum and worst
+    case so that the mean and maximum are exact.
+    """
+    def __init__(self, edges=HISTOGRAM_EDGES):
+        self.edges = edges
+        self.reset()
+
+    def reset(self):
+        self.bins = [0] * (len(self.edges) + 1)
+        self.count = 0
+        self.total = 0.
+        self.worst = 0.
+
+    def record(self, duration):
+        self.bins[bisect.bisect_left(self.edges, duration)] += 1
+        self.count += 1
+        self.total += duration
+        if duration > self.worst:
+            self.worst = duration
+
+    def get_mean(self):
+        return self.total / self.count if self.count else 0.
+
+    def get_percentile(self, pct):
+        """
+        Return the upper edge of the bin containing the requested percentile.
+        The result is None if it falls in the overflow bin.
+        """
+        if not self.count:
+            return 0.
+
+        target = self.count * pct / 100
+        running = 0
+        for i, n in enumerate(self.bins):
+            running += n
+            if running >= target:
+                return self.edges[i] if i < len(self.edges) else None
+
+    def format(self):
+        p99 = self.get_percentile(99)
+        p99 = f"<{format_duration(p99)}" if p99 is not None \
+            else f">{format_duration(self.edges[-1])}"
+
+        return (
+            f"mean {format_duration(self.get_mean())}, p99 {p99}, "
+            f"max {format_duration(self.worst)}"
+        )
+
+
+class LoopStatistics:
+    """ Collects per-sensor read durations and per-iteration overruns for the
+    SensorController mainloop.
+
+    Statistics are accumulated over a reporting window and reset after every
+    summary, so each summary describes the last REPORT_PERIOD seconds.
+    """
+    def __init__(self, sensors, loop_timestep, report_period=REPORT_PERIOD,
+            timer=None):
+        self.sensors = sensors
+        self.loop_timestep = loop_timestep
+        self.report_period = report_period
+        # Optional DeadlineTimer whose wake-up error is included in summaries
+        self.timer = timer
+
+        self.read_hists = {sensor : LatencyHistogram() for sensor in sensors}
+        # Configured rates, unless lowered by the adaptive rate controller
+        self.target_rates = {sensor : sensor.get_rate() for sensor in sensors}
+        self.iteration_hist = LatencyHistogram()
+
+        self.window_start = None
+        self.next_report_time = None
+        self.reset()
+
+    def reset(self, now=None):
+        for hist in self.read_hists.values():
+            hist.reset()
+        self.iteration_hist.reset()
+        if self.timer:
+            self.timer.reset_statistics()
+
+        self.samples = {sensor : 0 for sensor in self.sensors}
+        self.overruns = 0
+        self.window_start = now
+        if now is not None:
+            self.next_report_time = now + self.report_period
+
+    def record_read(self, sensor, duration, valid=True):
+        # Failed reads still cost time, but do not count towards the rate.
+        self.read_hists[sensor].record(duration)
+        if valid:
+            self.samples[sensor] += 1
+
+    def set_target_rate(self, sensor, rate):
+        self.target_rates[sensor] = rate
+
+    def record_iteration(self, duration):
+        self.iteration_hist.record(duration)
+        if duration > self.loop_timestep:
+            self.overruns += 1
+
+    def get_achieved_rate(self, sensor, now):
+        elapsed = now - self.window_start
+        return self.samples[sensor] / elapsed if elapsed > 0 else 0.
+
+    def tick(self, now):
+        """
+        Called once per iteration. Publishes a summary and starts a new window
+        once the reporting period has elapsed.
+        """
+        if self.window_start is None:
+            self.reset(now)
+            return
+
+        if now < self.next_report_time:
+            return
+
+        self.report(now)
+        self.reset(now)
+
+    def report(self, now):
+        iterations = self.iteration_hist.count
+        overrun_pct = 100 * self.overruns / iterations if iterations else 0.
+
+        logger.info(
+            f"Acquisition loop: {iterations} iterations, {self.overruns} "
+            f"overruns ({overrun_pct:.2g}%), iteration time "
+            f"{self.iteration_hist.format()} "
+            f"(budget {format_duration(self.loop_timestep)})."
+        )
+
+        if self.timer:
+            logger.info(f"Sample clock: {self.timer.format()}.")
+
+        slowest = max(self.sensors, key=lambda s: self.read_hists[s].worst)
+        for sensor in self.sensors:
+            logger.debug(
+                f"{sensor.get_name()}: {self.format_rate(sensor, now)}."
+            )
+
+        logger.info(
+            f"Slowest sensor: {slowest.get_name()} "
+            f"({self.format_rate(slowest, now)})."
+        )
+
+        # Any sensor falling well short of its target rate is worth a warning
+        # as it will show up as choppy data on the monitor.
+        for sensor in self.sensors:
+            achieved = self.get_achieved_rate(sensor, now)
+            if achieved < 0.9 * self.target_rates[sensor]:
+                logger.warning(
+                    f"{sensor.get_name()} is sampling at {achieved:.4g} Hz, "
+                    f"below the target {self.target_rates[sensor]:.4g} Hz."
+                )
+
+    def format_rate(self, sensor, now):
+        return (
+            f"{self.get_achieved_rate(sensor, now):.4g}/"
+            f"{self.target_rates[sensor]:.4g} Hz, "
+            f"read time {self.read_hists[sensor].format()}"
+        )
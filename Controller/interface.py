@@ -1,13 +1,33 @@
 """ Zero Shield V2 HW Interface. Uses pigpio. Thread-safe.
 
+A pigpio.pi compatible object (e.g. simulation.SimulatedPi) can be passed in to
+run without the hardware.
+
+Every pigpio call is a socket round trip, so the interface only sends what
+changes: commands repeating the last output of a pin are suppressed (unless
+forced), and set_servos only sends the servos which changed. The number of
+calls issued and suppressed, and the latency of each call, are recorded.
 """
+from collections import Counter
 from enum import Enum
 from threading import Lock
 
 import logging
 logger = logging.getLogger(__name__)
 
-import pigpio
+from instrumentation import LatencyHistogram
+import timing
+
+try:
+    import pigpio
+except ImportError:
+    # Only a simulated pi can be used
+    pigpio = None
+
+# pigpio constants
+OUTPUT = 1
+LOW = 0
+HIGH = 1
 
 GPIO_LOCK = Lock()
 
@@ -32,12 +52,30 @@ class ServoMapping(Enum):
 
 SERVO_PWM_FREQ = 180 #hz
 
+def get_pwm_dutycycle(duty):
+    # Hardware PWM duty in millionths for a servo duty of 0 to 1
+    return int( duty * 0.0025 * SERVO_PWM_FREQ * 1000000 )
+
+def get_pulsewidth(duty):
+    # Servo pulse width in microseconds for a servo duty of 0 to 1
+    return int(duty * 2500)
+
+
 class HardwareInterface:
     """ Controls the hardware outputs of the Zero Shield V2.
     """
-    def __init__(self,):
-        self.pi = pigpio.pi()
+    def __init__(self, pi=None):
+        self.pi = pi if pi is not None else pigpio.pi()
         self.servo_state = {}
+
+        # Last output of each pin, to suppress repeated commands
+        self.outputs = {}
+
+        # Statistics per call
+        self.issued = Counter()
+        self.suppressed = Counter()
+        self.latency = {}
+
         self.set_modes()
 
     def check_status(self):
@@ -48,33 +86,78 @@ class HardwareInterface:
     @synchronized
     def set_modes(self):
         for io in IOMapping:
-            self.pi.set_mode(io.value, pigpio.OUTPUT)
+            self.pi.set_mode(io.value, OUTPUT)
 
         for io in ServoMapping:
-            self.pi.set_mode(io.value, pigpio.OUTPUT)
+            self.pi.set_mode(io.value, OUTPUT)
             self.servo_state[io] = False
         
         self.status = True
 
+    def is_repeated(self, name, pin, output, force):
+        # Must hold GPIO_LOCK
+        if not force and self.outputs.get(pin) == output:
+            self.suppressed[name] += 1
+            return True
+        return False
+
+    def record_call(self, name, start):
+        self.issued[name] += 1
+        if name not in self.latency:
+            self.latency[name] = LatencyHistogram()
+        self.latency[name].record(timing.now() - start)
+
+    def forget(self, *pins):
+        """
+        Forget the last output of pins driven outside of the interface (e.g. by
+        a waveform), so the next command is always sent.
+        """
+        with GPIO_LOCK:
+            for pin in pins:
+                self.outputs.pop(pin, None)
+
     @synchronized
-    def activate_relay(self, relay):
+    def activate_relay(self, relay, force=False):
         self.check_status()
-        logger.debug(f"Set pin {relay} to HIGH.")
-        self.pi.write(relay, pigpio.HIGH)
+        if self.is_repeated("write", relay, HIGH, force):
+            return
+
+        start = timing.now()
+        self.pi.write(relay, HIGH)
+        self.outputs[relay] = HIGH
+        self.record_call("write", start)
+
+        if logger.isEnabledFor(logging.DEBUG):
+            logger.debug(f"Set pin {relay} to HIGH.")
 
     @synchronized
-    def deactivate_relay(self, relay):
+    def deactivate_relay(self, relay, force=False):
         self.check_status()
-        logger.debug(f"Set pin {relay} to LOW.")
-        self.pi.write(relay, pigpio.LOW)
+        if self.is_repeated("write", relay, LOW, force):
+            return
+
+        start = timing.now()
+        self.pi.write(relay, LOW)
+        self.outputs[relay] = LOW
+        self.record_call("write", start)
+
+        if logger.isEnabledFor(logging.DEBUG):
+            logger.debug(f"Set pin {relay} to LOW.")
 
     @synchronized
-    def set_servo(self, servo, duty, hardware=False):
+    def set_servo(self, servo, duty, hardware=False, force=False):
         # duty should be 0 to 1.
         self.check_status()
         if servo not in ServoMapping:
             raise RuntimeError("Unknown servo object!")
+        self._set_servo(servo, duty, hardware, force)
+
+    def _set_servo(self, servo, duty, hardware, force):
+        # Must hold GPIO_LOCK
+        if self.is_repeated("set_servo", servo.value, (duty, hardware), force):
+            return
         pwm_type = "hardware" if hardware else "software"
+        start = timing.now()
 
         if duty == 0:
             self.servo_state[servo] = False
@@ -85,7 +168,8 @@ class HardwareInterface:
                 self.pi.set_PWM_dutycycle(servo.value, 0)
                 self.pi.set_PWM_frequency(servo.value, 0)
 
-            logger.debug(f"Disabled {pwm_type} PWM on {servo}.")
+            if logger.isEnabledFor(logging.DEBUG):
+                logger.debug(f"Disabled {pwm_type} PWM on {servo}.")
         else:
             if not self.servo_state[servo]:
                 self.servo_state[servo] = True
@@ -94,15 +178,39 @@ class HardwareInterface:
 
             if hardware:
                 self.pi.hardware_PWM(
-                    servo.value, SERVO_PWM_FREQ,
-                    int( duty * 0.0025 * SERVO_PWM_FREQ * 1000000 )
+                    servo.value, SERVO_PWM_FREQ, get_pwm_dutycycle(duty)
                 )
             else:
-                self.pi.set_servo_pulsewidth(servo.value, duty*2500)
+                self.pi.set_servo_pulsewidth(servo.value, get_pulsewidth(duty))
+
+            if logger.isEnabledFor(logging.DEBUG):
+                logger.debug(f"Set servo output to {duty*100:.4g}% on {servo} ({pwm_type} PWM).")
+
+        self.outputs[servo.value] = (duty, hardware)
+        self.record_call("set_servo", start)
 
-            logger.debug(f"Set servo output to {duty*100:.4g}% on {servo} ({pwm_type} PWM).")
+    @synchronized
+    def set_servos(self, commands, force=False):
+        """
+        Set several servos at once. commands is a list of (servo, duty,
+        hardware) tuples. Only the servos which changed are sent, one call
+        each (pigpio cannot set several PWM outputs in one exchange).
+        """
+        self.check_status()
+        for servo, duty, hardware in commands:
+            if servo not in ServoMapping:
+                raise RuntimeError("Unknown servo object!")
+            self._set_servo(servo, duty, hardware, force)
+
+    def format_statistics(self):
+        return ", ".join([
+            f"{name}: {self.issued[name]} issued, {self.suppressed[name]} "
+            f"suppressed, latency {self.latency[name].format() if name in self.latency else '-'}"
+            for name in sorted(set(self.issued) | set(self.suppressed))
+        ])
 
     @synchronized
     def teardown(self):
+        logger.info(f"Hardware commands: {self.format_statistics()}.")
         self.pi.stop()
         self.status = False
@@ -0,0 +1,52 @@
+""" Scheduling of the NAU7802 load cell reads.
+
+The load cells convert at a fixed rate independent of the acquisition loop. The
+LoadCellScheduler polls each converter's data-ready flag and hands out every
+conversion exactly once, so the data log never contains duplicated samples and
+no I2C time is spent re-reading a conversion that is not finished.
+
+Any object with a read_fresh method returning a new conversion or None can be
+scheduled, e.g. zerolib.nau7802.NAU7802Reader or simulation.SimulatedNAU7802.
+"""
+import logging
+
+logger = logging.getLogger(__name__)
+
+# Conversions per second, as configured by SensorArray. Load cells are polled
+# faster than this (see sensors.cfg) so no conversion is missed.
+CONVERSION_RATE = 80
+
+
+class LoadCellScheduler:
+    """ Tracks fresh conversions for a set of load cell converters.
+
+    Polling faster than the conversion rate catches every conversion. Polls that
+    find no new data only cost a one byte status read.
+    """
+    def __init__(self, converters):
+        self.converters = converters
+
+        self.polls = [0] * len(converters)
+        self.conversions = [0] * len(converters)
+
+    def read(self, n):
+        """
+        Return a new conversion from load cell n, or None if the converter has
+        not finished one since the last read.
+        """
+        self.polls[n] += 1
+        value = self.converters[n].read_fresh()
+        if value is not None:
+            self.conversions[n] += 1
+        return value
+
+    def poll_all(self):
+        """
+        Poll every converter once, in switch channel order. Returns a list
+        with a new conversion or None for each load cell.
+        """
+        return [self.read(n) for n in range(len(self.converters))]
+
+    def get_hit_ratio(self, n):
+        # Fraction of polls that returned fresh data
+        return self.conversions[n] / self.polls[n] if self.polls[n] else 0.
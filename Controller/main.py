@@ -35,6 +35,11 @@ parser.add_argument(
     default = "127.0.0.1",
     help = "The IP address of the monitor. If unspecified, localhost is used."
 )
+parser.add_argument(
+    "--simulate",
+    action = "store_true",
+    help = "Run without the hardware, using simulated sensors and GPIO."
+)
 args = parser.parse_args()
 
 ### SETUP
@@ -63,15 +68,28 @@ sens_cfg = SensorConfiguration(sensor_cfg_location)
 sens_cfg.read_config()
 
 # Initialize the hardware interface and peripheral manager
-interface = HardwareInterface()
+if args.simulate:
+    from simulation import SimulatedPi, SimulatedSensorArray
+    logging.warning("Running with simulated hardware!")
+    interface = HardwareInterface(pi=SimulatedPi())
+else:
+    interface = HardwareInterface()
 peripheral_manager = PeripheralManager(interface)
 peripheral_manager.set_default_states()
 
+if args.simulate:
+    sensor_array = SimulatedSensorArray(peripheral_manager)
+else:
+    sensor_array = None
+
 # Initialize the valve programming for this test
 program = EngineTestProgram(peripheral_manager)
+program.preload()
 
 # Initialize the controller
-controller = TestBenchController(peripheral_manager, server, sens_cfg, program)
+controller = TestBenchController(
+    peripheral_manager, server, sens_cfg, program, sensor_array
+)
 
 ### SETUP SERVER
 server.register_request_hook(controller.handler)
@@ -3,6 +3,7 @@
 """
 from enum import Enum
 
+from actuation import Actuator
 from interface import IOMapping, ServoMapping
 from servo import ServoBallValve, ValveCalibration
 from zerolib.enums import ActionType
@@ -27,7 +28,8 @@ class RelayDevice:
         self.hw_intf.activate_relay(self.io_port)
 
     def safe(self):
-        self.hw_intf.deactivate_relay(self.io_port)
+        # Always sent, the output may have been changed outside the interface
+        self.hw_intf.deactivate_relay(self.io_port, force=True)
 
 class PeripheralManager:
     """
@@ -36,6 +38,10 @@ class PeripheralManager:
     def __init__(self, hw_interface):
         self.hw_intf = hw_interface
 
+        # Commands from the controller and valve programs run on this thread
+        self.actuator = Actuator()
+        self.actuator.start()
+
         ### VALVES
         self.fill_valve = ServoBallValve(
             ServoMapping.FILL_VALVE, hw_interface, **ValveCalibration.FILL_VALVE.value
@@ -72,6 +78,8 @@ class PeripheralManager:
         self.danger_light.safe()
 
     def teardown(self):
+        self.actuator.stop()
+
         for valve in self.valves:
             valve.close()
 
@@ -83,8 +91,15 @@ class PeripheralManager:
         self.hw_intf.teardown()
     
     def close_propellant_valves(self):
-        self.fuel_valve.close()
-        self.oxidizer_valve.close()
+        self.hw_intf.set_servos([
+            self.fuel_valve.close_command(), self.oxidizer_valve.close_command()
+        ], force=True)
+
+    def set_propellant_throttles(self, fuel, oxidizer):
+        self.hw_intf.set_servos([
+            self.fuel_valve.throttle_command(fuel),
+            self.oxidizer_valve.throttle_command(oxidizer)
+        ])
 
     def set_light_status(self, status):
         match status:
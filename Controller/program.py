@@ -1,118 +1,455 @@
 """ Implements the logic executing valve programs.
 
+Programs are compiled into arrays (see program_compiler) when loaded. By
+default they are played back as DMA-timed pigpio waveforms, so the valve timing
+does not depend on Python scheduling. If waveforms are not available, the
+valves are commanded from an absolute-deadline scheduler instead. In both
+cases the commanded and actual timing is recorded and saved after the test.
+
+All valve commands go through the actuation thread, and the program thread
+waits on an Event rather than sleeping, so an abort never waits for it.
+
+Programs with a closed-loop target are run by the deadline scheduler at the
+control rate, with the throttles corrected by the ThrottleController from the
+latest sample of the controlled sensor (see throttle_control).
 """
-import time
+import datetime
 import logging
 import os
-from threading import Thread
+from functools import partial
+from threading import Event, Thread
+
+import numpy as np
+
+import timing
+
+from actuation import PROGRAM, SAFING
+from instrumentation import LatencyHistogram
+from program_compiler import load_program
+from throttle_control import (
+    DEFAULT_SETTINGS, STALE_PERIODS, SampleTap, ThrottleController
+)
+from waveforms import WaveformPlayer, build_chunks, PERIOD_US
 
 logger = logging.getLogger(__name__)
 
+# Valve program execution modes
+WAVEFORM = "waveform" # DMA timed by pigpio
+DEADLINE = "deadline" # Commanded from Python against absolute deadlines
+CLOSED_LOOP = "closed loop" # Deadline scheduled with feedback
+PROGRAM_MODE = WAVEFORM
+
+# Command period of the deadline scheduler, and the polling period while a
+# waveform plays.
+PROGRAM_TIMESTEP = 0.01
+
+PROGRAM_DIRECTORY = "../Engine Test Programs"
+
+# Bin edges for the lateness of valve commands
+LATENESS_EDGES = [1e-4, 2e-4, 5e-4, 1e-3, 2e-3, 5e-3, 1e-2, 2e-2, 5e-2]
+
+RECORD_HEADER = "Commanded [s],Actual [s],Fuel,Oxidizer,Ignitor"
+# In waveform mode, one row per chunk. The chunks are timed by DMA, the time
+# they were seen playing is only accurate to the polling period.
+WAVEFORM_RECORD_HEADER = (
+    f"Chunk Start [s],Seen Playing (within {PROGRAM_TIMESTEP*1e3:g} ms) [s],"
+    "Fuel,Oxidizer,Ignitor"
+)
+# Extra columns in closed-loop mode
+CONTROL_HEADER = ",Target,Measured,Sample Age [s]"
+
 class EngineTestProgram:
     """
     Load and execute a testing program. The program should be specified as a
     csv file with time, fuel valve position, oxidizer valve position, and ignitor status.
     """
-    def __init__(self, peripheral_manager):
-        self.program = []
+    def __init__(self, peripheral_manager, mode=PROGRAM_MODE):
+        self.program = None
+        # Compiled and validated programs by name, see preload
+        self.programs = {}
         self.thread = None
         self.running = False
         self.pm = peripheral_manager
+        self.actuator = peripheral_manager.actuator
         self.callback = None
+        self.mode = mode
+        # Mode used by the current or last run
+        self.active_mode = None
 
-    def list_programs(self):
-        return [
-            filename.split(".prog")[0]
-            for filename in os.listdir("../Engine Test Programs/")
-            if filename.endswith(".prog")
-        ]
+        # Set to stop the program thread
+        self.stop_event = Event()
+        # Waveform being played, if any
+        self.player = None
+        # Ignitor state commanded by the program
+        self.ignitor_on = False
 
+        # (commanded time, actual time, fuel, oxidizer, ignitor) of each
+        # command during the last run. Closed-loop runs add the target, the
+        # measurement and its age.
+        self.record = []
 
-    def load(self, filename):
+        # Closed-loop control
+        self.control_settings = DEFAULT_SETTINGS
+        self.control_sensor = None
+        self.tap = None
+        # Time from the sample being read to the valves being commanded
+        self.control_latency = LatencyHistogram(LATENESS_EDGES)
+
+    def connect_sensors(self, sensor_controller, sens_cfg, settings=DEFAULT_SETTINGS):
+        """
+        Tap the closed-loop sensor from the acquisition loop.
+        """
+        self.control_settings = settings
+        sensors = sens_cfg.get_by_type(settings.sensor_type)
+        if not sensors:
+            logger.warning(f"No {settings.sensor_type.name} sensor, closed-loop programs cannot run.")
+            return
+
+        self.control_sensor = sensors[0]
+        self.tap = SampleTap()
+        sensor_controller.register_sample_tap(self.control_sensor, self.tap)
+
+    def list_programs(self):
+        return sorted(self.programs)
+
+    def compile(self, filename):
+        """
+        Load and validate a program file. Returns None if it cannot be run.
+        """
         if not os.path.exists(filename):
             logger.error(f"File {filename} does not exist!")
-            return
-        
+            return None
+
+        try:
+            program = load_program(filename)
+        except ValueError as e:
+            logger.error(f"Malformed engine program {filename}: {e}")
+            return None
+
+        errors, warnings = program.validate()
+        for warning in warnings:
+            logger.warning(f"Engine program {program.name}: {warning}")
+        for error in errors:
+            logger.error(f"Engine program {program.name}: {error}")
+
+        return None if errors else program
+
+    def preload(self, directory=PROGRAM_DIRECTORY):
+        """
+        Compile every program in the directory, so selecting one does not
+        touch the disk.
+        """
+        self.programs = {}
+        for filename in sorted(os.listdir(directory)):
+            if filename.endswith(".prog"):
+                program = self.compile(f"{directory}/{filename}")
+                if program is not None:
+                    self.programs[program.name] = program
+
+        logger.info(f"Loaded {len(self.programs)} engine programs.")
+
+    def set_program(self, program):
         if self.running is True:
             logger.error("Cannot set engine program while another is running!")
             return
 
-        with open(filename, "r") as f:
-            self.program = [
-                list(map(float, row.split(','))) for row in f.readlines()
-            ]
+        self.program = program
+        logger.info(f"Selected engine program {program.name} ({program.get_duration():.3g} s).")
 
-        for row in self.program:
-            if len(row) != 4:
-                logger.error("Malformed engine program.")
-                print("Bad row:", row)
+    def select(self, name):
+        if name not in self.programs:
+            logger.error(f"Engine program {name} does not exist or is invalid!")
+            return
+
+        self.set_program(self.programs[name])
 
-        logger.info(f"Successfully loaded program {filename}")
+    def load(self, filename):
+        program = self.compile(filename)
+        if program is not None:
+            self.set_program(program)
 
     def run_program(self, callback=None):
+        if self.program is None:
+            logger.error("No engine program is loaded!")
+            return
+
+        if self.running is True:
+            logger.error("An engine program is already running!")
+            return
+
+        if self.thread is not None:
+            # An aborted program may still be saving its record
+            self.thread.join()
+
         self.running = True
         self.callback = callback
+        self.stop_event.clear()
+        self.actuator.enable_program()
         self.thread = Thread(target=self._run, name="EngineProgramMainThread")
         self.thread.start()
 
     def abort(self):
-        if self.thread is not None:
+        """
+        Tell the program thread to stop. Returns immediately, the caller is
+        responsible for safing the valves (see halt).
+        """
+        if self.running is True:
             self.running = False
-            self.thread.join()
-            self.thread = None
+            self.stop_event.set()
         else:
             logger.warning("Tried to abort test but no test is running!")
 
+    def halt(self):
+        # Stop the hardware timed output. Called on the actuation thread, ahead
+        # of the safing commands.
+        player = self.player
+        if player is not None:
+            player.halt()
+
+    def supports_waveforms(self):
+        return hasattr(self.pm.hw_intf.pi, "wave_add_generic")
+
     def _run(self):
-        i = 0
-        stime = time.perf_counter()
         logger.warning("Executing valve program...")
-        ign_off = True
+        self.record = []
+        self.ignitor_on = False
+
+        try:
+            if self.program.is_closed_loop():
+                if self.tap is None:
+                    logger.error("The closed-loop sensor is not connected, running the program open-loop!")
+                    self.active_mode = DEADLINE
+                    self._run_deadline()
+                else:
+                    self.active_mode = CLOSED_LOOP
+                    self._run_closed_loop()
+            elif self.mode == WAVEFORM and self.supports_waveforms():
+                self.active_mode = WAVEFORM
+                self._run_waveform()
+            else:
+                self.active_mode = DEADLINE
+                self._run_deadline()
+        finally:
+            self.actuator.disable_program()
+            self.actuator.submit(self.safe_outputs, SAFING)
+            # Saving the record would compete with the safing for the GIL
+            self.actuator.flush(timeout=1)
+
+            self.running = False
+
+            logger.warning("Valve program complete.")
+            self.save_record()
+
+            if self.callback:
+                self.callback()
+
+    def safe_outputs(self):
+        self.pm.close_propellant_valves()
+        self.pm.ignitor.safe()
+
+    def set_ignitor(self, ign):
+        if ign and not self.ignitor_on:
+            self.pm.ignitor.fire()
+            logger.warning("Ignitor activated.")
+        elif not ign and self.ignitor_on:
+            self.pm.ignitor.safe()
+            logger.warning("Ignitor safed.")
+        self.ignitor_on = ign
+
+    def apply_state(self, ctime, start, fp, op, ign):
+        # Executed on the actuation thread
+        self.pm.set_propellant_throttles(fp, op)
+        self.set_ignitor(ign)
+
+        self.record.append((ctime, timing.now() - start, fp, op, ign))
+
+    def _run_deadline(self):
+        timer = timing.DeadlineTimer(PROGRAM_TIMESTEP)
+        start = timer.start()
+        t0 = self.program.times[0]
+        duration = self.program.get_duration()
 
         while self.running:
-            ctime = time.perf_counter() - stime
+            ctime = timer.ticks * PROGRAM_TIMESTEP
+            if ctime > duration:
+                break
 
-            t2, fp2, op2, ign2 = self.program[i+1]
+            fp, op, ign = self.program.sample(t0 + ctime)
+            self.actuator.submit(
+                partial(self.apply_state, ctime, start, fp, op, ign), PROGRAM
+            )
 
-            if ctime > t2:
-                i += 1
-                if i+1 == len(self.program):
-                    break
-                continue
+            if timer.wait(self.stop_event) is None:
+                break
 
-            t1, fp1, op1, ign1 = self.program[i]
+    def apply_control(self, ctime, start, fp, op, ign, target, value, sample_time):
+        # Executed on the actuation thread
+        self.pm.set_propellant_throttles(fp, op)
+        self.set_ignitor(ign)
 
-            if t2 == t1:
-                lerp = 1.
-            else:
-                lerp = (ctime - t1) / (t2 - t1)
+        now = timing.now()
+        age = None
+        if sample_time is not None:
+            age = now - sample_time
+            self.control_latency.record(age)
 
-            fp = fp1 + (fp2 - fp1) * lerp
-            op = op1 + (op2 - op1) * lerp
-            ign = ign1 + (ign2 - ign1) * lerp
+        self.record.append((ctime, now - start, fp, op, ign, target, value, age))
 
-            self.pm.fuel_valve.set_throttle(fp)
-            self.pm.oxidizer_valve.set_throttle(op)
+    def _run_closed_loop(self):
+        settings = self.control_settings
+        period = 1 / settings.rate
+        controller = ThrottleController(settings)
+        self.control_latency.reset()
 
-            if ign > 0.5:
-                if ign_off:
-                    self.pm.ignitor.fire()
-                    ign_off = False
-                    logger.warning("Ignitor activated.")
-            elif not ign_off:
-                self.pm.ignitor.safe()
-                ign_off = True
-                logger.warning("Ignitor safed.")
+        timer = timing.DeadlineTimer(period)
+        start = timer.start()
+        t0 = self.program.times[0]
+        duration = self.program.get_duration()
 
-            # Give other parts of the program time to run
-            time.sleep(0.01)
+        while self.running:
+            ctime = timer.ticks * period
+            if ctime > duration:
+                break
 
-        self.pm.close_propellant_valves()
-        self.pm.ignitor.safe()
+            fp, op, ign = self.program.sample(t0 + ctime)
+            target = self.program.sample_target(t0 + ctime)
 
-        self.running = False
+            value, sample_time = self.tap.get()
+            if sample_time is not None and timing.now() - sample_time > STALE_PERIODS * period:
+                # Only the feed-forward is used without recent samples
+                value = None
+
+            fp, op = controller.update(target, value, fp, op)
+            self.actuator.submit(partial(
+                self.apply_control, ctime, start, fp, op, ign, target, value,
+                sample_time if value is not None else None
+            ), PROGRAM)
+
+            if timer.wait(self.stop_event) is None:
+                break
+
+    def get_tracking_error(self):
+        """
+        RMS and maximum tracking error of the last closed-loop run, over the
+        commands with both a target and a measurement.
+        """
+        errors = np.array([
+            row[5] - row[6] for row in self.record
+            if len(row) > 5 and row[6] is not None and row[5] == row[5]
+        ])
+        if not len(errors):
+            return None, None
+        return float(np.sqrt(np.mean(errors**2))), float(np.abs(errors).max())
+
+    def _run_waveform(self):
+        fuel, oxidizer = self.pm.fuel_valve, self.pm.oxidizer_valve
+
+        times, fp, op, ign = self.program.dense_timeline(PERIOD_US * 1e-6)
+        chunks = build_chunks(
+            [fuel.port.value, oxidizer.port.value],
+            self.pm.ignitor.io_port, times,
+            [fuel.get_duty(fp), oxidizer.get_duty(op)], ign
+        )
+
+        player = WaveformPlayer(
+            self.pm.hw_intf.pi, [fuel.port.value, oxidizer.port.value]
+        )
+        timer = timing.DeadlineTimer(PROGRAM_TIMESTEP)
+
+        # An abort either sees the player (and halts it) or stopped us first
+        self.player = player
+        if self.stop_event.is_set():
+            self.player = None
+            return
+
+        # The waveform drives these pins, bypassing the interface
+        self.pm.hw_intf.forget(
+            fuel.port.value, oxidizer.port.value, self.pm.ignitor.io_port
+        )
+
+        try:
+            player.play(chunks)
+        except Exception as e:
+            # Nothing has been played yet, so it is safe to start over.
+            logger.error(f"Could not start the valve waveform ({e}), falling back to deadline scheduling.")
+            player.stop()
+            self.player = None
+            self.active_mode = DEADLINE
+            self._run_deadline()
+            return
+
+        start = timer.start()
+        ign_on = False
+
+        try:
+            while self.running and player.update():
+                # Valve states for telemetry, the hardware is driven by the
+                # waveform.
+                f, o, i = self.program.sample(times[0] + timing.now() - start)
+                fuel.set_state(f)
+                oxidizer.set_state(o)
+                if i != ign_on:
+                    logger.warning("Ignitor activated." if i else "Ignitor safed.")
+                    ign_on = i
+
+                if timer.wait(self.stop_event) is None:
+                    break
+        finally:
+            if player.halted:
+                # Aborted, let the safing commands go first
+                self.actuator.flush(timeout=1)
+            if player.queued or player.halted:
+                player.stop()
+            self.player = None
+
+        # Commanded chunk start vs when it was seen playing, both relative to
+        # the tick just before the first chunk was sent.
+        for chunk_time, tick in player.started:
+            f, o, i = self.program.sample(chunk_time)
+            self.record.append((
+                chunk_time - times[0],
+                ((tick - player.reference_tick) & 0xFFFFFFFF) * 1e-6, f, o, i
+            ))
+
+    def save_record(self, directory="Data"):
+        if not self.record:
+            return
+
+        lateness = LatencyHistogram(LATENESS_EDGES)
+        for commanded, actual, *_ in self.record:
+            lateness.record(max(actual - commanded, 0))
+        if self.active_mode == WAVEFORM:
+            logger.info(
+                f"Waveform chunk start seen: {lateness.format()} after "
+                f"commanded. Chunks are timed by DMA, this is only accurate "
+                f"to the {PROGRAM_TIMESTEP*1e3:g} ms polling period."
+            )
+        else:
+            logger.info(f"Valve command lateness: {lateness.format()} ({self.active_mode}).")
+        logger.info(f"Hardware commands: {self.pm.hw_intf.format_statistics()}.")
 
-        logger.warning("Valve program complete.")
+        header = WAVEFORM_RECORD_HEADER if self.active_mode == WAVEFORM else RECORD_HEADER
+        if self.active_mode == CLOSED_LOOP:
+            header += CONTROL_HEADER
+            rms, worst = self.get_tracking_error()
+            units = self.control_sensor.get_units()[0]
+            logger.info(
+                f"Closed-loop {self.control_sensor.get_name()}: sample to "
+                f"command {self.control_latency.format()}, tracking error "
+                + (f"RMS {rms:.4g} {units}, max {worst:.4g} {units}." if rms is not None
+                    else "not measured.")
+            )
 
-        if self.callback:
-            self.callback()
+        date = datetime.datetime.today().strftime('%Y %b %d %I.%M %p')
+        filename = f"{directory}/PROGRAM {date} {self.program.name}.csv"
+        try:
+            with open(filename, "w") as f:
+                f.write(header + "\n")
+                f.writelines([
+                    f"{c},{a},{fp},{op},{int(ign)}" + "".join([
+                        f",{'' if x is None else x}" for x in extra
+                    ]) + "\n"
+                    for c, a, fp, op, ign, *extra in self.record
+                ])
+        except OSError as e:
+            logger.error(f"Could not save the valve timing record: {e}")
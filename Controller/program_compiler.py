@@ -0,0 +1,214 @@
+""" Compiles engine test programs into dense timelines.
+
+A .prog file lists (time, fuel throttle, oxidizer throttle, ignitor) keyframes
+which are linearly interpolated. An optional fifth column holds the target of
+the closed-loop throttle controller (nan where it is not used). CompiledProgram holds the keyframes as NumPy
+arrays so the commanded state at any time is a searchsorted/np.interp lookup,
+and the whole trajectory can be sampled onto a regular grid at once (e.g. for
+the DMA waveforms).
+
+Programs are validated before they can be run, and can be simulated offline
+at any resolution into the same csv format as the data log, so the planned
+valve timeline can be overlaid on the recorded one.
+"""
+import os
+
+import numpy as np
+
+from zerolib.enums import SensorType
+
+# The ignitor is on while the interpolated ignitor value is above this
+IGNITOR_THRESHOLD = 0.5
+
+# Resolution of the timeline checked by validate
+VALIDATION_STEP = 1e-3
+# Longest time the ignitor should burn before propellant flows
+MAX_IGNITOR_LEAD = 3
+
+# Columns of the simulated timeline when no sensor configuration is given
+DEFAULT_COLUMNS = [
+    "Fuel Valve Throttle [dimensionless]",
+    "Oxidizer Valve Throttle [dimensionless]",
+    "Ignitor [dimensionless]"
+]
+
+
+class CompiledProgram:
+    """ Keyframes of a valve program as arrays.
+    """
+    def __init__(self, name, keyframes):
+        keyframes = np.asarray(keyframes, dtype=float)
+        if keyframes.ndim == 1:
+            keyframes = keyframes.reshape(1, -1)
+        if keyframes.shape[1] not in (4, 5):
+            raise ValueError(f"Expected 4 or 5 columns, got {keyframes.shape[1]}.")
+
+        self.name = name
+        self.times = keyframes[:, 0]
+        self.fuel = keyframes[:, 1]
+        self.oxidizer = keyframes[:, 2]
+        self.ignitor = keyframes[:, 3]
+        # Closed-loop target, if any
+        self.target = keyframes[:, 4] if keyframes.shape[1] == 5 else None
+
+    def is_closed_loop(self):
+        return self.target is not None and not np.isnan(self.target).all()
+
+    def sample_target(self, t):
+        # nan where there is no target
+        if self.target is None:
+            return None
+        return float(np.interp(t, self.times, self.target))
+
+    def get_duration(self):
+        return self.times[-1] - self.times[0] if len(self.times) else 0.
+
+    def sample(self, t):
+        """
+        Commanded (fuel, oxidizer, ignitor on) at time t in seconds.
+        """
+        i = int(np.searchsorted(self.times, t, side="right"))
+        if i == 0 or i == len(self.times):
+            i = min(max(i - 1, 0), len(self.times) - 1)
+            return float(self.fuel[i]), float(self.oxidizer[i]), \
+                bool(self.ignitor[i] > IGNITOR_THRESHOLD)
+
+        t1, t2 = self.times[i-1], self.times[i]
+        lerp = 1. if t2 == t1 else (t - t1) / (t2 - t1)
+
+        return (
+            float(self.fuel[i-1] + (self.fuel[i] - self.fuel[i-1]) * lerp),
+            float(self.oxidizer[i-1] + (self.oxidizer[i] - self.oxidizer[i-1]) * lerp),
+            bool(self.ignitor[i-1] + (self.ignitor[i] - self.ignitor[i-1]) * lerp
+                > IGNITOR_THRESHOLD)
+        )
+
+    def timeline(self, times):
+        """
+        Commanded fuel, oxidizer and ignitor arrays at every time in times.
+        """
+        times = np.asarray(times, dtype=float)
+        return (
+            np.interp(times, self.times, self.fuel),
+            np.interp(times, self.times, self.oxidizer),
+            np.interp(times, self.times, self.ignitor) > IGNITOR_THRESHOLD
+        )
+
+    def dense_timeline(self, step):
+        """
+        Sample the whole program every step seconds. Returns the times and the
+        fuel, oxidizer and ignitor arrays.
+        """
+        times = self.times[0] + np.arange(
+            int(np.floor(self.get_duration() / step)) + 1
+        ) * step
+        return (times, *self.timeline(times))
+
+    def validate(self):
+        """
+        Check the program invariants. Returns lists of errors (the program
+        must not be run) and warnings.
+        """
+        errors, warnings = [], []
+        keyframes = np.column_stack(
+            (self.times, self.fuel, self.oxidizer, self.ignitor)
+        )
+
+        if not len(self.times):
+            return ["The program is empty."], warnings
+
+        if self.target is not None:
+            negative = self.target < 0
+            if negative.any():
+                errors.append(f"Negative closed-loop target on rows {get_rows(negative)}.")
+
+        if not np.isfinite(keyframes).all():
+            errors.append(f"Non-finite values on rows {get_rows(~np.isfinite(keyframes).all(axis=1))}.")
+            return errors, warnings
+
+        if self.times[0] < 0:
+            errors.append("The program starts at a negative time.")
+
+        decreasing = np.diff(self.times) < 0
+        if decreasing.any():
+            errors.append(f"Time decreases on rows {get_rows(np.r_[False, decreasing])}.")
+
+        for name, throttle in (("Fuel", self.fuel), ("Oxidizer", self.oxidizer)):
+            out_of_range = (throttle < 0) | (throttle > 1)
+            if out_of_range.any():
+                errors.append(f"{name} throttle is outside 0 to 1 on rows {get_rows(out_of_range)}.")
+
+        if not np.isin(self.ignitor, (0, 1)).all():
+            warnings.append(f"Ignitor values other than 0 or 1 on rows {get_rows(~np.isin(self.ignitor, (0, 1)))}.")
+
+        if errors:
+            return errors, warnings
+
+        times, fuel, oxidizer, ignitor = self.dense_timeline(VALIDATION_STEP)
+        flow = (fuel > 0) | (oxidizer > 0)
+
+        if ignitor.any():
+            ignition = times[np.argmax(ignitor)]
+            if not flow.any():
+                warnings.append("The ignitor fires but no propellant valve opens.")
+            else:
+                opening = times[np.argmax(flow)]
+                if ignition > opening:
+                    errors.append(
+                        f"The ignitor fires {ignition - opening:.3f} s after the "
+                        f"propellant valves open (at {opening:.3f} s)."
+                    )
+                elif opening - ignition > MAX_IGNITOR_LEAD:
+                    warnings.append(
+                        f"The ignitor fires {opening - ignition:.3f} s before the "
+                        "propellant valves open."
+                    )
+            if ignitor[-1]:
+                warnings.append("The ignitor is still on at the end of the program (it will be safed).")
+
+        if flow[-1]:
+            warnings.append("The propellant valves are open at the end of the program (they will be closed).")
+
+        return errors, warnings
+
+    def simulate(self, resolution_ms):
+        """
+        The commanded timeline every resolution_ms milliseconds, with the time
+        relative to the start of the program.
+        """
+        times, fuel, oxidizer, ignitor = self.dense_timeline(resolution_ms * 1e-3)
+        return times - self.times[0], fuel, oxidizer, ignitor.astype(float)
+
+    def format_timeline(self, resolution_ms, columns=DEFAULT_COLUMNS):
+        """
+        The simulated timeline as csv text in the data log format.
+        """
+        timeline = np.column_stack(self.simulate(resolution_ms))
+        return "\n".join(["Time [s]," + ",".join(columns)] + [
+            ",".join(map(str, row)) for row in timeline.tolist()
+        ]) + "\n"
+
+
+def get_rows(mask):
+    # 1-based row numbers of a mask, as in the file
+    return ", ".join(str(i + 1) for i in np.flatnonzero(mask)[:10]) + \
+        ("..." if np.count_nonzero(mask) > 10 else "")
+
+def get_timeline_columns(sens_cfg):
+    """
+    Timeline column names matching the valve throttle sensors of the data log.
+    """
+    columns = list(DEFAULT_COLUMNS)
+    for i, sensor_type in enumerate(
+            (SensorType.FUEL_VALVE_THROTTLE, SensorType.OXIDIZER_VALVE_THROTTLE)):
+        sensors = sens_cfg.get_by_type(sensor_type)
+        if sensors:
+            columns[i] = f"{sensors[0].get_name()} [{sensors[0].get_units()[0]}]"
+    return columns
+
+
+def load_program(filename, name=None):
+    if name is None:
+        name = os.path.basename(filename).split(".prog")[0]
+    keyframes = np.loadtxt(filename, delimiter=",", ndmin=2)
+    return CompiledProgram(name, keyframes)
@@ -0,0 +1,135 @@
+""" Overload-adaptive sample rate control.
+
+When the sensor bus cannot keep up with the configured rates, the acquisition
+loop overruns and every sensor slips equally. The AdaptiveRateController watches
+the overrun fraction and instead decimates the least important sensors (by
+their configured Priority) until the loop fits in its budget again. Decimation
+is undone, most important sensors first, once the load drops.
+"""
+import logging
+
+logger = logging.getLogger(__name__)
+
+# Length of the overrun evaluation window in seconds
+WINDOW_SECONDS = 1
+
+# Overrun fraction within a window above which sensors are shed, and below
+# which shed sensors may be restored.
+SHED_THRESHOLD = 0.05
+RESTORE_THRESHOLD = 0.005
+
+# Consecutive quiet windows required before restoring a priority level. Keeps
+# the controller from oscillating between shedding and restoring.
+RESTORE_WINDOWS = 5
+
+# Maximum decimation factor applied to a priority level.
+MAX_DECIMATION = 8
+
+
+class AdaptiveRateController:
+    """ Adjusts the per-sensor iteration mods based on loop overruns.
+
+    The sensors with the highest priority in the configuration are never shed.
+    All other priority levels are decimated by doubling their mod, lowest
+    priority first.
+    """
+    def __init__(self, mods, loop_timestep, stats=None, callback=None):
+        # Mods are edited in place so the mainloop picks up changes directly.
+        self.mods = mods
+        self.base_mods = dict(mods)
+        self.loop_timestep = loop_timestep
+        self.stats = stats
+        # Called with (sensor, rate) when a sensor's effective rate changes
+        self.callback = callback
+
+        self.window_length = max(int(WINDOW_SECONDS / loop_timestep), 1)
+        self.iterations = 0
+        self.overruns = 0
+        self.quiet_windows = 0
+
+        priorities = sorted({sensor.get_priority() for sensor in mods})
+        # Critical sensors (the highest priority level) are never decimated.
+        self.sheddable = priorities[:-1]
+        self.decimation = {p : 1 for p in self.sheddable}
+
+    def update(self, elapsed):
+        """
+        Record one loop iteration taking elapsed seconds. Returns True if the
+        sensor mods were changed.
+        """
+        self.iterations += 1
+        if elapsed > self.loop_timestep:
+            self.overruns += 1
+
+        if self.iterations < self.window_length:
+            return False
+
+        fraction = self.overruns / self.iterations
+        self.iterations = self.overruns = 0
+
+        if fraction > SHED_THRESHOLD:
+            self.quiet_windows = 0
+            return self.shed(fraction)
+
+        if fraction < RESTORE_THRESHOLD:
+            self.quiet_windows += 1
+            if self.quiet_windows >= RESTORE_WINDOWS:
+                self.quiet_windows = 0
+                return self.restore()
+        else:
+            self.quiet_windows = 0
+
+        return False
+
+    def shed(self, fraction):
+        for priority in self.sheddable:
+            if self.decimation[priority] < MAX_DECIMATION:
+                self.decimation[priority] *= 2
+                self.apply(priority)
+                logger.warning(
+                    f"Acquisition loop overloaded ({fraction*100:.2g}% "
+                    f"overruns). Decimating priority {priority} sensors by "
+                    f"{self.decimation[priority]}x: {self.describe(priority)}."
+                )
+                return True
+
+        logger.error(
+            f"Acquisition loop overloaded ({fraction*100:.2g}% overruns) but "
+            "all non-critical sensors are already fully decimated!"
+        )
+        return False
+
+    def restore(self):
+        for priority in reversed(self.sheddable):
+            if self.decimation[priority] > 1:
+                self.decimation[priority] //= 2
+                self.apply(priority)
+                if self.decimation[priority] == 1:
+                    state = "restored to full rate"
+                else:
+                    state = f"now decimated by {self.decimation[priority]}x"
+
+                logger.warning(
+                    f"Acquisition load dropped. Priority {priority} sensors "
+                    f"{state}: {self.describe(priority)}."
+                )
+                return True
+
+        return False
+
+    def apply(self, priority):
+        for sensor, base_mod in self.base_mods.items():
+            if sensor.get_priority() == priority:
+                self.mods[sensor] = base_mod * self.decimation[priority]
+                rate = sensor.get_rate() / self.decimation[priority]
+
+                if self.stats:
+                    self.stats.set_target_rate(sensor, rate)
+                if self.callback:
+                    self.callback(sensor, rate)
+
+    def describe(self, priority):
+        return ", ".join(
+            sensor.get_name() for sensor in self.base_mods
+            if sensor.get_priority() == priority
+        )
@@ -0,0 +1,168 @@
+""" On-controller redline checks.
+
+Every raw sample of a sensor with a Redline configured is checked against its
+limits in the acquisition loop, before any averaging or network transfer. A
+rule trips once its limits have been violated for `persistence` consecutive
+samples, and its action (e.g. ABORT) is requested immediately on the sensor
+thread through the trigger callback. The reaction latency is measured from the
+violating sample being read to the action's hardware commands completing.
+
+Rate limits are evaluated over at least RATE_WINDOW seconds of samples, so a
+single glitched sample cannot produce a huge rate between two raw samples a
+few milliseconds apart.
+
+Tripped rules stay latched until rearm is called, so a sensor sitting beyond
+its limit does not repeat the action on every sample.
+"""
+import logging
+from collections import deque
+
+from instrumentation import LatencyHistogram, format_duration
+
+logger = logging.getLogger(__name__)
+
+# Bin edges for the reaction latency, from the violating sample being read to
+# the action completing.
+REACTION_EDGES = [
+    1e-4, 2e-4, 5e-4, 1e-3, 2e-3, 5e-3, 1e-2, 2e-2, 5e-2, 1e-1, 2e-1, 5e-1
+]
+
+# Shortest time span in seconds over which a rate of change is computed
+RATE_WINDOW = 0.02
+
+
+class RedlineRule:
+    """ Limits and violation state for a single sensor.
+    """
+    def __init__(self, sensor):
+        self.sensor = sensor
+        redline = sensor.get_redline()
+
+        self.minimum = redline.minimum
+        self.maximum = redline.maximum
+        self.rate = redline.rate
+        self.persistence = redline.persistence
+        self.action = redline.action
+
+        self.count = 0
+        self.tripped = False
+        # (timestamp, value) of the samples spanning the rate window
+        self.history = deque()
+
+    def get_rate(self, timestamp, value):
+        """
+        Rate of change from the newest sample at least RATE_WINDOW old, or
+        None until the samples span the window.
+        """
+        history = self.history
+        history.append((timestamp, value))
+        while len(history) > 2 and timestamp - history[1][0] >= RATE_WINDOW:
+            history.popleft()
+
+        start_time, start_value = history[0]
+        if timestamp - start_time < RATE_WINDOW:
+            return None
+        return (value - start_value) / (timestamp - start_time)
+
+    def check(self, timestamp, value):
+        """
+        Returns a description of the violation, or None if the sample is within
+        limits.
+        """
+        rate = None
+        if self.rate is not None:
+            rate = self.get_rate(timestamp, value)
+
+        if self.minimum is not None and value < self.minimum:
+            return f"{value:.4g} below {self.minimum:.4g}"
+        if self.maximum is not None and value > self.maximum:
+            return f"{value:.4g} above {self.maximum:.4g}"
+        if rate is not None and abs(rate) > self.rate:
+            return f"rate {rate:.4g}/s beyond {self.rate:.4g}/s"
+
+        return None
+
+    def update(self, timestamp, value):
+        """
+        Check a sample. Returns the violation if the rule trips on this sample.
+        """
+        violation = self.check(timestamp, value)
+        if violation is None:
+            self.count = 0
+            return None
+
+        self.count += 1
+        if self.tripped or self.count < self.persistence:
+            return None
+
+        self.tripped = True
+        return violation
+
+    def rearm(self):
+        self.count = 0
+        self.tripped = False
+
+
+class RedlineEngine:
+    """ Checks every sample of the redlined sensors.
+
+    trigger is called as trigger(action, sample_time, on_complete) on the
+    calling thread when a rule trips. It may return before the action is
+    executed, but must call on_complete with the time the hardware commands
+    completed (from any thread).
+    """
+    def __init__(self, sensors, trigger):
+        self.trigger = trigger
+        self.rules = {
+            sensor : RedlineRule(sensor)
+            for sensor in sensors if sensor.get_redline() is not None
+        }
+        self.latency = LatencyHistogram(REACTION_EDGES)
+        self.trips = 0
+
+        for rule in self.rules.values():
+            logger.info(
+                f"Redline on {rule.sensor.get_name()}: min {rule.minimum}, "
+                f"max {rule.maximum}, rate {rule.rate}/s, persistence "
+                f"{rule.persistence}, action {rule.action.name}."
+            )
+
+    def check(self, sensor, value, sample_time):
+        """
+        Check a new sample. sample_time is the timing.now() at which it was
+        read, used for rate limits and to measure the reaction latency.
+        """
+        rule = self.rules.get(sensor)
+        if rule is None:
+            return
+
+        violation = rule.update(sample_time, value)
+        if violation is None:
+            return
+
+        self.trips += 1
+        self.trigger(
+            rule.action, sample_time,
+            lambda completed: self.complete(rule, sample_time, completed)
+        )
+        logger.critical(
+            f"REDLINE {sensor.get_name()}: {violation}. Executing "
+            f"{rule.action.name}."
+        )
+
+    def complete(self, rule, sample_time, completed):
+        latency = completed - sample_time
+        self.latency.record(latency)
+
+        logger.critical(
+            f"REDLINE {rule.sensor.get_name()}: {rule.action.name} applied "
+            f"{format_duration(latency)} after the sample (reaction latency "
+            f"{self.latency.format()})."
+        )
+
+    def rearm(self):
+        for rule in self.rules.values():
+            rule.rearm()
+
+    def get_tripped(self):
+        return [rule.sensor for rule in self.rules.values() if rule.tripped]
@@ -1,7 +1,8 @@
 """ Interface to the sensor hardware.
 
-Adafruit drivers are used as much of the work has already been done. The only
-exception is the ADS1120 chip which did not have a driver available.
+Adafruit drivers are used as much of the work has already been done. The
+exceptions are the ADS1120 chip, which did not have a driver available, and the
+hot paths of the MAX31855 and NAU7802 reads, which are batched for speed.
 """
 import collections
 import logging
@@ -11,14 +12,17 @@ import board
 import adafruit_bitbangio as bitbangio
 
 from digitalio import DigitalInOut
-from adafruit_max31855 import MAX31855
 from adafruit_tca9548a import TCA9548A
 from cedargrove_nau7802 import NAU7802, ConversionRate
 
-from zerolib.ads1120 import ADS1120
+from zerolib.ads1120 import ADS1120, ADS1120Scanner
+from zerolib.nau7802 import NAU7802Reader
+from zerolib.max31855 import MAX31855Array
+from zerolib.spi import BusioTransport, SpidevTransport
 from zerolib.enums import SensorType
 
-from sensor_calib import apply_calibration
+from sensor_calib import compile_calibration
+from load_cells import LoadCellScheduler, CONVERSION_RATE
 
 logger = logging.getLogger(__name__)
 
@@ -33,6 +37,7 @@ TC_CS = [
 ]
 
 ADC_CS = board.D4 # ADC CS on GPIO 4
+ADC_DRDY = None # Set to the DRDY pin if connected, otherwise reads are timed
 # ADC Sensor Bindings
 ADC_CHANNELS = {
     SensorType.BATTERY_LEVEL : 2,
@@ -40,6 +45,15 @@ ADC_CHANNELS = {
     SensorType.TANK_PRESSURE : 1
 }
 
+# SPI transport used for the thermocouples and ADC, either "bitbang" or
+# "spidev". The spidev backend uses SPI0 (GPIO 9-11) with manual chip selects.
+SPI_BACKEND = "bitbang"
+
+# All thermocouples are read in one transaction whenever one of them is due and
+# the last batch is older than this. The MAX31855 itself only converts every
+# ~100 ms, so this does not lose any information.
+TC_BATCH_MAX_AGE = 0.02
+
 # Time in seconds between log propagation.
 LOG_TIMEOUT = 1
 
@@ -52,22 +66,37 @@ class SensorArray:
     def __init__(self, peripheral_manager):
         # Store a ref to the perf_mgr to read valve states
         self.perf_mgr = peripheral_manager
+        # Compiled calibration of each sensor, see compile_calibrations
+        self.calibrations = {}
 
-        # Using software SPI, hardware SPI appears to not work
-        self.spi = bitbangio.SPI(board.D11, MISO=board.D9, MOSI=board.D10)
+        # Software SPI by default, hardware SPI through spidev is optional
+        if SPI_BACKEND == "spidev":
+            self.spi = SpidevTransport(0, 0)
+        else:
+            self.spi = BusioTransport(
+                bitbangio.SPI(board.D11, MISO=board.D9, MOSI=board.D10)
+            )
         # Hardware I2C. Make sure to boost the Pi I2C freq to 400khz!
         self.i2c = board.I2C()
 
-        # Default MAX31855 baudrate is set to 100khz. Increase this to 2 MHz
-        self.TCs = [
-            MAX31855(self.spi, DigitalInOut(pin))
-            for pin in TC_CS
-        ]
+        # Thermocouples are read in batches at 2 MHz
+        self.TCs = MAX31855Array(
+            self.spi, [DigitalInOut(pin) for pin in TC_CS]
+        )
+        self.tc_readings = []
+        self.tc_time = 0
 
         # Using custom ADS1120 driver. Important to initialize after all of the
         # CS pins have been defined and TCs instantiated to prevent SPI collision.
-        self.ADC = ADS1120(self.spi, DigitalInOut(ADC_CS))
+        self.ADC = ADS1120(
+            self.spi, DigitalInOut(ADC_CS),
+            drdy = DigitalInOut(ADC_DRDY) if ADC_DRDY else None
+        )
         self.ADC.initialize()
+        # Reads the ADC channels in bursts, grouped to minimize mux switches
+        self.ADC_scanner = ADS1120Scanner(self.ADC, {})
+        # Newest scanned (timestamp, voltage) of each channel not yet returned
+        self.adc_samples = {}
 
         # TC9548A IC is used to multiplex the 4x NAU7802 load cells
         self.I2C_switch = TCA9548A(self.i2c)
@@ -80,6 +109,12 @@ class SensorArray:
             lc._c2_conv_rate = ConversionRate.RATE_80SPS
         [lc.enable(True) for lc in self.LCs]
 
+        # The drivers above only configure the chips. Readings go through the
+        # data-ready scheduler so each conversion is read exactly once.
+        self.load_cells = LoadCellScheduler([
+            NAU7802Reader(self.I2C_switch[i]) for i in range(4)
+        ])
+
         # Sensors are read frequently, so we need to throttle logs to prevent
         # flooding the console.
         self.last_log_time = collections.defaultdict(lambda: 0)
@@ -90,22 +125,18 @@ class SensorArray:
             reading = None
 
             match sensor.get_type():
-                case SensorType.CC_PRESSURE | SensorType.TANK_PRESSURE:
-                    reading = self.ADC.read(ADC_CHANNELS[sensor.get_type()])
-
-                case SensorType.BATTERY_LEVEL:
-                    reading = self.ADC.read(
-                        ADC_CHANNELS[sensor.get_type()] + (sensor.get_number()-1)
-                    )
+                case SensorType.CC_PRESSURE | SensorType.TANK_PRESSURE | \
+                        SensorType.BATTERY_LEVEL:
+                    reading = self.read_adc(self.get_adc_channel(sensor))
                 
                 case SensorType.LOAD_CELL:
-                    reading = self.LCs[sensor.get_number() - 1].read()
+                    reading = self.load_cells.read(sensor.get_number() - 1)
 
                 case SensorType.THRUST:
-                    reading = self.LCs[3].read()
+                    reading = self.load_cells.read(3)
 
                 case SensorType.THERMOCOUPLE:
-                    reading = self.TCs[sensor.get_number() - 1].temperature
+                    reading = self.read_thermocouple(sensor.get_number() - 1)
                 
                 case SensorType.OXIDIZER_VALVE_THROTTLE:
                     reading = self.perf_mgr.oxidizer_valve.get_state()
@@ -117,10 +148,99 @@ class SensorArray:
                     logger.error("Tried to read from a sensor that does not exist!")
                     return
 
-            return apply_calibration(sensor, reading)
+            if reading is None:
+                # No new conversion is available yet
+                return
+
+            return self.calibrations[sensor](reading)
         except Exception as e:
             self.log_error(sensor, e)
 
+    def read_adc(self, channel):
+        """
+        Newest sample of an ADC channel. Unless one was scanned within the
+        channel's sample period, every due channel is scanned, so the other ADC
+        sensors read in the same loop iteration find their samples waiting.
+        """
+        sample = self.adc_samples.pop(channel, None)
+        rate = self.ADC_scanner.rates.get(channel)
+        if sample is None or not rate or time.monotonic() - sample[0] > 1/rate:
+            # Only the newest sample of each channel is used
+            scan = self.ADC_scanner.scan(required=(channel,), burst=1)
+            for ch, burst in scan.items():
+                self.adc_samples[ch] = burst[-1]
+            sample = self.adc_samples.pop(channel, None)
+
+        if sample is None:
+            return None
+        return sample[1]
+
+    def read_thermocouple(self, n):
+        now = time.monotonic()
+        if now - self.tc_time > TC_BATCH_MAX_AGE:
+            self.tc_readings = self.TCs.read_all()
+            self.tc_time = now
+
+        reading = self.tc_readings[n]
+        if isinstance(reading, Exception):
+            raise reading
+        return reading
+
+    def get_adc_channel(self, sensor):
+        # Returns the ADC mux channel of a sensor, or None if not on the ADC.
+        match sensor.get_type():
+            case SensorType.CC_PRESSURE | SensorType.TANK_PRESSURE:
+                return ADC_CHANNELS[sensor.get_type()]
+            case SensorType.BATTERY_LEVEL:
+                return ADC_CHANNELS[sensor.get_type()] + (sensor.get_number()-1)
+
+        return None
+
+    def compile_calibrations(self, sensors):
+        # Resolve the calibration of each sensor once, rather than on every read.
+        for sensor in sensors:
+            self.calibrations[sensor] = compile_calibration(sensor).apply
+
+    def register_rates(self, sensors):
+        # Give the ADC scanner the rate of each of its channels.
+        for sensor in sensors:
+            channel = self.get_adc_channel(sensor)
+            if channel is not None:
+                self.ADC_scanner.rates[channel] = sensor.get_rate()
+
+    def set_rate(self, sensor, rate):
+        # The effective rate of a sensor changed (it was shed or restored).
+        channel = self.get_adc_channel(sensor)
+        if channel is not None:
+            self.ADC_scanner.rates[channel] = rate
+
+    def get_sample_rate(self, sensor, rate):
+        # Rate of new samples when the sensor is polled at rate. The load
+        # cells cannot produce samples faster than they convert.
+        if sensor.get_type() in (SensorType.LOAD_CELL, SensorType.THRUST):
+            return min(rate, CONVERSION_RATE)
+        return rate
+
+    def order_reads(self, sensors):
+        """
+        Order the sensors due in one loop iteration. ADC sensors are grouped
+        and ordered by the scanner to minimize mux switches. Other sensors go
+        first, in their original order.
+        """
+        adc_sensors = {}
+        other_sensors = []
+        for sensor in sensors:
+            channel = self.get_adc_channel(sensor)
+            if channel is None:
+                other_sensors.append(sensor)
+            else:
+                adc_sensors[channel] = sensor
+
+        return other_sensors + [
+            adc_sensors[channel]
+            for channel in self.ADC_scanner.order(adc_sensors)
+        ]
+
     def log_error(self, sensor, error):
         # Log a sensor reading failure, with timeout to prevent flooding.
         error_time = time.perf_counter()
@@ -1,28 +1,81 @@
 """ Handles the application of calibration data on sensors.
 
-The apply_calibration function is used to call the correct calibration function
-with the data provided in this file.
+Calibrations are compiled once per sensor with compile_calibration, which
+resolves the calibration data for the sensor's type and number into a
+Calibration object. Its apply method is called on every read, and apply_batch
+calibrates whole NumPy arrays (e.g. for post-processing).
 """
-import numpy as np
+import bisect
 
-from scipy.interpolate import interp1d
+import numpy as np
 
 from zerolib.enums import SensorType
 
 
-def linear_calibration(calib_data, rval):
-    return (rval - calib_data[0]) * calib_data[1]
-
-def fn_calibration(calib_fn, rval):
-    return calib_fn(rval)
-
+class Calibration:
+    """ Converts raw readings to the sensor's default units.
+    """
+    def apply(self, reading):
+        return reading
 
-CALIBRATION_FUNCTIONS = {
-    SensorType.LOAD_CELL : linear_calibration,
-    SensorType.THRUST : linear_calibration,
-    SensorType.CC_PRESSURE : linear_calibration,
-    SensorType.TANK_PRESSURE : linear_calibration,
-    SensorType.BATTERY_LEVEL : fn_calibration,
+    def apply_batch(self, readings):
+        return np.asarray(readings, dtype=float)
+
+
+class LinearCalibration(Calibration):
+    """ reading * gain + offset. Compiled from (zero, scale) calibration data,
+    i.e. (reading - zero) * scale.
+    """
+    def __init__(self, calib_data):
+        zero, scale = calib_data
+        self.gain = scale
+        self.offset = -zero * scale
+
+    def apply(self, reading):
+        return reading * self.gain + self.offset
+
+    def apply_batch(self, readings):
+        return np.asarray(readings, dtype=float) * self.gain + self.offset
+
+
+class TableCalibration(Calibration):
+    """ Piecewise linear interpolation of a lookup table. Readings outside the
+    table are clamped to its ends.
+    """
+    def __init__(self, calib_data):
+        x, y = calib_data
+        order = np.argsort(x, kind="stable")
+        self.x = np.asarray(x, dtype=float)[order]
+        self.y = np.asarray(y, dtype=float)[order]
+
+        # Plain lists and precomputed slopes are faster for single readings
+        self.x_list = self.x.tolist()
+        self.y_list = self.y.tolist()
+        self.slopes = [
+            (y1 - y0) / (x1 - x0) if x1 != x0 else 0
+            for x0, x1, y0, y1 in zip(
+                self.x_list, self.x_list[1:], self.y_list, self.y_list[1:]
+            )
+        ]
+
+    def apply(self, reading):
+        i = bisect.bisect_right(self.x_list, reading)
+        if i == 0:
+            return self.y_list[0]
+        if i == len(self.x_list):
+            return self.y_list[-1]
+        return self.y_list[i-1] + (reading - self.x_list[i-1]) * self.slopes[i-1]
+
+    def apply_batch(self, readings):
+        return np.interp(np.asarray(readings, dtype=float), self.x, self.y)
+
+
+CALIBRATION_TYPES = {
+    SensorType.LOAD_CELL : LinearCalibration,
+    SensorType.THRUST : LinearCalibration,
+    SensorType.CC_PRESSURE : LinearCalibration,
+    SensorType.TANK_PRESSURE : LinearCalibration,
+    SensorType.BATTERY_LEVEL : TableCalibration,
 }
 
 CALIBRATION_DATA = {
@@ -40,26 +93,25 @@ CALIBRATION_DATA = {
 
     # Interpolate from data at https://blog.ampow.com/lipo-voltage-chart/
     SensorType.BATTERY_LEVEL : {
-        1: interp1d(
-            x = np.array([
+        1: (
+            np.array([
                 0.0, 13.09, 14.43, 14.75, 14.83, 14.91, 14.99, 15.06, 15.14, 15.18,
-                16.26, 15.34, 15.42, 15.50, 15.66, 15.81, 15.93, 16.09, 16.33, 16.45,
+                15.26, 15.34, 15.42, 15.50, 15.66, 15.81, 15.93, 16.09, 16.33, 16.45,
                 16.6, 16.8, 20.0
             ]) / 4, # Hardware uses 4:1 voltage divider.
-            y = [0] + [x for x in range(0, 101, 5)] + [100],
-            kind = "linear"
+            [0] + [x for x in range(0, 101, 5)] + [100]
         ),
-        2: lambda x: x # TODO: Calibrate servo battery sensor.
+        2: None # TODO: Calibrate servo battery sensor.
     },
 
     # Thermocouples, valve sensors do not require calibration
 }
 
 
-def apply_calibration(sensor, reading):
+def compile_calibration(sensor):
     # Some sensors don't require calibration
-    if sensor.get_type() not in CALIBRATION_DATA.keys():
-        return reading
+    if sensor.get_type() not in CALIBRATION_DATA:
+        return Calibration()
 
     # If there are multiple sensors connected of the same type, get the
     # respective calibration data.
@@ -68,4 +120,7 @@ def apply_calibration(sensor, reading):
     else:
         cdata = CALIBRATION_DATA[sensor.get_type()]
 
-    return CALIBRATION_FUNCTIONS[sensor.get_type()](cdata, reading)
+    if cdata is None:
+        return Calibration()
+
+    return CALIBRATION_TYPES[sensor.get_type()](cdata)
@@ -1,7 +1,6 @@
 """ Main logic for reading the sensors.
 
 """
-import time
 import logging
 import numpy as np
 
@@ -11,25 +10,45 @@ from threading import Thread
 
 try:
     from sensor_array import SensorArray
-except (NotImplementedError, AttributeError):
+except (ImportError, NotImplementedError, AttributeError):
     logger.critical("Sensor driver import failed! This can be ignored if running in debug mode.")
 
 from zerolib.datalogging import DataLogger
+from zerolib.enums import STEP_SENSORS
+from zerolib.signal import design_decimation_filter, StreamingDecimator
+from zerolib.standard import TELEMETRY_RATE, SPECTRUM_RATE
 
-DATA_DELAY = 1/60 # Send data at a peak of 60 Hz
+from capture import CaptureBuffer
+from derived import DerivedSensorEngine
+from instrumentation import LoopStatistics
+from rate_control import AdaptiveRateController
+from redlines import RedlineEngine
+from spectral import SpectrumAnalyzer
+import timing
+
+DATA_DELAY = 1/TELEMETRY_RATE # Send data at a peak of 60 Hz
+SPECTRUM_DELAY = 1/SPECTRUM_RATE
 
 class SensorController:
     """ Class to continously sample the sensors at (roughly) the specified rates.
     """
-    def __init__(self, sensor_config, peripheral_manager):
+    def __init__(self, sensor_config, peripheral_manager, sensor_array=None):
         self.thread = None
         self.running = False
         self.data_callback = None
-        self.init_time = time.perf_counter()
+        self.spectrum_callback = None
+        self.redline_callback = None
+        self.capture_callback = None
+        # Receive samples of a sensor as soon as they are read
+        self.taps = {}
+        self.init_time = timing.now()
         
         self.p_mgr = peripheral_manager
         self.sens_cfg = sensor_config
-        self.array = SensorArray(peripheral_manager)
+        # The hardware array unless a simulated one is provided
+        if sensor_array is None:
+            sensor_array = SensorArray(peripheral_manager)
+        self.array = sensor_array
 
         self.physical_sensors = [
             sensor for sensor in sensor_config.get_sensors()
@@ -37,6 +56,19 @@ class SensorController:
         ]
         self.num_sensors = len(self.physical_sensors)
 
+        # Rate new samples arrive at for every logged sensor, which can be
+        # below the polling rate and is lowered when sensors are shed
+        self.rates = {
+            sensor : self.array.get_sample_rate(sensor, sensor.get_rate())
+            for sensor in self.physical_sensors
+        }
+
+        # Computed sensors, evaluated from the physical readings
+        self.derived = DerivedSensorEngine(sensor_config, self.rates)
+        self.derived_sensors = self.derived.get_sensors()
+        # Every sensor which is logged and transmitted
+        self.logged_sensors = self.physical_sensors + self.derived_sensors
+
         # Target time per loop iteration
         self.loop_timestep = None
         # Number of iterations per reading for each sensor
@@ -48,15 +80,95 @@ class SensorController:
         self.data_logger.add_row(
             "Time [s]," + ','.join([
                 f"{sensor.get_name()} [{sensor.get_units()[0]}]"
-                for sensor in self.physical_sensors
+                for sensor in self.logged_sensors
             ])
         )
 
         self.compute_delay_parameters()
+        self.array.register_rates(self.physical_sensors)
+        self.array.compile_calibrations(self.physical_sensors)
+
+        self.rates.update(self.derived.get_rates(self.rates))
+
+        # Anti-aliasing filters for sensors sampled faster than the telemetry
+        self.downlink_filters = {}
+        for sensor, rate in self.rates.items():
+            self.set_downlink_filter(sensor, rate)
+
+        # Spectra computed from every sample of the configured sensors
+        self.spectra = {
+            sensor : self.make_spectrum_analyzer(sensor)
+            for sensor in self.physical_sensors if sensor.has_spectrum()
+        }
+
+        # Safety limits checked on every raw sample
+        self.redlines = RedlineEngine(self.physical_sensors, self.trip_redline)
+
+        # Full rate captures around events
+        self.capture = CaptureBuffer(self.physical_sensors, self.complete_capture)
+
+        # Sample clock, scheduled against absolute deadlines
+        self.timer = timing.DeadlineTimer(self.loop_timestep)
+
+        # Read durations, overruns, achieved rates and timing error
+        self.stats = LoopStatistics(
+            self.physical_sensors, self.loop_timestep, timer=self.timer
+        )
+        for sensor in self.physical_sensors:
+            self.stats.set_target_rate(sensor, self.rates[sensor])
+
+        # Sheds low priority sensors when the loop cannot keep up. The target
+        # rates are updated by update_rate.
+        self.rate_control = AdaptiveRateController(
+            self.mods, self.loop_timestep, callback=self.update_rate
+        )
 
     def register_callback(self, fn):
         self.data_callback = fn
 
+    def register_spectrum_callback(self, fn):
+        self.spectrum_callback = fn
+
+    def register_redline_callback(self, fn):
+        self.redline_callback = fn
+
+    def register_capture_callback(self, fn):
+        self.capture_callback = fn
+
+    def register_sample_tap(self, sensor, tap):
+        """
+        tap.update(value, t) is called on the acquisition thread with every
+        sample of the sensor and the time it was read.
+        """
+        self.taps[sensor] = tap
+
+    def trigger_capture(self, reason):
+        # Thread-safe
+        self.capture.trigger(reason, timing.now() - self.init_time)
+
+    def complete_capture(self, capture):
+        if self.capture_callback:
+            self.capture_callback(capture)
+
+    def trip_redline(self, action, sample_time, on_complete):
+        if self.redline_callback:
+            self.redline_callback(action, sample_time, on_complete)
+        else:
+            logger.critical(f"Redline tripped but no callback is registered to {action}!")
+
+    def make_spectrum_analyzer(self, sensor):
+        # The frequency axis depends on the rate the sensor is sampled at
+        return SpectrumAnalyzer(
+            self.rates[sensor], sensor.get_spectrum_length(),
+            bands = sensor.get_spectrum_bands()
+        )
+
+    def send_spectra(self, timestamp):
+        for sensor, analyzer in self.spectra.items():
+            if analyzer.is_ready():
+                bin_width, powers = analyzer.get_compact()
+                self.spectrum_callback(timestamp, sensor, bin_width, powers)
+
     def compute_delay_parameters(self):
         hfreq = max([sensor.get_rate() for sensor in self.physical_sensors])
         
@@ -66,55 +178,145 @@ class SensorController:
             for sensor in self.physical_sensors
         }
 
+    def set_downlink_filter(self, sensor, rate):
+        """
+        Sensors sampled faster than the telemetry rate are low pass filtered
+        as they are read, and the latest filtered value is sent. The rest are
+        averaged over each telemetry period, except step sensors (commanded
+        states), whose latest reading is sent.
+        """
+        self.downlink_filters.pop(sensor, None)
+        if sensor.get_type() in STEP_SENSORS:
+            return
+
+        sos = design_decimation_filter(
+            rate, TELEMETRY_RATE, sensor.get_downlink_cutoff()
+        )
+        if sos is not None:
+            self.downlink_filters[sensor] = StreamingDecimator(sos)
+
+    def update_rate(self, sensor, rate):
+        """
+        Called by the rate controller when a sensor is shed or restored, with
+        its new polling rate. The downlink filters of the sensor, and of any
+        derived sensors computed from it, are redesigned for the new rate, and
+        its spectrum is restarted.
+        """
+        self.rates[sensor] = self.array.get_sample_rate(sensor, rate)
+        self.array.set_rate(sensor, rate)
+        self.stats.set_target_rate(sensor, self.rates[sensor])
+        if sensor in self.spectra:
+            self.spectra[sensor] = self.make_spectrum_analyzer(sensor)
+
+        physical_rates = {s : self.rates[s] for s in self.physical_sensors}
+        changed = {sensor}
+        for derived, derived_rate in self.derived.get_rates(physical_rates).items():
+            if derived_rate != self.rates[derived]:
+                self.rates[derived] = derived_rate
+                changed.add(derived)
+
+        for s in changed:
+            self.set_downlink_filter(s, self.rates[s])
+
+    def get_downlink_data(self, data_row):
+        data = []
+        for sensor, values in data_row.items():
+            if not values:
+                continue
+
+            if sensor in self.downlink_filters:
+                value = self.downlink_filters[sensor].get_value()
+            elif sensor.get_type() in STEP_SENSORS:
+                value = values[-1]
+            else:
+                value = np.mean(values)
+
+            data.append((sensor.get_id(), value))
+
+        return data
+
     def mainloop(self):
         i = 0
-        last_time = time.perf_counter()
+        last_time = self.timer.start()
 
-        data_row = {sensor:[] for sensor in self.physical_sensors}
-        next_cb_time = time.perf_counter() + DATA_DELAY
+        data_row = {sensor:[] for sensor in self.logged_sensors}
+        next_cb_time = timing.now() + DATA_DELAY
+        next_spectrum_time = timing.now() + SPECTRUM_DELAY
 
         while True:
             timestamp = last_time-self.init_time
-            row = f"{timestamp},"
-
-            j = 0
-            for sensor, mod in self.mods.items():
-                # Readings are staggered to reduce jitter
-                j += 1
-                if (i+j) % mod == 0:
-                    reading = self.array.read(sensor)
-                    
-                    if reading is None:
-                        # There was an error... Logs are sent to the monitor.
-                        row += "Ø,"
-                        continue
-
-                    data_row[sensor].append(reading)
-                    row += f"{reading},"
-                else:
-                    row += "Ø,"
-
-            if time.perf_counter() > next_cb_time:
-                # Average collected data
-                avg_data = [
-                    (sensor.get_id(), np.mean(values))
-                    for sensor, values in data_row.items()
-                    if values
-                ]
+
+            # Readings are staggered to reduce jitter
+            due = [
+                sensor for j, (sensor, mod) in enumerate(self.mods.items(), 1)
+                if (i+j) % mod == 0
+            ]
+
+            readings = {}
+            for sensor in self.array.order_reads(due):
+                read_start = timing.now()
+                reading = self.array.read(sensor)
+                read_end = timing.now()
+                self.stats.record_read(
+                    sensor, read_end - read_start, reading is not None
+                )
+
+                # None means no new data, or an error. Logs are sent to the
+                # monitor.
+                if reading is not None:
+                    self.redlines.check(sensor, reading, read_end)
+                    if sensor in self.taps:
+                        self.taps[sensor].update(reading, read_end)
+                    self.capture.add(sensor, timestamp, reading)
+                    readings[sensor] = reading
+
+            if readings:
+                derived = self.derived.update(timestamp, readings)
+                if self.taps:
+                    derive_end = timing.now()
+                    for sensor, reading in derived.items():
+                        if sensor in self.taps:
+                            self.taps[sensor].update(reading, derive_end)
+                readings.update(derived)
+
+            for sensor, reading in readings.items():
+                data_row[sensor].append(reading)
+
+                if sensor in self.downlink_filters:
+                    self.downlink_filters[sensor].update(reading)
+
+                if sensor in self.spectra:
+                    self.spectra[sensor].update(reading)
+
+            row = f"{timestamp}," + ",".join([
+                f"{readings[sensor]}" if sensor in readings else "Ø"
+                for sensor in self.logged_sensors
+            ])
+
+            if timing.now() > next_cb_time:
+                # Filtered or averaged data for sensors read this period
+                downlink_data = self.get_downlink_data(data_row)
                 # Pass it to the callback
-                self.data_callback(timestamp, avg_data)
+                self.data_callback(timestamp, downlink_data)
                 # Refresh the params
-                next_cb_time = time.perf_counter() + DATA_DELAY
-                data_row = {sensor:[] for sensor in self.physical_sensors}
+                next_cb_time = timing.now() + DATA_DELAY
+                data_row = {sensor:[] for sensor in self.logged_sensors}
 
-            self.data_logger.add_row(row[:-1])
+            if self.spectrum_callback and timing.now() > next_spectrum_time:
+                self.send_spectra(timestamp)
+                next_spectrum_time = timing.now() + SPECTRUM_DELAY
+
+            self.capture.tick(timestamp)
+
+            self.data_logger.add_row(row)
             i += 1
-            
-            sleep_time = self.loop_timestep - (time.perf_counter() - last_time)
-            if sleep_time > 0:
-                time.sleep(sleep_time)
 
-            last_time = time.perf_counter()
+            elapsed = timing.now() - last_time
+            self.stats.record_iteration(elapsed)
+            self.rate_control.update(elapsed)
+            self.stats.tick(last_time)
+
+            last_time = self.timer.wait()
 
     def start_collection(self):
         # Entry point.
@@ -53,18 +53,38 @@ class ServoBallValve:
         # return 0 for closed, 1 for open, and in between for throttled.
         return self.throttle_state
     
+    def get_duty(self, throttle):
+        # Works on arrays of throttles too.
+        return self.cracking_duty + (
+            self.open_duty - self.cracking_duty
+        ) * throttle
+
     def set_throttle(self, throttle):
         self.throttle_state = throttle
+        self.hw_itf.set_servo(
+            self.port, self.get_duty(throttle), hardware=self.hardware_pwm
+        )
 
-        x = self.cracking_duty + (
-            self.open_duty - self.cracking_duty
-        ) * throttle
-        self.hw_itf.set_servo(self.port, x, hardware=self.hardware_pwm)
+    def set_state(self, throttle):
+        # Record a throttle applied elsewhere (e.g. by a waveform)
+        self.throttle_state = throttle
+
+    def throttle_command(self, throttle):
+        # Record the throttle and return the command for set_servos
+        self.throttle_state = throttle
+        return (self.port, self.get_duty(throttle), self.hardware_pwm)
+
+    def close_command(self):
+        self.throttle_state = 0
+        return (self.port, self.closed_duty, self.hardware_pwm)
     
     def open(self):
         self.throttle_state = 1
         self.hw_itf.set_servo(self.port, self.open_duty, hardware=self.hardware_pwm)
 
     def close(self):
+        # Always sent, the output may have been changed outside the interface
         self.throttle_state = 0
-        self.hw_itf.set_servo(self.port, self.closed_duty, hardware=self.hardware_pwm)
\ No newline at end of file
+        self.hw_itf.set_servo(
+            self.port, self.closed_duty, hardware=self.hardware_pwm, force=True
+        )
\ No newline at end of file
@@ -0,0 +1,266 @@
+""" Simulated hardware for running the controller logic without the Pi.
+
+The simulated devices expose the same methods as the drivers they replace so
+they can be dropped into the sensor scheduling code directly.
+"""
+import math
+import random
+import time
+
+from collections import deque
+
+from zerolib.enums import SensorType, SENSOR_NOISE
+
+
+class SimulatedNAU7802:
+    """ Simulated NAU7802 with the NAU7802Reader interface.
+
+    Conversions complete every 1/rate seconds. Like the real chip, only the
+    latest conversion is held, so slow polling loses samples and fast polling
+    returns None until the next conversion is ready. signal_fn maps the
+    conversion time to raw ADC counts.
+    """
+    def __init__(self, rate=80, signal_fn=None, noise=50, clock=time.monotonic):
+        self.rate = rate
+        self.signal_fn = signal_fn or (lambda t: 0)
+        self.noise = noise
+        self.clock = clock
+
+        self.start_time = clock()
+        self.last_conversion = 0
+
+        # Read statistics, useful for checking scheduler behaviour
+        self.reads = 0
+        self.dropped = 0
+
+    def get_conversion_index(self):
+        return int((self.clock() - self.start_time) * self.rate)
+
+    def read_fresh(self):
+        conversion = self.get_conversion_index()
+        if conversion <= self.last_conversion:
+            return None
+
+        self.dropped += conversion - self.last_conversion - 1
+        self.last_conversion = conversion
+        self.reads += 1
+
+        t = self.start_time + conversion / self.rate
+        return int(self.signal_fn(t) + random.gauss(0, self.noise))
+
+
+class SimulatedPi:
+    """ Stand-in for pigpio.pi which records every command.
+
+    commands holds (time, method, args) tuples. command_delay adds a fixed
+    delay to every call, approximating the pigpio socket round trip.
+    """
+    def __init__(self, command_delay=0, clock=time.monotonic):
+        self.command_delay = command_delay
+        self.clock = clock
+        self.connected = True
+
+        self.commands = []
+        self.levels = {}
+        self.pulsewidths = {}
+
+        self.pending_pulses = []
+        self.waves = {}
+        self.wave_schedule = []
+        self.next_wave_id = 0
+
+    def record(self, method, *args):
+        if self.command_delay:
+            time.sleep(self.command_delay)
+        self.commands.append((self.clock(), method, args))
+        return 0
+
+    def set_mode(self, gpio, mode):
+        return self.record("set_mode", gpio, mode)
+
+    def write(self, gpio, level):
+        self.levels[gpio] = level
+        return self.record("write", gpio, level)
+
+    def read(self, gpio):
+        return self.levels.get(gpio, 0)
+
+    def hardware_PWM(self, gpio, frequency, dutycycle):
+        self.pulsewidths[gpio] = dutycycle / frequency if frequency else 0
+        return self.record("hardware_PWM", gpio, frequency, dutycycle)
+
+    def set_PWM_dutycycle(self, gpio, dutycycle):
+        return self.record("set_PWM_dutycycle", gpio, dutycycle)
+
+    def set_PWM_frequency(self, gpio, frequency):
+        return self.record("set_PWM_frequency", gpio, frequency)
+
+    def set_servo_pulsewidth(self, gpio, pulsewidth):
+        self.pulsewidths[gpio] = pulsewidth * 1e-6
+        return self.record("set_servo_pulsewidth", gpio, pulsewidth)
+
+    def stop(self):
+        self.connected = False
+        return self.record("stop")
+
+    ### WAVEFORMS
+    # Waves play back to back in simulated time. Only the durations matter.
+    def wave_clear(self):
+        self.pending_pulses = []
+        self.waves = {}
+        self.wave_schedule = []
+        self.next_wave_id = 0
+        return self.record("wave_clear")
+
+    def wave_add_generic(self, pulses):
+        self.pending_pulses.append(pulses)
+        return sum(len(p) for p in self.pending_pulses)
+
+    def wave_create(self):
+        # Merged trains last as long as the longest one
+        duration = max(
+            (sum(p.delay for p in pulses) for pulses in self.pending_pulses),
+            default=0
+        )
+        wave_id = self.next_wave_id
+        self.next_wave_id += 1
+        self.waves[wave_id] = (duration * 1e-6, self.pending_pulses)
+        self.pending_pulses = []
+        self.record("wave_create", wave_id)
+        return wave_id
+
+    def wave_send_using_mode(self, wave_id, mode):
+        now = self.clock()
+        duration = self.waves[wave_id][0]
+        if mode == 0 or not self.wave_tx_busy():
+            # One shot, replaces whatever is playing
+            self.wave_schedule = [(wave_id, now, now + duration)]
+        else:
+            start = self.wave_schedule[-1][2]
+            self.wave_schedule.append((wave_id, start, start + duration))
+        return self.record("wave_send_using_mode", wave_id, mode)
+
+    def wave_tx_at(self):
+        now = self.clock()
+        for wave_id, start, end in self.wave_schedule:
+            if start <= now < end:
+                return wave_id
+        return 9999
+
+    def wave_tx_busy(self):
+        return int(bool(self.wave_schedule) and self.clock() < self.wave_schedule[-1][2])
+
+    def wave_tx_stop(self):
+        self.wave_schedule = []
+        return self.record("wave_tx_stop")
+
+    def wave_delete(self, wave_id):
+        self.waves.pop(wave_id, None)
+        return self.record("wave_delete", wave_id)
+
+    def get_current_tick(self):
+        return int(self.clock() * 1e6) & 0xFFFFFFFF
+
+    def get_commands(self, method=None, gpio=None):
+        return [
+            (t, m, args) for t, m, args in self.commands
+            if (method is None or m == method)
+                and (gpio is None or (args and args[0] == gpio))
+        ]
+
+
+class SimulatedCombustionPlant:
+    """ First order model of the chamber pressure for closed-loop testing.
+
+    The pressure settles towards gain * (fuel + oxidizer) / 2, from the valve
+    throttles transport_delay seconds earlier, with time constant tau. Use it
+    as a signal of the SimulatedSensorArray.
+    """
+    def __init__(self, peripheral_manager, gain=250, tau=0.05, transport_delay=0.01):
+        self.perf_mgr = peripheral_manager
+        self.gain = gain
+        self.tau = tau
+        self.transport_delay = transport_delay
+
+        self.pressure = 0.
+        self.last_time = None
+        # (time, steady state pressure) of the throttles over the delay
+        self.history = deque()
+
+    def get_steady_state(self):
+        fuel = max(self.perf_mgr.fuel_valve.get_state(), 0)
+        oxidizer = max(self.perf_mgr.oxidizer_valve.get_state(), 0)
+        return self.gain * (fuel + oxidizer) / 2
+
+    def __call__(self, t):
+        self.history.append((t, self.get_steady_state()))
+        while len(self.history) > 1 and self.history[1][0] <= t - self.transport_delay:
+            self.history.popleft()
+
+        if self.last_time is not None:
+            decay = math.exp(-(t - self.last_time) / self.tau)
+            self.pressure += (self.history[0][1] - self.pressure) * (1 - decay)
+        self.last_time = t
+
+        return self.pressure
+
+
+# Steady readings of each simulated sensor type, in the default units. Types
+# not listed read 0.
+DEFAULT_SIGNALS = {
+    SensorType.THERMOCOUPLE : 20,
+    SensorType.BATTERY_LEVEL : 90
+}
+
+
+class SimulatedSensorArray:
+    """ Stand-in for SensorArray, returning calibrated readings.
+
+    Each sensor reads signal(t) plus Gaussian noise of the sensor type's
+    SENSOR_NOISE, where t is the time in seconds since the array was created.
+    Signals can be replaced with set_signal, e.g. to inject a fault. Valve
+    throttles are read from the peripheral manager, as on the real array.
+    """
+    def __init__(self, peripheral_manager, clock=time.monotonic):
+        self.perf_mgr = peripheral_manager
+        self.clock = clock
+        self.start_time = clock()
+        self.signals = {}
+
+    def set_signal(self, sensor, signal_fn):
+        self.signals[sensor] = signal_fn
+
+    def read(self, sensor):
+        match sensor.get_type():
+            case SensorType.OXIDIZER_VALVE_THROTTLE:
+                return self.perf_mgr.oxidizer_valve.get_state()
+            case SensorType.FUEL_VALVE_THROTTLE:
+                return self.perf_mgr.fuel_valve.get_state()
+
+        t = self.clock() - self.start_time
+        if sensor in self.signals:
+            value = self.signals[sensor](t)
+        else:
+            value = DEFAULT_SIGNALS.get(sensor.get_type(), 0)
+
+        return value + random.gauss(0, SENSOR_NOISE[sensor.get_type()])
+
+    def is_physical_sensor(self, sensor):
+        return sensor.get_rate() is not None
+
+    def register_rates(self, sensors):
+        pass
+
+    def set_rate(self, sensor, rate):
+        pass
+
+    def get_sample_rate(self, sensor, rate):
+        # Every read returns a new sample
+        return rate
+
+    def compile_calibrations(self, sensors):
+        # Readings are already in the default units
+        pass
+
+    def order_reads(self, sensors):
+        return sensors
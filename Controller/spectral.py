@@ -0,0 +1,139 @@
+""" Streaming spectral analysis.
+
+A SpectrumAnalyzer is fed every sample of a sensor at its full rate and keeps a
+Welch estimate of the power spectral density: the last segment_length samples
+are windowed and transformed every hop samples (50% overlap by default), and
+the periodograms of the last few segments are averaged.
+
+Samples are written to a doubled ring buffer (every sample is stored twice,
+segment_length apart) so the latest segment is always a contiguous view and
+no copy is needed to reorder it. The window, scaling and work buffer are
+allocated once, and scipy.fft caches the FFT plan for the segment length, so
+each transform does no setup work.
+"""
+from collections import deque
+
+import numpy as np
+
+from scipy import fft, signal
+
+DEFAULT_OVERLAP = 0.5
+# Number of periodograms averaged in the Welch estimate
+DEFAULT_AVERAGES = 8
+# Maximum number of bins sent to the monitor. Neighbouring bins are averaged
+# to fit.
+MAX_BINS = 64
+# Floor for converting powers to dB
+MIN_POWER = 1e-20
+
+
+class SpectrumAnalyzer:
+    """ Welch power spectral density estimate of a stream of samples.
+
+    bands is an optional list of (low, high) frequency bands in Hz. If given,
+    get_compact returns the power in each band instead of the spectrum.
+    """
+    def __init__(
+            self, sample_rate, segment_length, overlap=DEFAULT_OVERLAP,
+            averages=DEFAULT_AVERAGES, bands=None, max_bins=MAX_BINS):
+        self.sample_rate = sample_rate
+        self.n = segment_length
+        self.hop = max(int(segment_length * (1 - overlap)), 1)
+        self.bands = bands
+
+        self.buffer = np.zeros(2 * segment_length)
+        self.index = 0
+        self.count = 0
+        self.since_update = 0
+
+        # Density scaling matching scipy.signal.welch
+        self.window = signal.get_window("hann", segment_length)
+        self.scale = 1 / (sample_rate * np.sum(self.window**2))
+        self.work = np.empty(segment_length)
+
+        self.freqs = fft.rfftfreq(segment_length, 1 / sample_rate)
+        self.bin_width = self.freqs[1]
+        # One sided spectrum: double everything except DC (and Nyquist)
+        self.one_sided = np.full(len(self.freqs), 2.0)
+        self.one_sided[0] = 1
+        if segment_length % 2 == 0:
+            self.one_sided[-1] = 1
+
+        self.periodograms = deque(maxlen=averages)
+        self.psd_sum = np.zeros(len(self.freqs))
+        self.segments = 0
+
+        # Bin index ranges for the band powers
+        if bands:
+            self.band_slices = [
+                slice(*np.searchsorted(self.freqs, band)) for band in bands
+            ]
+
+        # Bins averaged together for the compact spectrum
+        self.group = max(int(np.ceil(len(self.freqs) / max_bins)), 1)
+
+    def update(self, x):
+        """
+        Add a sample. Computes a new periodogram every hop samples, once the
+        buffer is full. Returns True if the estimate was updated.
+        """
+        self.buffer[self.index] = x
+        self.buffer[self.index + self.n] = x
+        self.index = (self.index + 1) % self.n
+
+        self.count += 1
+        self.since_update += 1
+
+        if self.count >= self.n and self.since_update >= self.hop:
+            self.since_update = 0
+            self.process()
+            return True
+        return False
+
+    def process(self):
+        # Oldest to newest
+        segment = self.buffer[self.index:self.index + self.n]
+
+        np.subtract(segment, segment.mean(), out=self.work)
+        self.work *= self.window
+        spectrum = fft.rfft(self.work, overwrite_x=True)
+
+        psd = (spectrum.real**2 + spectrum.imag**2) * self.scale
+        psd *= self.one_sided
+
+        # Running sum over the averaged segments
+        if len(self.periodograms) == self.periodograms.maxlen:
+            self.psd_sum -= self.periodograms[0]
+        self.periodograms.append(psd)
+        self.psd_sum += psd
+        self.segments += 1
+
+    def is_ready(self):
+        return bool(self.periodograms)
+
+    def get_psd(self):
+        return self.freqs, self.psd_sum / len(self.periodograms)
+
+    def get_band_powers(self):
+        psd = self.psd_sum / len(self.periodograms)
+        return np.array([
+            np.sum(psd[s]) * self.bin_width for s in self.band_slices
+        ])
+
+    def get_compact(self):
+        """
+        Returns the bin width in Hz and the powers in dB to send to the
+        monitor. The bin width is 0 for band powers.
+        """
+        if self.bands:
+            return 0, to_db(self.get_band_powers())
+
+        _, psd = self.get_psd()
+        n = len(psd) // self.group * self.group
+        grouped = psd[:n].reshape(-1, self.group).mean(axis=1)
+
+        return self.bin_width * self.group, to_db(grouped)
+
+
+def to_db(powers):
+    return 10 * np.log10(np.maximum(powers, MIN_POWER))
@@ -0,0 +1,125 @@
+""" Closed-loop throttle control.
+
+A valve program with a fifth column (the target of the controlled sensor) is
+run closed-loop: the program throttles are used as the feed-forward, and a PID
+controller corrects them to track the target. The controlled sensor is read
+directly from the acquisition loop through a SampleTap, so the controller sees
+every raw (or derived) sample as soon as it is read, rather than the
+telemetry.
+
+The correction is added to both valves (TOTAL, e.g. to track the chamber
+pressure) or to the oxidizer and subtracted from the fuel (MIXTURE, e.g. to
+track a mixture ratio derived sensor). It is limited to MAX_CORRECTION so the
+throttles cannot stray far from the program.
+"""
+import logging
+
+from threading import Lock
+
+from zerolib.enums import SensorType
+
+logger = logging.getLogger(__name__)
+
+# How the correction is applied to the valves
+TOTAL = "total"
+MIXTURE = "mixture"
+
+# Largest correction added to the program throttles
+MAX_CORRECTION = 0.3
+
+# Samples older than this many control periods are not used
+STALE_PERIODS = 5
+
+
+class ControlSettings:
+    """ Settings of the closed-loop throttle controller.
+
+    Gains are in throttle per unit of the sensor's default units (per second
+    for ki, and times seconds for kd).
+    """
+    def __init__(self, sensor_type, kind=TOTAL, kp=0., ki=0., kd=0., rate=100,
+            max_correction=MAX_CORRECTION):
+        self.sensor_type = sensor_type
+        self.kind = kind
+        self.kp = kp
+        self.ki = ki
+        self.kd = kd
+        self.rate = rate
+        self.max_correction = max_correction
+
+# Chamber pressure tracking
+DEFAULT_SETTINGS = ControlSettings(
+    SensorType.CC_PRESSURE, TOTAL, kp=1.5e-3, ki=1e-2, kd=0., rate=100
+)
+
+
+class SampleTap:
+    """ Latest sample of a sensor, updated by the acquisition loop.
+    """
+    def __init__(self):
+        self.lock = Lock()
+        self.value = None
+        self.time = None
+        self.samples = 0
+
+    def update(self, value, t):
+        with self.lock:
+            self.value = value
+            self.time = t
+            self.samples += 1
+
+    def get(self):
+        # (value, time it was read)
+        with self.lock:
+            return self.value, self.time
+
+
+class ThrottleController:
+    """ PID correction of feed-forward throttles.
+
+    The derivative acts on the measurement, so target steps do not kick the
+    valves, and the integral stops while the correction is saturated.
+    """
+    def __init__(self, settings):
+        self.settings = settings
+        self.period = 1 / settings.rate
+        self.reset()
+
+    def reset(self):
+        self.integral = 0.
+        self.last_value = None
+
+    def get_correction(self, target, value):
+        s = self.settings
+        error = target - value
+
+        derivative = 0.
+        if self.last_value is not None:
+            derivative = -(value - self.last_value) / self.period
+        self.last_value = value
+
+        unclamped = s.kp * error + s.ki * (self.integral + error * self.period) \
+            + s.kd * derivative
+        correction = min(max(unclamped, -s.max_correction), s.max_correction)
+        if correction == unclamped:
+            self.integral += error * self.period
+
+        return correction
+
+    def update(self, target, value, fuel, oxidizer):
+        """
+        Corrected (fuel, oxidizer) throttles. Without a target or a fresh
+        sample (None or NaN), the feed-forward is returned unchanged and the
+        controller is reset.
+        """
+        if target is None or value is None or target != target:
+            self.reset()
+            return fuel, oxidizer
+
+        correction = self.get_correction(target, value)
+        if self.settings.kind == MIXTURE:
+            fuel, oxidizer = fuel - correction, oxidizer + correction
+        else:
+            fuel, oxidizer = fuel + correction, oxidizer + correction
+
+        return min(max(fuel, 0.), 1.), min(max(oxidizer, 0.), 1.)
@@ -0,0 +1,146 @@
+""" Absolute-deadline scheduling for periodic loops.
+
+Sleeping for "period - elapsed" after every iteration accumulates the sleep
+overshoot as drift. Instead, the DeadlineTimer computes every deadline from the
+start time and the tick index, so the loop stays phase-locked no matter how
+long it runs. Where libc exposes clock_nanosleep, the sleep itself is done
+against the absolute CLOCK_MONOTONIC deadline. An optional spin-wait phase
+covers the last few hundred microseconds to remove the remaining wake-up jitter.
+"""
+import ctypes
+import ctypes.util
+import logging
+import time
+
+from instrumentation import LatencyHistogram
+
+logger = logging.getLogger(__name__)
+
+CLOCK_MONOTONIC = 1
+TIMER_ABSTIME = 1
+EINTR = 4
+
+# Time in seconds before each deadline where we switch from sleeping to
+# spinning. Spinning holds the GIL, so keep this short.
+DEFAULT_SPIN_TIME = 100e-6
+
+# time.monotonic reads CLOCK_MONOTONIC on Linux, the same clock used by the
+# absolute sleeps below.
+now = time.monotonic
+
+
+class _Timespec(ctypes.Structure):
+    _fields_ = [("tv_sec", ctypes.c_long), ("tv_nsec", ctypes.c_long)]
+
+
+def _load_clock_nanosleep():
+    try:
+        libc = ctypes.CDLL(ctypes.util.find_library("c"), use_errno=True)
+        fn = libc.clock_nanosleep
+    except (OSError, AttributeError, TypeError):
+        return None
+
+    fn.argtypes = [
+        ctypes.c_int, ctypes.c_int,
+        ctypes.POINTER(_Timespec), ctypes.POINTER(_Timespec)
+    ]
+    fn.restype = ctypes.c_int
+    return fn
+
+_clock_nanosleep = _load_clock_nanosleep()
+
+
+def sleep_until(deadline):
+    """
+    Sleep until the monotonic clock reaches deadline. Uses an absolute
+    clock_nanosleep when available (ctypes releases the GIL for the call),
+    otherwise falls back to a relative time.sleep.
+    """
+    if _clock_nanosleep is not None:
+        sec = int(deadline)
+        ts = _Timespec(sec, int((deadline - sec) * 1e9))
+
+        # Absolute sleeps can simply be restarted if interrupted by a signal.
+        while _clock_nanosleep(
+                CLOCK_MONOTONIC, TIMER_ABSTIME, ctypes.byref(ts), None
+            ) == EINTR:
+            pass
+        return
+
+    remaining = deadline - now()
+    if remaining > 0:
+        time.sleep(remaining)
+
+
+class DeadlineTimer:
+    """ Periodic timer scheduled against absolute deadlines.
+
+    Deadline k is start_time + k * period. If the loop overruns by more than a
+    full period, the missed deadlines are skipped (and counted) rather than
+    executed back to back, which keeps the schedule phase-locked to the start
+    time.
+    """
+    def __init__(self, period, spin_time=DEFAULT_SPIN_TIME):
+        self.period = period
+        self.spin_time = spin_time
+
+        self.start_time = None
+        self.ticks = 0
+
+        # Wake-up error relative to the deadline, and skipped deadlines
+        self.lateness = LatencyHistogram()
+        self.skipped = 0
+
+    def start(self, start_time=None):
+        self.start_time = now() if start_time is None else start_time
+        self.ticks = 0
+        return self.start_time
+
+    def get_deadline(self, tick=None):
+        tick = self.ticks + 1 if tick is None else tick
+        return self.start_time + tick * self.period
+
+    def wait(self, event=None):
+        """
+        Block until the next deadline and return the time at which we woke.
+        If an event is given, the sleep is done on the event instead and None
+        is returned as soon as it is set.
+        """
+        deadline = self.get_deadline()
+        current = now()
+
+        if current < deadline:
+            if event is not None:
+                if event.wait(max(deadline - current - self.spin_time, 0)):
+                    return None
+            elif deadline - current > self.spin_time:
+                sleep_until(deadline - self.spin_time)
+
+            current = now()
+            while current < deadline:
+                current = now()
+
+            self.ticks += 1
+        else:
+            # Late. Skip ahead to the most recent deadline that has passed.
+            tick = int((current - self.start_time) / self.period)
+            self.skipped += tick - self.ticks - 1
+            self.ticks = tick
+            deadline = self.get_deadline(tick)
+
+        self.lateness.record(current - deadline)
+        return current
+
+    def reset_statistics(self):
+        self.lateness.reset()
+        self.skipped = 0
+
+    def format(self):
+        return (
+            f"wake error {self.lateness.format()}, {self.skipped} skipped "
+            f"deadlines ({get_sleep_method()})"
+        )
+
+
+def get_sleep_method():
+    return "clock_nanosleep" if _clock_nanosleep else "time.sleep"
@@ -0,0 +1,213 @@
+""" DMA-timed valve programs using pigpio waveforms.
+
+The servo pulses (and the ignitor level) for the whole program are generated
+from a dense timeline, one servo period at a time, and cut into chunks of
+CHUNK_PERIODS periods. pigpio times each chunk with DMA, so the valve timing
+does not depend on Python scheduling. Only a couple of chunks exist on the
+pigpio daemon at once: each new chunk is queued with WAVE_MODE_ONE_SHOT_SYNC
+so it starts exactly when the previous one ends, and finished chunks are
+deleted to free the DMA control blocks.
+"""
+import logging
+from collections import namedtuple
+from threading import Lock
+
+import numpy as np
+
+from interface import GPIO_LOCK, OUTPUT, SERVO_PWM_FREQ
+
+try:
+    from pigpio import pulse, WAVE_MODE_ONE_SHOT, WAVE_MODE_ONE_SHOT_SYNC
+except ImportError:
+    pulse = namedtuple("pulse", ["gpio_on", "gpio_off", "delay"])
+    WAVE_MODE_ONE_SHOT = 0
+    WAVE_MODE_ONE_SHOT_SYNC = 2
+
+logger = logging.getLogger(__name__)
+
+# Servo period in microseconds
+PERIOD_US = round(1e6 / SERVO_PWM_FREQ)
+# Servo periods per waveform chunk (~1 s). Each period has two pulses per servo
+# and one for the ignitor.
+CHUNK_PERIODS = SERVO_PWM_FREQ
+# Servo pulse width in microseconds for a duty of 1
+MAX_PULSE_US = 2500
+
+
+def servo_pulses(pin, duties):
+    """
+    Pulses for one servo, one period per duty.
+    """
+    widths = np.clip(np.rint(np.asarray(duties) * MAX_PULSE_US), 1, PERIOD_US - 1)
+    mask = 1 << pin
+
+    pulses = []
+    for width in widths.astype(int).tolist():
+        pulses.append(pulse(mask, 0, width))
+        pulses.append(pulse(0, mask, PERIOD_US - width))
+    return pulses
+
+def level_pulses(pin, levels):
+    """
+    Pulses holding a pin at the given level for each period.
+    """
+    mask = 1 << pin
+    return [
+        pulse(mask, 0, PERIOD_US) if level else pulse(0, mask, PERIOD_US)
+        for level in levels
+    ]
+
+
+class WaveformChunk:
+    """ Pulses for CHUNK_PERIODS servo periods of a program.
+    """
+    def __init__(self, start_time, pulse_trains):
+        self.start_time = start_time
+        self.pulse_trains = pulse_trains
+        self.wave_id = None
+
+
+def build_chunks(servo_pins, ignitor_pin, times, duties, ignitor):
+    """
+    duties holds the duty array of each servo pin, and ignitor the ignitor
+    level, sampled at times (one servo period apart).
+    """
+    chunks = []
+    for i in range(0, len(times), CHUNK_PERIODS):
+        s = slice(i, i + CHUNK_PERIODS)
+        trains = [servo_pulses(pin, d[s]) for pin, d in zip(servo_pins, duties)]
+        trains.append(level_pulses(ignitor_pin, ignitor[s]))
+        chunks.append(WaveformChunk(times[i], trains))
+    return chunks
+
+
+class WaveformPlayer:
+    """ Streams waveform chunks to the pigpio daemon.
+
+    play returns immediately after queueing the first chunks, update must be
+    called periodically (at least once per chunk) to queue the rest.
+    """
+    def __init__(self, pi, pins):
+        self.pi = pi
+        self.pins = pins
+
+        self.chunks = []
+        self.index = 0
+        self.queued = []
+        # pigpio tick just before the first chunk was sent
+        self.reference_tick = None
+        # (chunk start time, pigpio tick when the chunk was seen playing). The
+        # first chunk is seen when it has been sent, the rest when polled by
+        # update, so they are only accurate to the polling period.
+        self.started = []
+        # Set by halt, after which nothing more is sent. The lock only orders
+        # halt against send, so halt never waits behind a whole update.
+        self.halted = False
+        self.halt_lock = Lock()
+
+    def prepare(self):
+        with GPIO_LOCK:
+            # Hardware PWM must be released for the waveform to drive the pins
+            for pin in self.pins:
+                self.pi.hardware_PWM(pin, 0, 0)
+                self.pi.set_mode(pin, OUTPUT)
+            self.pi.wave_clear()
+
+    def create(self, chunk):
+        # Only this thread builds waves, so the lock is taken per call and
+        # other commands (e.g. an abort) are not held up by a whole chunk.
+        for train in chunk.pulse_trains:
+            # Pulses added separately are merged by time
+            with GPIO_LOCK:
+                self.pi.wave_add_generic(train)
+        with GPIO_LOCK:
+            chunk.wave_id = self.pi.wave_create()
+
+    def send(self, chunk, sync=True):
+        with self.halt_lock:
+            if self.halted:
+                return
+            with GPIO_LOCK:
+                if not sync:
+                    self.reference_tick = self.pi.get_current_tick()
+                self.pi.wave_send_using_mode(
+                    chunk.wave_id,
+                    WAVE_MODE_ONE_SHOT_SYNC if sync else WAVE_MODE_ONE_SHOT
+                )
+                if not sync:
+                    # A one shot wave starts as soon as it is sent
+                    self.started.append((chunk.start_time, self.pi.get_current_tick()))
+        self.queued.append(chunk)
+
+    def play(self, chunks):
+        self.chunks = chunks
+        self.index = 0
+        self.queued = []
+        self.reference_tick = None
+        self.started = []
+
+        self.prepare()
+        for sync in (False, True):
+            if self.index < len(self.chunks):
+                chunk = self.chunks[self.index]
+                self.create(chunk)
+                self.send(chunk, sync=sync)
+                self.index += 1
+
+    def update(self):
+        """
+        Queue the next chunk once the last queued one has started, and delete
+        finished chunks. Returns False once everything has been played.
+        """
+        if self.halted:
+            return False
+
+        with GPIO_LOCK:
+            current = self.pi.wave_tx_at()
+            busy = self.pi.wave_tx_busy()
+            tick = self.pi.get_current_tick()
+
+        # Chunks before the playing one are finished
+        ids = [chunk.wave_id for chunk in self.queued]
+        if not busy:
+            finished = len(ids)
+        elif current in ids:
+            finished = ids.index(current)
+        else:
+            finished = 0
+
+        for chunk in self.queued[:finished]:
+            with GPIO_LOCK:
+                self.pi.wave_delete(chunk.wave_id)
+        self.queued = self.queued[finished:]
+
+        if self.queued and (
+                not self.started or self.started[-1][0] != self.queued[0].start_time):
+            self.started.append((self.queued[0].start_time, tick))
+
+        if len(self.queued) < 2 and self.index < len(self.chunks):
+            chunk = self.chunks[self.index]
+            self.create(chunk)
+            self.send(chunk)
+            self.index += 1
+
+        return busy or self.index < len(self.chunks)
+
+    def halt(self):
+        """
+        Stop the transmission immediately. Safe to call from another thread,
+        stop must still be called to free the waves.
+        """
+        with self.halt_lock:
+            self.halted = True
+            # pigpio commands are atomic, the GPIO lock is not needed
+            self.pi.wave_tx_stop()
+
+    def stop(self):
+        with GPIO_LOCK:
+            self.pi.wave_tx_stop()
+        for chunk in self.queued:
+            with GPIO_LOCK:
+                self.pi.wave_delete(chunk.wave_id)
+        self.queued = []
+        self.index = len(self.chunks)
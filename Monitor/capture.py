@@ -0,0 +1,82 @@
+""" Receives event captures from the controller.
+
+Captures arrive in chunks (CaptureDataMessage) over the reliable link. Once
+every chunk of a capture has been received, the last chunk arrives, or the next
+capture starts, it is written to a csv file in the Captures directory. Files are
+written on a separate thread, so the message receiver is never held up. Chunks
+can still be lost if the connection drops; gaps in the chunk numbers are
+reported.
+"""
+import os
+import logging
+import datetime
+
+from threading import Thread
+
+logger = logging.getLogger(__name__)
+
+CAPTURE_DIRECTORY = "Captures"
+
+class CaptureReceiver:
+    def __init__(self, sensor_config, directory=CAPTURE_DIRECTORY):
+        self.sens_cfg = sensor_config
+        self.directory = directory
+
+        # (controller session, capture ID) of the capture being received
+        self.key = None
+        self.reason = None
+        self.num_chunks = 0
+        self.next_chunk = 0
+        self.chunks = {}
+
+    def add_chunk(self, msg):
+        key = (msg.session, msg.capture_id)
+        if key != self.key:
+            if self.chunks:
+                self.save()
+            self.key = key
+            self.reason = msg.reason
+            self.num_chunks = msg.num_chunks
+            self.next_chunk = 0
+            self.chunks = {}
+            logger.info(f"Receiving capture of {msg.reason}...")
+
+        # Chunks are sent in order
+        if msg.chunk > self.next_chunk:
+            logger.warning(
+                f"Capture of {self.reason}: chunks {self.next_chunk} to "
+                f"{msg.chunk - 1} were lost!"
+            )
+        self.next_chunk = max(self.next_chunk, msg.chunk + 1)
+        self.chunks[msg.chunk] = msg.data
+
+        if len(self.chunks) == self.num_chunks or msg.chunk == self.num_chunks - 1:
+            self.save()
+
+    def save(self):
+        # The chunks are handed to the writer thread
+        Thread(
+            target=self.write,
+            args=(self.key[1], self.reason, self.num_chunks, self.chunks),
+            daemon=True, name="CaptureWriterThread"
+        ).start()
+        self.chunks = {}
+
+    def write(self, capture_id, reason, num_chunks, chunks):
+        missing = num_chunks - len(chunks)
+        if missing:
+            logger.warning(f"Capture of {reason} is missing {missing} of {num_chunks} chunks!")
+
+        os.makedirs(self.directory, exist_ok=True)
+        date = datetime.datetime.today().strftime('%Y %b %d %I.%M.%S %p')
+        filename = f"{self.directory}/CAPTURE {date} {reason} ({capture_id}).csv"
+
+        with open(filename, "w") as f:
+            f.write("Time [s],Sensor,Reading\n")
+            for i in sorted(chunks):
+                f.write("".join([
+                    f"{t},{self.sens_cfg.get(s_id=s_id).get_name()},{val}\n"
+                    for s_id, t, val in chunks[i]
+                ]))
+
+        logger.info(f"Saved capture of {reason} to {filename}.")
@@ -3,12 +3,15 @@ import sys
 sys.path.append('../')
 
 import os
+import time
 import signal
+from argparse import ArgumentParser
 import dearpygui.dearpygui as dpg
 from pint import UnitRegistry
 
 from sensorgrid import SensorGrid
 from plotarray import PlotArray
+from plot import SpectrumPlot
 from menu import Menu
 from action_dispatcher import ActionDispatcher, ACTION_BUTTONS
 from message_handler import MessageHandler
@@ -22,6 +25,15 @@ from zerolib.message import EngineProgramSettingsMessage
 import logging
 logging.basicConfig(**logging_config)
 
+### ARGUMENT PARSING
+parser = ArgumentParser(prog="Zero Monitor")
+parser.add_argument(
+    "--history",
+    default = None,
+    help = "Directory where data older than the plot windows is kept. If unspecified, it is discarded."
+)
+args = parser.parse_args()
+
 ### SETUP
 units = UnitRegistry()
 
@@ -47,6 +59,11 @@ tab_labels = [
     "Tertiary Sensors"
 ]
 plt_arrs = []
+spectrum_plots = {}
+spectrum_tab = None
+spectrum_sensors = [
+    sensor for sensor in sens_cfg.get_sensors() if sensor.has_spectrum()
+]
 
 with dpg.window() as w:
     bg_window = w
@@ -57,10 +74,16 @@ with dpg.window() as w:
                 with dpg.tab(label=tab_labels[i]) as tab:
                     plt_arrs.append(
                         PlotArray(
-                            dpg, tab, units, sn_grid.get_grid(i)
+                            dpg, tab, units, sn_grid.get_grid(i), args.history
                         )
                     )
 
+            if spectrum_sensors:
+                with dpg.tab(label="Spectrum") as tab:
+                    spectrum_tab = tab
+                    for sensor in spectrum_sensors:
+                        spectrum_plots[sensor.get_id()] = SpectrumPlot(dpg, sensor)
+
     menu = Menu(dpg, bg_window, small_font=small_font,
         indicators = [
             "Connection"
@@ -82,8 +105,9 @@ dispatcher = ActionDispatcher(server, port=DEFAULT_CONTROLLER_PORT)
 for button in ACTION_BUTTONS:
     menu.set_button_callback(button, dispatcher.get_callback(button))
 
-msg_handler = MessageHandler(units, sens_cfg, menu, plt_arrs)
+msg_handler = MessageHandler(sens_cfg, menu, plt_arrs, spectrum_plots)
 server.register_request_hook(msg_handler.handle)
+menu.set_ingest_buffer(msg_handler.staged)
 
 menu_indicator_cb = menu.get_indicator_callback("Connection")
 def connection_hook(status):
@@ -108,12 +132,26 @@ dpg.maximize_viewport()
 dpg.set_exit_callback(server.stop)
 
 ### RENDER LOOP
+last_frame = time.perf_counter()
 while dpg.is_dearpygui_running():
     dpg.render_dearpygui_frame()
 
-    [arr.update_plot_ranges() for arr in plt_arrs]
+    # Apply the data received since the last frame, then update only the
+    # plots in the selected tab
+    now = time.perf_counter()
+    msg_handler.process()
+    active_tab = dpg.get_value(tb)
+    updated = sum(
+        arr.update_plot_ranges(now) for arr in plt_arrs if arr.master == active_tab
+    )
+    if active_tab == spectrum_tab:
+        [plot.update() for plot in spectrum_plots.values()]
+    update_time = time.perf_counter() - now
 
     menu.tick()
+    menu.record_frame(now - last_frame, update_time, updated)
+    last_frame = now
 
 ### TEARDOWN
+[arr.close() for arr in plt_arrs]
 os.kill(os.getpid(), signal.SIGTERM)
\ No newline at end of file
@@ -1,8 +1,12 @@
+import time
 import logging
+from functools import partial
 from logging import Handler, LogRecord, Formatter
 
 from zerolib.standard import formatter_config
 
+from staging import StagingBuffer
+
 logger = logging.getLogger(__name__)
 
 class LogHandler(Handler):
@@ -31,6 +35,50 @@ class Indicator:
         self.dpg.configure_item(self.indicator, fill=GREEN if status else RED)
 
 
+# Period over which frame times are averaged, in seconds
+FRAME_REPORT_PERIOD = 1
+
+class FrameCounter:
+    """ Frame time, and the time spent updating plots, averaged over
+    FRAME_REPORT_PERIOD.
+    """
+    def __init__(self, dpg):
+        self.dpg = dpg
+        self.text = dpg.add_text("Frame -")
+        # Staging buffer of the received data, if set
+        self.ingest = None
+        self.reset(time.perf_counter())
+
+    def reset(self, now):
+        self.start = now
+        self.frames = 0
+        self.frame_time = 0.
+        self.worst = 0.
+        self.update_time = 0.
+        self.updated = 0
+
+    def record(self, frame_time, update_time, updated):
+        self.frames += 1
+        self.frame_time += frame_time
+        self.worst = max(self.worst, frame_time)
+        self.update_time += update_time
+        self.updated += updated
+
+        now = time.perf_counter()
+        if now - self.start >= FRAME_REPORT_PERIOD:
+            text = (
+                f"Frame {self.frame_time/self.frames*1e3:.1f} ms"
+                f" (max {self.worst*1e3:.1f} ms)\n"
+                f"Plots {self.update_time/self.frames*1e3:.2f} ms,"
+                f" {self.updated/self.frames:.1f} redrawn"
+            )
+            if self.ingest:
+                drained, depth = self.ingest.get_statistics()
+                text += f"\nIngest {drained:.1f} msgs/frame, max queued {depth}"
+            self.dpg.set_value(self.text, text)
+            self.reset(now)
+
+
 class Button:
     def __init__(self, dpg, label):
         self.callback = None
@@ -80,10 +128,14 @@ class Menu:
         self.indicators = {}
         self.buttons = {}
         self.program_dropdown = None
+        self.frame_counter = None
         self.tank_heating_callback = None
         
         self.pause_scroll = False
 
+        # GUI updates from other threads, applied by tick
+        self.staged = StagingBuffer()
+
         with dpg.group(label="Control Panel", parent=master, height=200) as window:
             self.window = window
 
@@ -111,11 +163,15 @@ class Menu:
                     for button in buttons:
                         self.buttons[button] = Button(dpg, button)
 
+                    self.frame_counter = FrameCounter(dpg)
+
     def freeze(self, _, val):
         self.pause_scroll = val
 
     def get_indicator_callback(self, indicator):
-        return self.indicators[indicator].set
+        # May be called from any thread
+        indicator = self.indicators[indicator]
+        return lambda status: self.staged.put(partial(indicator.set, status))
     
     def set_button_callback(self, button, fn):
         self.buttons[button].register_callback(fn)
@@ -124,6 +180,10 @@ class Menu:
         self.program_dropdown.register_callback(fn)
 
     def add_log(self, item):
+        # May be called from any thread
+        self.staged.put(partial(self.create_log_row, item))
+
+    def create_log_row(self, item):
         color = None
 
         ltext = item.lower()
@@ -140,7 +200,14 @@ class Menu:
             self.dpg.add_text(item, color=color)
     
     def set_programs(self, program_list):
-        self.program_dropdown.set_programs(program_list)
+        # May be called from any thread
+        self.staged.put(partial(self.program_dropdown.set_programs, program_list))
+
+    def set_ingest_buffer(self, buffer):
+        self.frame_counter.ingest = buffer
+
+    def record_frame(self, frame_time, update_time, updated):
+        self.frame_counter.record(frame_time, update_time, updated)
 
     def get_log_handler(self):
         handler = LogHandler()
@@ -150,5 +217,7 @@ class Menu:
         return handler
 
     def tick(self):
+        [update() for update in self.staged.drain()]
+
         if not self.pause_scroll:
             self.dpg.set_y_scroll(self.logger_box, self.dpg.get_y_scroll_max(self.logger_box))
\ No newline at end of file
@@ -1,45 +1,64 @@
 """ Processor for incoming sensor data.
 
+Messages are received on the server's receiving thread, and staged for the
+render loop, which applies them to the plots once per frame.
 """
 import time
 
-from zerolib.enums import SensorType, MessageType, SENSOR_UNITS
+import numpy as np
+
+from zerolib.enums import MessageType
+
+from capture import CaptureReceiver
+from staging import StagingBuffer
 
 class MessageHandler:
     """ Handles incoming messages from the controller.
     
     """
-    def __init__(self, units, sensor_config, menu, plot_arrays):
-        self.units = units
+    def __init__(self, sensor_config, menu, plot_arrays, spectrum_plots=None):
         self.sens_cfg = sensor_config
         self.menu = menu
         self.plt_arrs = plot_arrays
+        self.spectrum_plots = spectrum_plots if spectrum_plots is not None else {}
+        self.captures = CaptureReceiver(sensor_config)
+
+        # Plot array of each sensor
+        self.sensor_arrays = {
+            sensor.get_id() : plot_arrays[sensor.get_tab()]
+            for sensor in sensor_config.get_sensors()
+        }
 
-        self.tank_mass_sensor = sensor_config.get_by_type(SensorType.TANK_MASS)[0]
+        # Sensor data and spectra for the render loop
+        self.staged = StagingBuffer()
 
         self.start_time = time.perf_counter()
         self.offset = 0
 
     def handle_sensor_data(self, msg):
-        load_cell_data = 0
-
-        for dp in msg.data:
-            id, val = dp
-            sensor = self.sens_cfg.get(s_id=id)
-
-            val = self.units.Quantity(val, SENSOR_UNITS[sensor.get_type()][0])
-            plt_arr = self.plt_arrs[sensor.get_tab()]
-            plt_arr.add_datapoint(id, (msg.timestamp + self.offset, val))
+        # Values are in the default units, the plots convert them when drawn
+        self.staged.put((MessageType.SENSOR_DATA, (msg.timestamp + self.offset, msg.data)))
 
-            if sensor.get_type() == SensorType.LOAD_CELL:
-                load_cell_data += val
+    def process(self):
+        """
+        Apply the staged messages, called by the render loop once per frame.
+        The samples of each sensor are appended to its plot at once.
+        """
+        samples = {}
+        for msg_type, payload in self.staged.drain():
+            match msg_type:
+                case MessageType.SENSOR_DATA:
+                    t, data = payload
+                    for id, val in data:
+                        if id not in samples:
+                            samples[id] = ([], [])
+                        samples[id][0].append(t)
+                        samples[id][1].append(val)
+                case MessageType.SPECTRUM:
+                    self.spectrum_plots[payload.sensor_id].add_spectrum(payload)
 
-        if load_cell_data != 0:
-            plt_arr = self.plt_arrs[self.tank_mass_sensor.get_tab()]
-            plt_arr.add_datapoint(
-                self.tank_mass_sensor.get_id(),
-                (msg.timestamp + self.offset, load_cell_data)
-            )
+        for id, (x, y) in samples.items():
+            self.sensor_arrays[id].add_datapoints(id, np.array(x), np.array(y))
 
     def update_offset(self):
         self.offset = time.perf_counter() - self.start_time
@@ -48,6 +67,11 @@ class MessageHandler:
         match msg.get_type():
             case MessageType.SENSOR_DATA:
                 self.handle_sensor_data(msg)
+            case MessageType.SPECTRUM:
+                if msg.sensor_id in self.spectrum_plots:
+                    self.staged.put((MessageType.SPECTRUM, msg))
+            case MessageType.CAPTURE_DATA:
+                self.captures.add_chunk(msg)
             case MessageType.NOTIFICATION:
                 self.menu.add_log(f"{msg.notification} (CONTROLLER)")
             case MessageType.ENGINE_PROGRAM_SETTINGS:
@@ -1,10 +1,76 @@
 import numpy as np
-import bisect
+
+from zerolib.standard import SPECTRUM_RATE, TELEMETRY_RATE
+
+from ringbuffer import RingSeries, SlidingExtrema, SpillStore
+from unit_conversion import compile_transforms
+
+# Selectable plot windows in seconds
+WINDOWS = [5, 10, 20, 60, 120, 240]
+# Extra points kept beyond the longest window, for rate jitter
+WINDOW_MARGIN = 1.1
+
+# Buckets per horizontal pixel when decimating. Each bucket is drawn as its
+# min and max.
+BUCKETS_PER_PIXEL = 1
+# Plot width used before the plot has been drawn
+DEFAULT_PLOT_WIDTH = 600
+
+def get_capacity(sensor):
+    """
+    Points needed to fill the longest window at the rate the sensor is
+    received (at most the telemetry rate).
+    """
+    rate = sensor.get_rate()
+    rate = TELEMETRY_RATE if rate is None else min(rate, TELEMETRY_RATE)
+    return int(max(WINDOWS) * rate * WINDOW_MARGIN) + 1
+
+def get_redraw_period(sensor):
+    """
+    Shortest time between redraws of a plot, so slow sensors are not redrawn
+    every frame when nothing has changed.
+    """
+    rate = sensor.get_rate()
+    rate = TELEMETRY_RATE if rate is None else min(rate, TELEMETRY_RATE)
+    return 1 / rate
+
+def decimate_minmax(x, y, first_index, buckets):
+    """
+    Reduce a series to the min and max (in order) of about buckets equal
+    count buckets, so spikes stay visible however many points there are.
+    Buckets are aligned to absolute indices (first_index is the index of x[0])
+    so they do not shift as the window scrolls. The points of partial buckets
+    at either end are kept as they are.
+    """
+    n = len(x)
+    if n <= 2 * buckets:
+        return x, y
+
+    size = -(-n // buckets)
+    head = -first_index % size
+    count = (n - head) // size
+    if count == 0:
+        return x, y
+    end = head + count * size
+
+    blocks = y[head:end].reshape(count, size)
+    indices = np.sort(np.column_stack((
+        blocks.argmin(axis=1), blocks.argmax(axis=1)
+    )), axis=1) + (head + size * np.arange(count))[:, None]
+
+    indices = np.concatenate((
+        np.arange(head), indices.ravel(), np.arange(end, n)
+    ))
+    return x[indices], y[indices]
 
 class Plot:
-    def __init__(self, dpg, units, sensor):
+    """ Time series plot of a sensor.
+
+    Data is stored in the sensor's default units, and converted to the
+    selected units when drawn.
+    """
+    def __init__(self, dpg, units, sensor, history=None):
         self.dpg = dpg
-        self.u = units
 
         self.retain = 10
 
@@ -12,8 +78,33 @@ class Plot:
         self.id = sensor.get_id()
 
         self.data_range = np.array(sensor.get_range())
-        self.xdata = []
-        self.ydata = []
+
+        # Data older than the longest window is written to the history
+        # directory if given, otherwise discarded.
+        self.spill_store = None
+        spill = None
+        if history:
+            self.spill_store = SpillStore(f"{history}/{self.desc}.bin")
+            spill = self.spill_data
+        self.data = RingSeries(get_capacity(sensor), spill)
+
+        # Decimated visible window, and what it was computed from
+        self.decimated = None
+        self.decimation_key = None
+
+        # Extremes of the scrolling window for auto range. Nothing older than
+        # the longest window is needed.
+        self.extrema = SlidingExtrema(horizon=max(WINDOWS))
+        self.extrema_valid = False
+
+        # Axis limits last set, None when automatic
+        self.x_limits = None
+        self.y_limits = None
+
+        # Set when there is new data or a setting changed
+        self.dirty = True
+        self.redraw_period = get_redraw_period(sensor)
+        self.last_update = -np.inf
 
         self.fixed_range = True
         self.paused = False
@@ -22,7 +113,7 @@ class Plot:
         self.y_axis = None
 
         self.available_units = sensor.get_units()
-        self.y_units = self.u(self.available_units[0])
+        self.transforms = compile_transforms(units, self.available_units)
         self.update_units(None, self.available_units[0])
 
         # create GUI
@@ -33,7 +124,7 @@ class Plot:
                 self.plot = plot
                 self.x_axis = dpg.add_plot_axis(dpg.mvXAxis, label="Time (s)")
                 self.y_axis = dpg.add_plot_axis(dpg.mvYAxis, label=self.y_label)
-                self.series = dpg.add_line_series(self.xdata, self.ydata, parent=self.y_axis)
+                self.series = dpg.add_line_series([], [], parent=self.y_axis)
             
             with dpg.group(horizontal=True):
                 if len(self.available_units) > 1:
@@ -47,7 +138,7 @@ class Plot:
                     dpg.add_text("Window")
                 
                 dpg.add_combo(
-                    items = [5, 10, 20, 60, 120, 240],
+                    items = WINDOWS,
                     callback = self.update_x_window, default_value=10, width=45
                 )
 
@@ -61,20 +152,20 @@ class Plot:
     
     def update_x_window(self, _, xwin):
         self.retain = int(xwin)
+        self.invalidate()
     
     def get_xlim_idx(self, xlim):
         xmin, xmax = xlim
 
-        return bisect.bisect_right(self.xdata, xmin), bisect.bisect_left(self.xdata, xmax)
+        return self.data.get_window_indices(xmin, xmax)
     
     def update_units(self, _, new_units):
-        new_units = self.u(new_units)
-    
-        self.data_range = self.u.Quantity(self.data_range, self.y_units ).to(new_units).m
-        self.ydata = list(self.u.Quantity(np.array(self.ydata), self.y_units).to(new_units).m)
+        # Only the transform applied when drawing changes
+        self.transform = self.transforms[new_units]
+        self.decimation_key = None
+        self.invalidate()
 
-        self.y_units = new_units
-        u_label = f"{new_units.units:~P}"
+        u_label = self.transform.label
         if u_label != "":
             self.y_label = f"{self.desc} [{u_label}]"
         else:
@@ -83,57 +174,265 @@ class Plot:
         if self.y_axis:
             self.dpg.set_item_label(self.y_axis, self.y_label)
     
+    def set_x_limits(self, limits):
+        # Axis limits are only sent to DearPyGui when they change
+        if limits == self.x_limits:
+            return
+        self.x_limits = limits
+        if limits is None:
+            self.dpg.set_axis_limits_auto(self.x_axis)
+        else:
+            self.dpg.set_axis_limits(self.x_axis, *limits)
+
+    def set_y_limits(self, limits):
+        if limits == self.y_limits:
+            return
+        self.y_limits = limits
+        if limits is None:
+            self.dpg.set_axis_limits_auto(self.y_axis)
+        else:
+            self.dpg.set_axis_limits(self.y_axis, *limits)
+
+    def get_extrema(self):
+        """
+        (min, max) of the visible data. While scrolling, the window start
+        only moves forward, so the incremental extrema are used.
+        """
+        start = self.data.last_x() - self.retain
+        if not self.extrema_valid or start < self.extrema.start:
+            self.extrema.rebuild(start, self.data.get_x(), self.data.get_y())
+            self.extrema_valid = True
+        # Advanced even while paused, so old candidates are discarded
+        extrema = self.extrema.get(start)
+
+        if self.paused:
+            # The decimated window keeps the extremes
+            visible = self.decimated[1]
+            return (visible.min(), visible.max()) if len(visible) else None
+        return extrema
+
+    def invalidate(self):
+        # Redraw on the next update regardless of the redraw period
+        self.dirty = True
+        self.last_update = -np.inf
+
+    def update(self, now):
+        """
+        Redraw the plot if there is new data (at most once per redraw period)
+        or a setting changed. Paused plots are redrawn every call, since the
+        view can be moved. Returns True if redrawn.
+        """
+        if not self.paused:
+            if not self.dirty or now - self.last_update < self.redraw_period:
+                return False
+
+        self.dirty = False
+        self.last_update = now
+        self.update_range()
+        return True
+
     def update_range(self):
-        if not self.y_axis or not self.x_axis or not self.xdata or not self.ydata:
+        if not self.y_axis or not self.x_axis or not len(self.data):
             return
 
         li, ri = self.get_xlim_idx(self.dpg.get_axis_limits(self.x_axis))
+        changed = self.decimate(li, ri)
 
+        data_range = self.transform.apply_range(*self.data_range)
         if self.fixed_range:
-            padding = abs(self.data_range[1]) * 0.025
-            self.dpg.set_axis_limits(
-                self.y_axis,
-                self.data_range[0] - padding,
-                self.data_range[1] + padding
-            )
+            padding = abs(data_range[1]) * 0.025
+            self.set_y_limits((
+                data_range[0] - padding,
+                data_range[1] + padding
+            ))
         else:
-            ymin = min(self.ydata[li:ri])
-            ymax = max(self.ydata[li:ri])
+            extrema = self.get_extrema()
+            if extrema is not None:
+                ymin, ymax = self.transform.apply_range(*extrema)
 
-            padding = 0.01 * max(abs(ymin), abs(ymax))
-            if padding == 0:
-                padding = abs(self.data_range[1]) * 0.025
+                padding = 0.01 * max(abs(ymin), abs(ymax))
+                if padding == 0:
+                    padding = abs(data_range[1]) * 0.025
 
-            self.dpg.set_axis_limits(self.y_axis, ymin-padding, ymax+padding)
+                self.set_y_limits((ymin-padding, ymax+padding))
 
-        self.update_series(li, ri)
+        if changed:
+            self.update_series()
 
         if self.paused:
-            self.dpg.set_axis_limits_auto(self.x_axis)
+            self.set_x_limits(None)
         else:
-            if len(self.xdata) > 1:
-                latest_x = self.xdata[-1]
-                self.dpg.set_axis_limits(
-                    self.x_axis,
-                    max(latest_x-self.retain, self.xdata[0]),
+            if len(self.data) > 1:
+                latest_x = self.data.last_x()
+                self.set_x_limits((
+                    max(latest_x-self.retain, self.data.first_x()),
                     latest_x
-                )
+                ))
         
     def toggle_fixed(self, _, val):
         self.fixed_range = not val
+        self.invalidate()
         if val:
-            self.dpg.set_axis_limits_auto(self.y_axis)
+            self.set_y_limits(None)
 
     def pause(self, _, val):
         self.paused = val
+        self.invalidate()
 
         if not self.paused:
             self.update_range()
 
     def add_datapoint(self, dp):
+        # (time, value in the default units)
         x, y = dp
-        self.xdata.append(x)
-        self.ydata.append(y.to(self.y_units).m)
+        self.data.append(x, y)
+        self.extrema.append(x, y)
+        self.dirty = True
+
+    def add_datapoints(self, x, y):
+        # Arrays of times and values in the default units
+        self.data.extend(x, y)
+        self.extrema.extend(x, y)
+        self.dirty = True
+
+    def spill_data(self, x, y):
+        # History is kept in the default units
+        self.spill_store.write(x, y)
+
+    def close(self):
+        # The points still in the ring complete the history
+        if self.spill_store:
+            self.data.flush()
+            self.spill_store.close()
+            self.spill_store = None
+            self.data.spill = None
+
+    def get_plot_width(self):
+        width = self.dpg.get_item_rect_size(self.plot)[0]
+        return width if width > 0 else DEFAULT_PLOT_WIDTH
+
+    def decimate(self, li, ri):
+        """
+        Decimate the visible window to the plot width. The result is cached
+        until new data arrives, the window moves or the plot is resized.
+        Returns True if it changed.
+        """
+        buckets = int(self.get_plot_width() * BUCKETS_PER_PIXEL)
+        key = (self.data.total, li, ri, buckets)
+        if key == self.decimation_key:
+            return False
+
+        self.decimation_key = key
+        self.decimated = decimate_minmax(
+            self.data.get_x()[li:ri], self.data.get_y()[li:ri],
+            self.data.first_index() + li, buckets
+        )
+        return True
+
+    def update_series(self):
+        x, y = self.decimated
+        self.dpg.set_value(self.series, [x, self.transform.apply(y)])
+
+# Number of spectra shown in the waterfall
+WATERFALL_LENGTH = 60
+# Dynamic range of the waterfall colormap in dB
+WATERFALL_RANGE = 60
+
+class SpectrumPlot:
+    """ Latest spectrum and a waterfall of recent spectra for a sensor.
+
+    If the sensor has spectrum bands configured, the band powers are shown
+    instead of the full spectrum.
+    """
+    def __init__(self, dpg, sensor):
+        self.dpg = dpg
+
+        self.desc = sensor.get_name()
+        self.id = sensor.get_id()
+        self.bands = sensor.get_spectrum_bands()
+
+        # Allocated on the first spectrum, since the number of bins is chosen
+        # by the controller.
+        self.x = None
+        self.history = None
+        self.period = 1 / SPECTRUM_RATE
+        self.dirty = False
+
+        x_label = "Band (Hz)" if self.bands else "Frequency (Hz)"
+
+        with dpg.group(label=self.desc) as window:
+            self.window = window
+
+            with dpg.plot(label=self.desc, anti_aliased=True, width=-1, height=270):
+                self.x_axis = dpg.add_plot_axis(dpg.mvXAxis, label=x_label)
+                self.y_axis = dpg.add_plot_axis(dpg.mvYAxis, label="Power (dB)")
+                if self.bands:
+                    self.series = dpg.add_bar_series([], [], weight=0.8, parent=self.y_axis)
+                    dpg.set_axis_ticks(self.x_axis, tuple(
+                        (f"{lo:g}-{hi:g}", i) for i, (lo, hi) in enumerate(self.bands)
+                    ))
+                else:
+                    self.series = dpg.add_line_series([], [], parent=self.y_axis)
+
+            with dpg.group(horizontal=True):
+                with dpg.plot(anti_aliased=True, width=-60, height=270) as plot:
+                    self.w_x_axis = dpg.add_plot_axis(dpg.mvXAxis, label=x_label)
+                    self.w_y_axis = dpg.add_plot_axis(dpg.mvYAxis, label="Time (s)")
+                    self.waterfall = dpg.add_heat_series(
+                        [0], 1, 1, format="", parent=self.w_y_axis
+                    )
+                dpg.bind_colormap(plot, dpg.mvPlotColormap_Viridis)
+
+                self.scale = dpg.add_colormap_scale(
+                    colormap=dpg.mvPlotColormap_Viridis, height=270
+                )
+
+    def allocate(self, bin_width, num_bins):
+        if self.bands:
+            self.x = np.arange(num_bins, dtype=float)
+            x_min, x_max = -0.5, num_bins - 0.5
+        else:
+            self.x = (np.arange(num_bins) + 0.5) * bin_width
+            x_min, x_max = 0, num_bins * bin_width
+
+        self.history = np.full((WATERFALL_LENGTH, num_bins), np.nan)
+
+        # The first row is drawn at the top, so the newest spectrum goes there.
+        self.dpg.configure_item(
+            self.waterfall, rows=WATERFALL_LENGTH, cols=num_bins,
+            bounds_min=(x_min, -WATERFALL_LENGTH * self.period),
+            bounds_max=(x_max, 0)
+        )
+        self.dpg.set_axis_limits(self.x_axis, x_min, x_max)
+        self.dpg.set_axis_limits(self.w_x_axis, x_min, x_max)
+        self.dpg.set_axis_limits(self.w_y_axis, -WATERFALL_LENGTH * self.period, 0)
+
+    def add_spectrum(self, msg):
+        if self.history is None or self.history.shape[1] != len(msg.powers):
+            self.allocate(msg.bin_width, len(msg.powers))
+
+        self.history = np.roll(self.history, 1, axis=0)
+        self.history[0] = msg.powers
+        self.dirty = True
+
+    def update(self):
+        if not self.dirty:
+            return
+        self.dirty = False
+
+        latest = self.history[0]
+        self.dpg.set_value(self.series, [self.x.tolist(), latest.tolist()])
+
+        scale_max = np.nanmax(self.history)
+        scale_min = scale_max - WATERFALL_RANGE
+        # Rows which have not been filled yet are drawn at the bottom of the scale
+        values = np.nan_to_num(self.history, nan=scale_min)
 
-    def update_series(self, li, ri):
-        self.dpg.set_value(self.series, [self.xdata[li:ri], self.ydata[li:ri]])
\ No newline at end of file
+        self.dpg.set_value(self.waterfall, [values.ravel().tolist()])
+        self.dpg.configure_item(
+            self.waterfall, scale_min=scale_min, scale_max=scale_max
+        )
+        self.dpg.configure_item(
+            self.scale, min_scale=scale_min, max_scale=scale_max
+        )
+        self.dpg.set_axis_limits(self.y_axis, scale_min, scale_max + 5)
@@ -2,7 +2,7 @@ from plot import Plot
 
 
 class PlotArray:
-    def __init__(self, dpg, master, units, sensors):
+    def __init__(self, dpg, master, units, sensors, history=None):
         self.dpg = dpg
         self.master = master
         self.units = units
@@ -20,12 +20,24 @@ class PlotArray:
                     for j in range(num_plots):
                         sensor = sensors[i][j]
                         self.id_mapping[sensor.get_id()] = (i, j)
-                        self.plots[-1].append(Plot(dpg, units, sensor))
+                        self.plots[-1].append(Plot(dpg, units, sensor, history))
 
     
     def add_datapoint(self, sensor_id, datapoint):
         i, j = self.id_mapping[sensor_id]
         self.plots[i][j].add_datapoint(datapoint)
+
+    def add_datapoints(self, sensor_id, x, y):
+        i, j = self.id_mapping[sensor_id]
+        self.plots[i][j].add_datapoints(x, y)
     
-    def update_plot_ranges(self):
-        [[plot.update_range() for plot in row] for row in self.plots]
\ No newline at end of file
+    def update_plot_ranges(self, now):
+        """
+        Redraw the plots which need it, returns the number redrawn. Plots
+        keep their dirty flag while the tab is hidden.
+        """
+        return sum(plot.update(now) for row in self.plots for plot in row)
+
+    def close(self):
+        # Writes out and closes the plot histories
+        [plot.close() for row in self.plots for plot in row]
\ No newline at end of file
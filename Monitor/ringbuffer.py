@@ -0,0 +1,247 @@
+""" Fixed size storage for plotted time series.
+
+RingSeries keeps the latest points of a series in preallocated NumPy arrays.
+Every point is written twice, at i and i + capacity, so the latest capacity
+points are always a contiguous slice: appending is O(1), windows are found
+with searchsorted, and views can be handed to DearPyGui without copying or
+reordering.
+
+Points older than the capacity are dropped, or written to an optional
+SpillStore on disk in blocks. SlidingExtrema tracks the min and max of a
+scrolling window incrementally.
+"""
+import os
+from collections import deque
+
+import numpy as np
+
+# Points written to the spill store at once
+SPILL_BLOCK = 1024
+# Smaller batches are added to SlidingExtrema point by point, which is faster
+# than the NumPy path below about this size.
+EXTREMA_BATCH = 32
+
+
+class SpillStore:
+    """ Append-only binary file of (time, value) float64 pairs.
+
+    Load with np.fromfile(filename).reshape(-1, 2).
+    """
+    def __init__(self, filename):
+        directory = os.path.dirname(filename)
+        if directory:
+            os.makedirs(directory, exist_ok=True)
+        self.filename = filename
+        self.file = open(filename, "ab")
+
+    def write(self, x, y):
+        np.column_stack((x, y)).tofile(self.file)
+        self.file.flush()
+
+    def close(self):
+        # Safe to call more than once
+        if not self.file.closed:
+            self.file.flush()
+            self.file.close()
+
+
+class RingSeries:
+    """ Latest capacity points of a series with increasing x.
+
+    spill, if given, is called with (x, y) blocks of the points about to be
+    overwritten.
+    """
+    def __init__(self, capacity, spill=None):
+        # Whole blocks, so the spilled blocks line up with the buffer
+        self.capacity = -(-capacity // SPILL_BLOCK) * SPILL_BLOCK
+        self.spill = spill
+
+        self.x = np.zeros(2 * self.capacity)
+        self.y = np.zeros(2 * self.capacity)
+        self.index = 0
+        self.count = 0
+        # Points appended since creation, and how many of them were spilled
+        self.total = 0
+        self.spilled = 0
+
+    def __len__(self):
+        return self.count
+
+    def append(self, x, y):
+        i = self.index
+        if self.count == self.capacity and self.spill and i % SPILL_BLOCK == 0:
+            # The next block of points is overwritten from here on
+            self.spill(self.x[i:i+SPILL_BLOCK].copy(), self.y[i:i+SPILL_BLOCK].copy())
+            self.spilled += SPILL_BLOCK
+
+        self.x[i] = self.x[i + self.capacity] = x
+        self.y[i] = self.y[i + self.capacity] = y
+
+        self.index = (i + 1) % self.capacity
+        self.total += 1
+        if self.count < self.capacity:
+            self.count += 1
+
+    def extend(self, x, y):
+        """
+        Append arrays of points, a block at a time.
+        """
+        n = len(x)
+        start = 0
+        while start < n:
+            i = self.index
+            if self.count == self.capacity and self.spill and i % SPILL_BLOCK == 0:
+                self.spill(self.x[i:i+SPILL_BLOCK].copy(), self.y[i:i+SPILL_BLOCK].copy())
+                self.spilled += SPILL_BLOCK
+
+            # Up to the end of the block, which never wraps the buffer
+            k = min(n - start, SPILL_BLOCK - i % SPILL_BLOCK)
+            self.x[i:i+k] = self.x[i+self.capacity:i+self.capacity+k] = x[start:start+k]
+            self.y[i:i+k] = self.y[i+self.capacity:i+self.capacity+k] = y[start:start+k]
+
+            start += k
+            self.index = (i + k) % self.capacity
+            self.total += k
+            self.count = min(self.count + k, self.capacity)
+
+    def flush(self):
+        """
+        Spill the stored points which have not been spilled yet. Called once
+        no more points will be appended.
+        """
+        n = self.total - self.spilled
+        if self.spill and n > 0:
+            self.spill(self.get_x()[-n:].copy(), self.get_y()[-n:].copy())
+            self.spilled = self.total
+
+    def first_index(self):
+        # Number of points appended before the oldest stored one
+        return self.total - self.count
+
+    def get_slice(self):
+        # Positions of the stored points, oldest first
+        if self.count < self.capacity:
+            return slice(0, self.count)
+        return slice(self.index, self.index + self.capacity)
+
+    def get_x(self):
+        return self.x[self.get_slice()]
+
+    def get_y(self):
+        return self.y[self.get_slice()]
+
+    def first_x(self):
+        return self.x[self.get_slice().start]
+
+    def last_x(self):
+        return self.x[self.get_slice().stop - 1]
+
+    def get_window_indices(self, xmin, xmax):
+        """
+        Indices (into get_x/get_y) of the points strictly inside the window.
+        """
+        x = self.get_x()
+        return (
+            int(np.searchsorted(x, xmin, side="right")),
+            int(np.searchsorted(x, xmax, side="left"))
+        )
+
+
+def get_candidates(x, y):
+    """
+    Masks of the points which are a min or max candidate of any window ending
+    at the last point: no later point is as low (or as high).
+    """
+    later_min = np.r_[np.minimum.accumulate(y[::-1])[::-1][1:], np.inf]
+    later_max = np.r_[np.maximum.accumulate(y[::-1])[::-1][1:], -np.inf]
+    return y < later_min, y > later_max
+
+
+class SlidingExtrema:
+    """ Min and max of a series over a window whose start only moves forward.
+
+    Monotonic deques of (x, y) candidates are maintained on append, so both
+    are available in O(1) amortized time. extend adds arrays of points with
+    NumPy. If the window start moves back, rebuild from the stored series.
+
+    Candidates more than horizon before the latest point are discarded on
+    append, so memory stays bounded even if get is not called.
+    """
+    def __init__(self, horizon=np.inf):
+        self.horizon = horizon
+        self.mins = deque()
+        self.maxs = deque()
+        # Points with x at or before start have been discarded
+        self.start = -np.inf
+
+    def append(self, x, y):
+        while self.mins and self.mins[-1][1] >= y:
+            self.mins.pop()
+        self.mins.append((x, y))
+
+        while self.maxs and self.maxs[-1][1] <= y:
+            self.maxs.pop()
+        self.maxs.append((x, y))
+
+        self.trim(x - self.horizon)
+
+    def extend(self, x, y):
+        """
+        Append arrays of points, equivalent to appending them one at a time.
+        """
+        if len(x) < EXTREMA_BATCH:
+            for point in zip(x.tolist(), y.tolist()):
+                self.append(*point)
+            return
+
+        is_min, is_max = get_candidates(x, y)
+        low, high = y.min(), y.max()
+
+        while self.mins and self.mins[-1][1] >= low:
+            self.mins.pop()
+        self.mins.extend(zip(x[is_min].tolist(), y[is_min].tolist()))
+
+        while self.maxs and self.maxs[-1][1] <= high:
+            self.maxs.pop()
+        self.maxs.extend(zip(x[is_max].tolist(), y[is_max].tolist()))
+
+        self.trim(x[-1] - self.horizon)
+
+    def trim(self, oldest):
+        # Discard the candidates at or before oldest. Windows starting at or
+        # after the newest discarded candidate are unaffected.
+        while self.mins and self.mins[0][0] <= oldest:
+            self.start = max(self.start, self.mins.popleft()[0])
+        while self.maxs and self.maxs[0][0] <= oldest:
+            self.start = max(self.start, self.maxs.popleft()[0])
+
+    def rebuild(self, start, x, y):
+        """
+        Rebuild from the series (x, y) for a window starting after start.
+        """
+        keep = x > start
+        x, y = x[keep], y[keep]
+
+        # A point stays a candidate while no later point beats it
+        is_min, is_max = get_candidates(x, y)
+        self.mins = deque(zip(x[is_min].tolist(), y[is_min].tolist()))
+        self.maxs = deque(zip(x[is_max].tolist(), y[is_max].tolist()))
+        self.start = start
+
+    def get(self, start):
+        """
+        (min, max) of the points after start, None if there are none. Raises
+        ValueError if start is before the last start (rebuild instead).
+        """
+        if start < self.start:
+            raise ValueError("The window start moved back.")
+        self.start = start
+
+        while self.mins and self.mins[0][0] <= start:
+            self.mins.popleft()
+        while self.maxs and self.maxs[0][0] <= start:
+            self.maxs.popleft()
+
+        if not self.mins:
+            return None
+        return self.mins[0][1], self.maxs[0][1]
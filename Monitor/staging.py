@@ -0,0 +1,49 @@
+""" Handoff of work from other threads to the render loop.
+
+DearPyGui items and the plot data are only touched by the render loop. Other
+threads (the message receiver, loggers) put items in a StagingBuffer, which
+the render loop drains once per frame.
+"""
+from collections import deque
+
+
+class StagingBuffer:
+    """ Queue of items for the render loop.
+
+    deque.append and deque.popleft are atomic, so no lock is needed. Designed
+    for a single producer, but safe with several (e.g. logging threads).
+    """
+    def __init__(self):
+        self.items = deque()
+
+        # Statistics since the last reset
+        self.drains = 0
+        self.drained = 0
+        self.max_depth = 0
+
+    def put(self, item):
+        self.items.append(item)
+
+    def drain(self):
+        """
+        Remove and return the items queued so far, oldest first. Items put
+        while draining are left for the next call.
+        """
+        depth = len(self.items)
+        self.drains += 1
+        self.drained += depth
+        self.max_depth = max(self.max_depth, depth)
+
+        popleft = self.items.popleft
+        return [popleft() for _ in range(depth)]
+
+    def get_statistics(self):
+        """
+        (mean items per drain, largest depth when drained) since the last
+        call.
+        """
+        stats = (self.drained / max(self.drains, 1), self.max_depth)
+        self.drains = 0
+        self.drained = 0
+        self.max_depth = 0
+        return stats
@@ -0,0 +1,48 @@
+""" Unit conversions compiled to (scale, offset) pairs.
+
+Sensor data is received, stored and spilled in the default units of each
+sensor (zerolib.enums.SENSOR_UNITS). pint is only used at startup to find the
+transform from the default units to every display unit, which is then applied
+with float math when the data is drawn.
+"""
+
+
+class UnitTransform:
+    """ Conversion from the default units, y * scale + offset.
+    """
+    def __init__(self, scale, offset, label):
+        self.scale = scale
+        self.offset = offset
+        # Abbreviated units for axis labels, empty if dimensionless
+        self.label = label
+
+    def apply(self, y):
+        # Works on floats and NumPy arrays
+        return y * self.scale + self.offset
+
+    def apply_range(self, low, high):
+        # Ordered (low, high), in case the scale is negative
+        low, high = self.apply(low), self.apply(high)
+        return (low, high) if low <= high else (high, low)
+
+
+def compile_transform(units, from_units, to_units):
+    """
+    Transform from from_units to to_units using the pint registry units. All
+    supported conversions are affine, so two points determine it.
+    """
+    zero = units.Quantity(0., from_units).to(to_units).m
+    one = units.Quantity(1., from_units).to(to_units).m
+    label = f"{units(to_units).units:~P}"
+    return UnitTransform(one - zero, zero, label)
+
+def compile_transforms(units, available_units):
+    """
+    Transforms from the default (first) units to each of available_units,
+    keyed by unit name.
+    """
+    default_units = available_units[0]
+    return {
+        name : compile_transform(units, default_units, name)
+        for name in available_units
+    }
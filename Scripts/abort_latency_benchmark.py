@@ -0,0 +1,112 @@
+""" Abort latency benchmark using the simulated hardware.
+
+Runs the static fire program on a SimulatedPi, with a delay on every command
+approximating the pigpio socket round trip, and aborts it at random points
+while the sensor loop is running. For every abort, the time from the abort
+being received to both propellant valve PWMs being set closed is measured from
+the simulated command log. Both program modes (waveform and deadline) are
+tested.
+
+Usage: python abort_latency_benchmark.py [trials] [command delay in us]
+"""
+### ADD IMPORT DIRECTORY
+import sys
+sys.path.append('../')
+sys.path.append('../Controller')
+
+import os
+import random
+import time
+import logging
+
+from zerolib.enums import ActionType
+from zerolib.sensorcfg import SensorConfiguration
+from zerolib.standard import logging_config, sensor_cfg_location
+
+logging.basicConfig(**logging_config)
+logging.getLogger().setLevel(logging.ERROR)
+
+import timing
+
+from controller import TestBenchController
+from instrumentation import LatencyHistogram, format_duration
+from interface import HardwareInterface, SERVO_PWM_FREQ
+from peripherals import PeripheralManager
+from program import EngineTestProgram, WAVEFORM, DEADLINE
+from simulation import SimulatedPi, SimulatedSensorArray
+
+PROGRAM = "../Engine Test Programs/static-fire.prog"
+# Abort times after the program starts
+ABORT_WINDOW = (0.1, 2)
+
+trials = int(sys.argv[1]) if len(sys.argv) > 1 else 20
+command_delay = (float(sys.argv[2]) if len(sys.argv) > 2 else 100) * 1e-6
+
+class Dispatcher:
+    # Drops the telemetry, there is no monitor.
+    def dispatch(self, msg, log=True, reliable=False):
+        pass
+
+# The data logger and valve program records write to ./Data
+os.makedirs("Data", exist_ok=True)
+
+sens_cfg = SensorConfiguration(sensor_cfg_location)
+sens_cfg.read_config()
+
+pi = SimulatedPi(command_delay=command_delay)
+interface = HardwareInterface(pi=pi)
+peripheral_manager = PeripheralManager(interface)
+peripheral_manager.set_default_states()
+sensor_array = SimulatedSensorArray(peripheral_manager)
+
+program = EngineTestProgram(peripheral_manager)
+program.load(PROGRAM)
+
+controller = TestBenchController(
+    peripheral_manager, Dispatcher(), sens_cfg, program, sensor_array
+)
+controller.sb_rx.start_collection()
+
+def closed_pwm(valve):
+    return int(valve.closed_duty * 0.0025 * SERVO_PWM_FREQ * 1000000)
+
+def closed_time(valve, after):
+    # First time the valve PWM was set closed after the abort
+    closed = closed_pwm(valve)
+    times = [
+        t for t, _, args in pi.get_commands("hardware_PWM", valve.port.value)
+        if t >= after and args[2] == closed
+    ]
+    return times[0] if times else None
+
+valves = [peripheral_manager.fuel_valve, peripheral_manager.oxidizer_valve]
+
+print(f"{trials} aborts per mode, {command_delay*1e6:.0f} us per pigpio command.")
+for mode in (WAVEFORM, DEADLINE):
+    program.mode = mode
+    latency = LatencyHistogram()
+    failures = 0
+
+    for _ in range(trials):
+        controller.execute(ActionType.BEGIN_BURN_PHASE)
+        time.sleep(random.uniform(*ABORT_WINDOW))
+
+        received = timing.now()
+        controller.execute(ActionType.ABORT_BURN_PHASE)
+
+        program.thread.join()
+        time.sleep(0.05)
+
+        times = [closed_time(valve, received) for valve in valves]
+        if None in times:
+            failures += 1
+        else:
+            latency.record(max(times) - received)
+
+    print(f"{program.active_mode}: abort to PWM closed {latency.format()}"
+          + (f", {failures} FAILED" if failures else ""))
+
+print(f"Actuation thread: {peripheral_manager.actuator.format()}")
+print(f"Hardware commands: {interface.format_statistics()}")
+print(f"Worst case: {format_duration(peripheral_manager.actuator.latency[0].worst)}"
+      " from abort received to safing complete.")
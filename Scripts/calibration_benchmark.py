@@ -0,0 +1,87 @@
+""" Benchmark the cost of calibrating a reading.
+
+Compares, for every calibrated sensor in sensors.cfg:
+    lookup   - Resolving the calibration data on every read, as the controller
+               used to (with scipy's interp1d for the battery table).
+    compiled - The compiled per-sensor Calibration, one reading at a time.
+    batch    - The compiled Calibration applied to a NumPy array.
+
+Usage: python calibration_benchmark.py [samples]
+"""
+### ADD IMPORT DIRECTORY
+import sys
+sys.path.append('../')
+sys.path.append('../Controller')
+
+import time
+
+import numpy as np
+
+from scipy.interpolate import interp1d
+
+from zerolib.enums import SensorType
+from zerolib.sensorcfg import SensorConfiguration
+from zerolib.standard import sensor_cfg_location
+
+from sensor_calib import CALIBRATION_DATA, compile_calibration
+
+n = int(sys.argv[1]) if len(sys.argv) > 1 else 100000
+
+# The previous per-read implementation
+def linear_calibration(calib_data, rval):
+    return (rval - calib_data[0]) * calib_data[1]
+
+def fn_calibration(calib_fn, rval):
+    return calib_fn(rval)
+
+LOOKUP_DATA = dict(CALIBRATION_DATA)
+LOOKUP_DATA[SensorType.BATTERY_LEVEL] = {
+    k : interp1d(*v, kind="linear") if v is not None else (lambda x: x)
+    for k, v in CALIBRATION_DATA[SensorType.BATTERY_LEVEL].items()
+}
+LOOKUP_FUNCTIONS = {
+    stype : fn_calibration if stype == SensorType.BATTERY_LEVEL
+        else linear_calibration
+    for stype in LOOKUP_DATA
+}
+
+def make_lookup(sensor):
+    def apply(reading):
+        if sensor.get_type() not in LOOKUP_DATA.keys():
+            return reading
+        if sensor.get_number():
+            cdata = LOOKUP_DATA[sensor.get_type()][sensor.get_number()]
+        else:
+            cdata = LOOKUP_DATA[sensor.get_type()]
+        return LOOKUP_FUNCTIONS[sensor.get_type()](cdata, reading)
+
+    return apply
+
+def per_sample(fn, samples):
+    start = time.perf_counter()
+    for x in samples:
+        fn(x)
+    return (time.perf_counter() - start) / len(samples) * 1e9
+
+def batch(fn, samples):
+    start = time.perf_counter()
+    fn(samples)
+    return (time.perf_counter() - start) / len(samples) * 1e9
+
+sens_cfg = SensorConfiguration(sensor_cfg_location)
+sens_cfg.read_config()
+
+print(f"ns per sample over {n} samples")
+print(f"{'sensor':>24} {'lookup':>10} {'compiled':>10} {'batch':>10}")
+for sensor in sens_cfg.get_sensors():
+    if sensor.get_type() not in CALIBRATION_DATA or sensor.get_rate() is None:
+        continue
+
+    calibration = compile_calibration(sensor)
+    samples = np.random.uniform(0.5, 4.5, n)
+    sample_list = samples.tolist()
+
+    print(f"{sensor.get_name():>24} "
+          f"{per_sample(make_lookup(sensor), sample_list):10.1f} "
+          f"{per_sample(calibration.apply, sample_list):10.1f} "
+          f"{batch(calibration.apply_batch, samples):10.1f}")
@@ -0,0 +1,92 @@
+""" Closed-loop throttle control against a simulated combustion plant.
+
+Runs the controller stack on a SimulatedSensorArray and SimulatedPi, with the
+chamber pressure given by a SimulatedCombustionPlant whose gain is lower than
+the one assumed by the program's feed-forward throttles. The same chamber
+pressure target is tracked with the feed-forward alone and with the closed-loop
+controller, and the tracking error and sample to command latency are reported.
+
+Usage: python closed_loop_simulation.py [plant gain]
+"""
+### ADD IMPORT DIRECTORY
+import sys
+sys.path.append('../')
+sys.path.append('../Controller')
+
+import os
+import time
+import logging
+
+from zerolib.enums import ActionType, SensorType
+from zerolib.sensorcfg import SensorConfiguration
+from zerolib.standard import logging_config, sensor_cfg_location
+
+logging.basicConfig(**logging_config)
+logging.getLogger().setLevel(logging.ERROR)
+
+from controller import TestBenchController
+from interface import HardwareInterface
+from peripherals import PeripheralManager
+from program import EngineTestProgram
+from program_compiler import CompiledProgram
+from simulation import SimulatedPi, SimulatedSensorArray, SimulatedCombustionPlant
+from throttle_control import DEFAULT_SETTINGS, ControlSettings
+
+# Gain assumed by the feed-forward, psi per unit throttle
+MODEL_GAIN = 250
+plant_gain = float(sys.argv[1]) if len(sys.argv) > 1 else 200
+
+# Ramp to 150 psi, step to 200 psi, then shut down. Throttles are the
+# feed-forward for MODEL_GAIN.
+KEYFRAMES = [
+    # time, fuel, oxidizer, ignitor, target
+    [0.0, 0.0, 0.0, 1, float("nan")],
+    [0.5, 0.6, 0.6, 1, 150],
+    [2.5, 0.6, 0.6, 0, 150],
+    [2.6, 0.8, 0.8, 0, 200],
+    [4.5, 0.8, 0.8, 0, 200],
+    [4.6, 0.0, 0.0, 0, float("nan")],
+]
+
+class Dispatcher:
+    # Drops the telemetry, there is no monitor.
+    def dispatch(self, msg, log=True, reliable=False):
+        pass
+
+# The data logger and valve program records write to ./Data
+os.makedirs("Data", exist_ok=True)
+
+sens_cfg = SensorConfiguration(sensor_cfg_location)
+sens_cfg.read_config()
+
+pi = SimulatedPi(command_delay=100e-6)
+interface = HardwareInterface(pi=pi)
+peripheral_manager = PeripheralManager(interface)
+peripheral_manager.set_default_states()
+sensor_array = SimulatedSensorArray(peripheral_manager)
+
+plant = SimulatedCombustionPlant(peripheral_manager, gain=plant_gain)
+cc_pressure = sens_cfg.get_by_type(SensorType.CC_PRESSURE)[0]
+sensor_array.set_signal(cc_pressure, plant)
+
+program = EngineTestProgram(peripheral_manager)
+controller = TestBenchController(
+    peripheral_manager, Dispatcher(), sens_cfg, program, sensor_array
+)
+controller.sb_rx.start_collection()
+
+FEED_FORWARD = ControlSettings(SensorType.CC_PRESSURE, rate=DEFAULT_SETTINGS.rate)
+
+print(f"Plant gain {plant_gain:g} psi, feed-forward assumes {MODEL_GAIN} psi.")
+for label, settings in (("feed-forward", FEED_FORWARD), ("closed loop", DEFAULT_SETTINGS)):
+    program.control_settings = settings
+    program.set_program(CompiledProgram(label, KEYFRAMES))
+
+    controller.execute(ActionType.BEGIN_BURN_PHASE)
+    program.thread.join()
+    # Let the chamber empty before the next run
+    time.sleep(0.5)
+
+    rms, worst = program.get_tracking_error()
+    print(f"{label}: tracking error RMS {rms:.3g} psi, max {worst:.3g} psi, "
+          f"sample to command {program.control_latency.format()}")
@@ -0,0 +1,69 @@
+""" Compare the throughput and delay of the GenericSensorDenoiser modes.
+
+Three approaches are compared on a noisy test signal:
+    lookback   - sosfiltfilt over the last few samples, once per sample.
+    streaming  - causal filter with carried state, once per sample.
+    zero-phase - sosfiltfilt over the whole recording (post-processing).
+The delay is measured as the lag maximizing the cross-correlation between the
+clean signal and the filtered output.
+
+Usage: python denoiser_benchmark.py [sample rate] [samples]
+"""
+### ADD IMPORT DIRECTORY
+import sys
+sys.path.append('../')
+
+import time
+
+import numpy as np
+
+from zerolib.signal import GenericSensorDenoiser, STREAMING, LOOKBACK
+
+sample_rate = int(sys.argv[1]) if len(sys.argv) > 1 else 400
+n = int(sys.argv[2]) if len(sys.argv) > 2 else 4000
+
+t = np.arange(n) / sample_rate
+clean = np.sin(2 * np.pi * 0.5 * t) + 0.5 * np.sin(2 * np.pi * 1.3 * t)
+noisy = clean + np.random.normal(0, 0.1, n)
+
+def measure_delay(output):
+    # Lag (in samples) maximizing the correlation with the clean signal
+    max_lag = sample_rate // 2
+    a = clean - clean.mean()
+    b = output - output.mean()
+    scores = [
+        np.dot(a[:n-lag], b[lag:]) for lag in range(max_lag)
+    ]
+    return int(np.argmax(scores))
+
+def run_per_sample(mode):
+    denoiser = GenericSensorDenoiser(sample_rate, mode=mode)
+    samples = noisy.tolist()
+
+    start = time.perf_counter()
+    output = [denoiser.update(y) for y in samples]
+    elapsed = time.perf_counter() - start
+
+    return np.array(output), elapsed
+
+def run_zero_phase():
+    denoiser = GenericSensorDenoiser(sample_rate)
+
+    start = time.perf_counter()
+    output = denoiser.filter_block(noisy)
+    elapsed = time.perf_counter() - start
+
+    return output, elapsed
+
+print(f"{n} samples at {sample_rate} Hz")
+for name, (output, elapsed) in [
+        ("lookback", run_per_sample(LOOKBACK)),
+        ("streaming", run_per_sample(STREAMING)),
+        ("zero-phase", run_zero_phase())
+    ]:
+    delay = measure_delay(output)
+    rms = np.sqrt(np.mean((output - clean)[sample_rate:]**2))
+    print(f"{name:>10}: {n / elapsed:12.0f} samples/s, "
+          f"{elapsed / n * 1e6:8.2f} us/sample, "
+          f"delay {delay} samples ({delay / sample_rate * 1e3:.1f} ms), "
+          f"RMS error {rms:.3g}")
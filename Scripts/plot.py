@@ -1,3 +1,9 @@
+""" Plot a column of a converted data log.
+
+Usage: python plot.py file index [plan_file offset]
+A timeline from validate_program.py (converted to csv) can be overlaid, with
+the program start at offset seconds into the data log.
+"""
 import sys
 
 import numpy as np
@@ -5,6 +11,8 @@ import matplotlib.pyplot as plt
 
 filename = sys.argv[1]
 idx = int(sys.argv[2])
+plan_filename = sys.argv[3] if len(sys.argv) > 3 else None
+offset = float(sys.argv[4]) if len(sys.argv) > 4 else 0.
 
 print(f"Plotting index {idx} of file {filename}.")
 
@@ -25,7 +33,20 @@ stddev_freq = np.std(t_freq)
 print(f"Mean sample frequency: {mean_freq:.3g} Hz")
 print(f"Standard deviation: {stddev_freq:.3g} Hz")
 
-plt.plot(t, y)
+plt.plot(t, y, label="Actual")
+
+if plan_filename:
+    with open(plan_filename, "r") as f:
+        plan = [x.strip().split(',') for x in f.readlines()]
+
+    if col_name in plan[0]:
+        plan_idx = plan[0].index(col_name)
+        plan = np.array([[float(x[0]), float(x[plan_idx])] for x in plan[1:] if x[0]])
+        plt.plot(plan[:, 0] + offset, plan[:, 1], label="Planned")
+        plt.legend()
+    else:
+        print(f"Column {col_name} is not in the plan.")
+
 plt.title("Sensor Data Plot")
 plt.xlabel("Time [s]")
 plt.ylabel(col_name)
@@ -0,0 +1,96 @@
+""" End to end redline test using the simulated hardware.
+
+Runs the controller stack (sensor loop, redline engine and action handling) on
+a SimulatedSensorArray and SimulatedPi. After a short settling time, the tank
+pressure is stepped above its redline (TEST_REDLINE unless one is configured),
+and the script checks that the abort sequence commanded the valves and reports
+the reaction latency.
+
+Usage: python redline_simulation.py [pressure]
+"""
+### ADD IMPORT DIRECTORY
+import sys
+sys.path.append('../')
+sys.path.append('../Controller')
+
+import os
+import time
+import logging
+
+from zerolib.enums import SensorType, ActionType
+from zerolib.sensorcfg import SensorConfiguration, Redline
+from zerolib.standard import logging_config, sensor_cfg_location
+
+logging.basicConfig(**logging_config)
+
+from controller import TestBenchController
+from interface import HardwareInterface, ServoMapping
+from peripherals import PeripheralManager
+from program import EngineTestProgram
+from simulation import SimulatedPi, SimulatedSensorArray
+
+SETTLE_TIME = 1
+TIMEOUT = 2
+
+# Only used for the simulation, not a signed off limit
+TEST_REDLINE = Redline(maximum=900, persistence=3, action=ActionType.ABORT)
+
+pressure = float(sys.argv[1]) if len(sys.argv) > 1 else 1000
+
+class Dispatcher:
+    # Drops the telemetry, there is no monitor.
+    def dispatch(self, msg, log=True, reliable=False):
+        pass
+
+# The data logger writes to ./Data
+os.makedirs("Data", exist_ok=True)
+
+sens_cfg = SensorConfiguration(sensor_cfg_location)
+sens_cfg.read_config()
+
+tank_pressure = sens_cfg.get_by_type(SensorType.TANK_PRESSURE)[0]
+if tank_pressure.get_redline() is None:
+    tank_pressure.redline = TEST_REDLINE
+redline = tank_pressure.get_redline()
+
+pi = SimulatedPi()
+interface = HardwareInterface(pi=pi)
+peripheral_manager = PeripheralManager(interface)
+peripheral_manager.set_default_states()
+sensor_array = SimulatedSensorArray(peripheral_manager)
+
+controller = TestBenchController(
+    peripheral_manager, Dispatcher(), sens_cfg, EngineTestProgram(peripheral_manager),
+    sensor_array
+)
+
+fault_time = sensor_array.clock() + SETTLE_TIME
+sensor_array.set_signal(
+    tank_pressure,
+    lambda t: pressure if sensor_array.start_time + t >= fault_time else 400
+)
+
+controller.sb_rx.start_collection()
+
+vent = ServoMapping.VENT_VALVE.value
+deadline = fault_time + TIMEOUT
+# The latency is recorded once the action's commands have been applied
+while time.monotonic() < deadline and not controller.sb_rx.redlines.latency.count:
+    time.sleep(0.01)
+
+vent_commands = [
+    t for t, _, _ in pi.get_commands(gpio=vent) if t >= fault_time
+]
+
+if not vent_commands:
+    print(f"FAIL: no abort within {TIMEOUT} s of {pressure} psi "
+          f"(redline {redline.maximum} psi).")
+    sys.exit(1)
+
+latency = controller.sb_rx.redlines.latency
+print(f"PASS: {tank_pressure.get_name()} at {pressure} psi tripped "
+      f"{redline.action.name}.")
+print(f"    Fault to vent command: {(vent_commands[0] - fault_time)*1e3:.2f} ms "
+      f"(includes {redline.persistence} sample persistence at "
+      f"{tank_pressure.get_rate()} Hz)")
+print(f"    Reaction latency: {latency.format()}")
@@ -0,0 +1,68 @@
+""" Benchmark the SPI transports used by the ADS1120 and MAX31855 drivers.
+
+Prints the time per read in microseconds for each transport that is available.
+The loopback transport always runs and measures the pure Python overhead. The
+bitbang and spidev transports only run on the Pi.
+
+Usage: python spi_benchmark.py [iterations]
+"""
+### ADD IMPORT DIRECTORY
+import sys
+sys.path.append('../')
+
+import time
+
+from zerolib.spi import LoopbackTransport, BusioTransport, SpidevTransport
+from zerolib.ads1120 import ADS1120
+from zerolib.max31855 import MAX31855Array
+
+iterations = int(sys.argv[1]) if len(sys.argv) > 1 else 10000
+
+def get_transports():
+    # Chip selects are plain objects on the loopback transport
+    yield "loopback", LoopbackTransport({
+        f"TC{i}" : (lambda n: b"\x01\x90\x19\x00") for i in range(5)
+    }), [f"TC{i}" for i in range(5)], "ADC"
+
+    try:
+        import board
+        import adafruit_bitbangio as bitbangio
+        from digitalio import DigitalInOut
+    except (ImportError, NotImplementedError, AttributeError):
+        print("Board support not available, skipping hardware transports.")
+        return
+
+    tc_cs = [board.D6, board.D17, board.D27, board.D22, board.D5]
+    spi = bitbangio.SPI(board.D11, MISO=board.D9, MOSI=board.D10)
+    yield "bitbang", BusioTransport(spi), \
+        [DigitalInOut(pin) for pin in tc_cs], DigitalInOut(board.D4)
+    spi.deinit()
+
+    try:
+        yield "spidev", SpidevTransport(0, 0), \
+            [DigitalInOut(pin) for pin in tc_cs], DigitalInOut(board.D4)
+    except RuntimeError as e:
+        print(f"Skipping spidev: {e}")
+
+def benchmark(fn, n):
+    start = time.perf_counter()
+    for _ in range(n):
+        fn()
+    return (time.perf_counter() - start) / n * 1e6
+
+for name, transport, tc_cs, adc_cs in get_transports():
+    adc = ADS1120(transport, adc_cs)
+    tcs = MAX31855Array(transport, tc_cs)
+
+    adc_us = benchmark(adc._read, iterations)
+    tc_us = benchmark(tcs.read_all, iterations // 5)
+
+    print(f"{name}:")
+    print(f"    ADS1120 read: {adc_us:.1f} us")
+    print(f"    MAX31855 batch of {len(tc_cs)}: {tc_us:.1f} us "
+          f"({tc_us / len(tc_cs):.1f} us per thermocouple)")
+
+    # Release the chip selects for the next transport
+    for cs in tc_cs + [adc_cs]:
+        if hasattr(cs, "deinit"):
+            cs.deinit()
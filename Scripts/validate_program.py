@@ -0,0 +1,84 @@
+""" Validate and simulate engine test programs offline.
+
+Every program is checked as the controller would check it when starting
+(monotonic time, throttles within 0 to 1, ignitor timing relative to the
+valves opening). The commanded valve and ignitor timeline is then simulated
+and written to "Data/PLAN <name>.csv.gz" in the data log format. After
+converting with convert_to_csv.py it can be overlaid on a data log with
+plot.py.
+
+Usage: python validate_program.py [programs ...] [--resolution ms]
+Programs are names in the Engine Test Programs directory or .prog files. All
+programs are checked if none are given.
+"""
+### ADD IMPORT DIRECTORY
+import sys
+sys.path.append('../')
+sys.path.append('../Controller')
+
+import os
+import zlib
+from argparse import ArgumentParser
+
+from zerolib.sensorcfg import SensorConfiguration
+from zerolib.standard import sensor_cfg_location
+
+from program_compiler import get_timeline_columns, load_program
+
+PROGRAM_DIRECTORY = "../Engine Test Programs"
+
+parser = ArgumentParser(prog="Engine Program Validator")
+parser.add_argument("programs", nargs="*", help="Program names or files.")
+parser.add_argument(
+    "--resolution", type=float, default=1,
+    help="Resolution of the simulated timeline in milliseconds."
+)
+args = parser.parse_args()
+
+sens_cfg = SensorConfiguration(sensor_cfg_location)
+sens_cfg.read_config()
+columns = get_timeline_columns(sens_cfg)
+
+filenames = [
+    name if name.endswith(".prog") else f"{PROGRAM_DIRECTORY}/{name}.prog"
+    for name in args.programs
+] or [
+    f"{PROGRAM_DIRECTORY}/{filename}"
+    for filename in sorted(os.listdir(PROGRAM_DIRECTORY))
+    if filename.endswith(".prog")
+]
+
+os.makedirs("Data", exist_ok=True)
+
+failed = 0
+for filename in filenames:
+    try:
+        program = load_program(filename)
+    except (OSError, ValueError) as e:
+        print(f"FAIL {filename}: {e}")
+        failed += 1
+        continue
+
+    errors, warnings = program.validate()
+    status = "FAIL" if errors else "OK"
+    print(f"{status} {program.name}: {len(program.times)} keyframes, "
+          f"{program.get_duration():.3g} s")
+    for error in errors:
+        print(f"    error: {error}")
+    for warning in warnings:
+        print(f"    warning: {warning}")
+
+    if errors:
+        failed += 1
+        continue
+
+    output = f"Data/PLAN {program.name}.csv.gz"
+    compressor = zlib.compressobj(level=3)
+    with open(output, "wb") as f:
+        f.write(compressor.compress(
+            program.format_timeline(args.resolution, columns).encode()
+        ))
+        f.write(compressor.flush())
+    print(f"    timeline written to {output}")
+
+sys.exit(1 if failed else 0)
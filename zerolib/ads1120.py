@@ -5,9 +5,7 @@ with all inputs assumed to be single-ended, and an analog vref provided.
 """
 import time
 
-from adafruit_bus_device.spi_device import SPIDevice
-from busio import SPI
-from digitalio import DigitalInOut
+from zerolib.spi import SPITransport
 
 CMD_NOP = 0xFF
 CMD_WREG = 0x40
@@ -15,6 +13,15 @@ CMD_RREG = 0x20
 CMD_RESET = 0x06
 CMD_START_SYNC = 0x08
 
+# Turbo mode at DR=110 converts at 2k SPS.
+CONVERSION_TIME = 1/2000
+# Time for the first conversion after a mux change to complete.
+SETTLE_TIME = 1/1800
+# Give up waiting on the DRDY pin after this long and read anyway.
+DRDY_TIMEOUT = 4 * CONVERSION_TIME
+# Maximum number of samples per channel returned in a single scan burst.
+MAX_BURST = 16
+
 class ADS1120:
     """ Baseline high-throughput ADS1120 driver.
 
@@ -26,12 +33,24 @@ class ADS1120:
     necessary except after the chip resets and in order to give the chip time to
     acquire a new reading.
     """
-    def __init__(self, spi : SPI, cs : DigitalInOut):
+    def __init__(self, transport : SPITransport, cs, drdy=None):
         # IMPORTANT: phase=1
-        self.dev = SPIDevice(spi, cs, baudrate=1000000, phase=1)
-        
+        self.dev = transport.device(cs, baudrate=1000000, phase=1)
+
+        # Optional data ready pin (active low). Without it, conversions are
+        # timed from the last mux switch or read.
+        self.drdy = drdy
+
         # Remember the multiplexer state, switch if necessary to perform a read.
         self.mux_state = None
+        # Earliest time at which a fresh conversion is expected.
+        self.ready_time = 0
+        # Set from a mux switch until the first conversion on the new channel
+        # is read. DRDY may still flag a conversion of the previous channel.
+        self.settling = False
+
+        # Preallocated receive buffer
+        self.rdata = bytearray(2)
     
     def initialize(self):
         self.reset()
@@ -50,11 +69,46 @@ class ADS1120:
         self.start_sync()
 
     def read(self, mux_state):
+        return self.read_timestamped(mux_state)[1]
+
+    def read_timestamped(self, mux_state, fresh=False):
+        """
+        Read the latest conversion from the given channel. Returns the time at
+        which it was read along with the voltage. A mux switch waits once for
+        the first conversion on the new channel. Otherwise the read returns
+        immediately, unless fresh is set, in which case it waits for a
+        conversion that has not been read yet.
+        """
         if self.mux_state != mux_state:
             self.set_multiplexer(mux_state)
-            time.sleep(1/1800) # Allow the sensor time to acquire a reading
-        
-        return self._read()
+            timestamp = self.wait_ready()
+        elif fresh:
+            timestamp = self.wait_ready()
+        else:
+            timestamp = time.monotonic()
+
+        return timestamp, self._read()
+
+    def wait_ready(self):
+        """
+        Wait until a fresh conversion is available. Uses the DRDY pin if one is
+        connected, otherwise waits for the expected conversion time. Unlike a
+        fixed sleep, any time spent elsewhere since the last mux switch or read
+        counts towards the wait. Right after a switch the settling time is
+        always used, as DRDY may be asserted for the previous channel.
+        """
+        if self.drdy is not None and not self.settling:
+            start = time.monotonic()
+            while self.drdy.value:
+                if time.monotonic() - start > DRDY_TIMEOUT:
+                    break
+            return time.monotonic()
+
+        now = time.monotonic()
+        if now < self.ready_time:
+            time.sleep(self.ready_time - now)
+            now = time.monotonic()
+        return now
 
     def reset(self):
         self.send_command(CMD_RESET)
@@ -63,11 +117,15 @@ class ADS1120:
         self.send_command(CMD_START_SYNC)
 
     def _read(self):
-        rdata = bytearray(2)
+        rdata = self.rdata
 
         with self.dev as spi:
             spi.readinto(rdata, write_value=CMD_NOP)
-        
+
+        # The next conversion completes one conversion period from now.
+        self.ready_time = time.monotonic() + CONVERSION_TIME
+        self.settling = False
+
         val = (rdata[0] << 8) | rdata[1]
         return val / 2**15 * 5 # Converted to voltage
 
@@ -104,4 +162,88 @@ class ADS1120:
             raise RuntimeError(f"Bad mux value {value}.")
 
         self.mux_state = value
-        self.write_register(0, 0b10000001 + (value<<4))
\ No newline at end of file
+        self.write_register(0, 0b10000001 + (value<<4))
+        # Writing the config register restarts the conversion.
+        self.ready_time = time.monotonic() + SETTLE_TIME
+        self.settling = True
+
+
+class ADS1120Scanner:
+    """ Multi-channel scan engine for the ADS1120.
+
+    Each mux switch costs a settling period, so reads are grouped by channel.
+    rates maps each mux channel to its sample rate in Hz, and may be changed
+    at any time. Each call to scan reads every channel that is due, starting
+    with the channel the mux is already on, and returns timestamped bursts of
+    consecutive conversions.
+    """
+    def __init__(self, adc : ADS1120, rates):
+        self.adc = adc
+        self.rates = rates
+
+        # Samples owed to each channel, created as channels are scanned
+        self.credit = {}
+        self.last_scan = None
+
+        self.switches = 0
+
+    def order(self, channels):
+        """
+        Order channel reads to minimize mux switches. The current channel is
+        read first. The rest are read in order of increasing rate, so the mux
+        is left on the fastest channel, which is most likely to be read next.
+        """
+        return sorted(
+            channels,
+            key=lambda c: (c != self.adc.mux_state, self.rates.get(c, 0))
+        )
+
+    def read_group(self, channels):
+        """
+        Read one conversion from each channel. Returns a dict mapping each
+        channel to a (timestamp, voltage) pair.
+        """
+        result = {}
+        for channel in self.order(channels):
+            if channel != self.adc.mux_state:
+                self.switches += 1
+            result[channel] = self.adc.read_timestamped(channel)
+        return result
+
+    def scan(self, required=(), burst=MAX_BURST):
+        """
+        Read all samples due since the last scan. Channels in required are
+        read at least once, borrowing from their next credit. At most burst
+        samples are read per channel, any more that are owed are skipped.
+        Returns a dict mapping each channel read to a list of (timestamp,
+        voltage) pairs, oldest first.
+        """
+        now = time.monotonic()
+        if self.last_scan is None:
+            self.last_scan = now
+        dt = now - self.last_scan
+        self.last_scan = now
+
+        due = []
+        for channel in set(self.rates) | set(required):
+            rate = self.rates.get(channel, 0)
+            credit = min(self.credit.get(channel, 0.) + rate * dt, MAX_BURST)
+            self.credit[channel] = credit
+            if credit >= 1 or channel in required:
+                due.append(channel)
+
+        bursts = {}
+        for channel in self.order(due):
+            owed = max(int(self.credit[channel]), 1)
+            # Borrowed credit is bounded, so a late channel catches up
+            self.credit[channel] = max(self.credit[channel] - owed, -1.)
+
+            if channel != self.adc.mux_state:
+                self.switches += 1
+            # Samples after the first of a burst are consecutive conversions
+            bursts[channel] = [
+                self.adc.read_timestamped(channel, fresh=i > 0)
+                for i in range(min(owed, burst))
+            ]
+
+        return bursts
\ No newline at end of file
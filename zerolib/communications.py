@@ -5,6 +5,10 @@ bidrectional link between two applications. The link is powered by a PyZMQ
 socket. Only zerolib.Message instances can be sent across the link. The messages
 are serialized to a bytearray before transmission to save bandwidth (data is not
 sent as plaintext).
+
+The main link only keeps the latest message, so stale telemetry is never
+delivered late. Messages which must all arrive (e.g. capture chunks) are sent
+over a second, queued link on ports RELIABLE_PORT_OFFSET above the main link's.
 """
 import zmq
 import time
@@ -25,6 +29,8 @@ HEARTBEAT_HZ = 10
 # Default port mappings
 DEFAULT_MONITOR_PORT = 9376
 DEFAULT_CONTROLLER_PORT = 9378
+# The reliable link's ports are past both port pairs above
+RELIABLE_PORT_OFFSET = 4
 
 class ThreadedBidirectionalSocket:
     """ Threaded wrapper around a PyZMQ socket.
@@ -39,17 +45,22 @@ class ThreadedBidirectionalSocket:
     Outgoing requests are cached to the send_queue and pushed as fast as
     possible.
 
+    If conflate is set, only the latest message is kept on either end of the
+    link. Otherwise every message is queued until it is delivered. Several
+    sockets can share a receive_queue.
+
     NOTE: Binding the socket or connecting to a destination should be done
     before creating an instance.
     """
 
-    def __init__(self, context):
+    def __init__(self, context, conflate=True, receive_queue=None):
         self.context = context
+        self.conflate = conflate
         self.host = None
         self.dest = None
 
         self.send_queue = Queue()
-        self.receive_queue = Queue()
+        self.receive_queue = Queue() if receive_queue is None else receive_queue
 
         self.push_thread = None
         self.pull_thread = None
@@ -73,7 +84,8 @@ class ThreadedBidirectionalSocket:
 
     def recv_loop(self):
         pull_socket = self.context.socket(zmq.PULL)
-        pull_socket.setsockopt(zmq.CONFLATE, 1)
+        if self.conflate:
+            pull_socket.setsockopt(zmq.CONFLATE, 1)
 
         if self.host:
             pull_socket.bind(self.host[0])
@@ -85,7 +97,8 @@ class ThreadedBidirectionalSocket:
 
     def send_loop(self):
         push_socket = self.context.socket(zmq.PUSH)
-        push_socket.setsockopt(zmq.CONFLATE, 1)
+        if self.conflate:
+            push_socket.setsockopt(zmq.CONFLATE, 1)
         push_socket.setsockopt(zmq.IMMEDIATE, 1)
 
         if self.host:
@@ -132,14 +145,27 @@ class MessageServer:
         # Create a ZMQ context, allowing up to 4 threads to be used for I/O
         self.context = zmq.Context(4)
         self.socket = ThreadedBidirectionalSocket(self.context)
+        # Messages received on either link are handled by the same loop
+        self.reliable_socket = ThreadedBidirectionalSocket(
+            self.context, conflate=False,
+            receive_queue=self.socket.receive_queue
+        )
 
         # Only the server needs to bind to a port
         if host and port:
+            reliable_port = port + RELIABLE_PORT_OFFSET
             self.socket.bind([
                 f"tcp://{host}:{port}",
                 f"tcp://{host}:{port+1}"
             ])
-            logger.info(f"Server running at {host}, ports {port}, {port+1}.")
+            self.reliable_socket.bind([
+                f"tcp://{host}:{reliable_port}",
+                f"tcp://{host}:{reliable_port+1}"
+            ])
+            logger.info(
+                f"Server running at {host}, ports {port}, {port+1} (reliable "
+                f"{reliable_port}, {reliable_port+1})."
+            )
         else:
             logger.info("Client ZMQ socket initialized.")
 
@@ -163,18 +189,25 @@ class MessageServer:
         """
         Connect to another MessageServer.
         """
+        reliable_port = port + RELIABLE_PORT_OFFSET
         self.socket.connect([
             f"tcp://{host}:{port}",
             f"tcp://{host}:{port+1}"
         ])
+        self.reliable_socket.connect([
+            f"tcp://{host}:{reliable_port}",
+            f"tcp://{host}:{reliable_port+1}"
+        ])
         logger.info(f"Connecting to {host}, ports {port}, {port+1}...")
 
-    def dispatch(self, msg, log=True):
+    def dispatch(self, msg, log=True, reliable=False):
         """
-        Send a zerolib.Message to another MessageServer.
+        Send a zerolib.Message to another MessageServer. Reliable messages are
+        queued until delivered, rather than replaced by the next message.
         """
+        socket = self.reliable_socket if reliable else self.socket
         try:
-            self.socket.send(msg.to_bytes())
+            socket.send(msg.to_bytes())
         except:
             logger.error("Error sending message.")
             self.format_traceback()
@@ -294,9 +327,11 @@ class MessageServer:
         ]
         self.running = True
         self.socket.run()
+        self.reliable_socket.run()
         [thd.start() for thd in self.threads]
 
     def stop(self):
         self.running = False
         [thd.join() for thd in self.threads]
         self.socket.stop()
+        self.reliable_socket.stop()
@@ -10,6 +10,8 @@ class MessageType(Enum):
     ACTION = 2
     NOTIFICATION = 3
     ENGINE_PROGRAM_SETTINGS = 4
+    SPECTRUM = 5
+    CAPTURE_DATA = 6
 
 ### ACTIONS
 class ActionType(Enum):
@@ -81,6 +83,13 @@ SENSOR_NOISE = {
     SensorType.MDOT : 0.01
 }
 
+# Sensors whose readings are commanded states, which change in steps. They are
+# sent to the monitor as read, without low pass filtering or averaging.
+STEP_SENSORS = {
+    SensorType.FUEL_VALVE_THROTTLE,
+    SensorType.OXIDIZER_VALVE_THROTTLE
+}
+
 # The type of the raw reading supplied by the sensor board. See the
 # documentation for the python library 'struct' for information about the type.
 SENSOR_READING_TYPE = {
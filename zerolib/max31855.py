@@ -0,0 +1,61 @@
+""" Batched MAX31855 thermocouple reader.
+
+All of the thermocouple amplifiers share one SPI bus, so they are read back to
+back inside a single locked transaction on an SPITransport. Decoding follows
+the MAX31855 datasheet (and the Adafruit driver).
+"""
+import struct
+
+from zerolib.spi import SPITransport
+
+# The MAX31855 supports up to 5 MHz.
+BAUDRATE = 2000000
+
+FRAME_FORMAT = struct.Struct(">hh")
+
+
+def decode_frame(data):
+    """
+    Return the thermocouple temperature in degC from a 4 byte frame. Raises a
+    RuntimeError if the chip reports a fault.
+    """
+    if data[3] & 0x01:
+        raise RuntimeError("thermocouple not connected")
+    if data[3] & 0x02:
+        raise RuntimeError("short circuit to ground")
+    if data[3] & 0x04:
+        raise RuntimeError("short circuit to power")
+    if data[1] & 0x01:
+        raise RuntimeError("faulty reading")
+
+    temp, _ = FRAME_FORMAT.unpack(data)
+    return (temp >> 2) / 4
+
+
+class MAX31855Array:
+    """ Reads several MAX31855 chips in one transaction.
+
+    read_all returns one entry per chip: either the temperature in degC, or the
+    RuntimeError describing the fault.
+    """
+    def __init__(self, transport : SPITransport, cs_pins, baudrate=BAUDRATE):
+        self.transport = transport
+        self.devices = [transport.device(cs, baudrate=baudrate) for cs in cs_pins]
+
+        # Preallocated receive buffers
+        self.frames = [bytearray(4) for _ in cs_pins]
+
+    def read_all(self):
+        with self.transport.locked():
+            for dev, frame in zip(self.devices, self.frames):
+                with dev as spi:
+                    spi.readinto(frame)
+
+        results = []
+        for frame in self.frames:
+            try:
+                results.append(decode_frame(frame))
+            except RuntimeError as e:
+                results.append(e)
+
+        return results
@@ -6,6 +6,8 @@ exist:
     SensorDataMessage   - Arbitrary length message containing sensor datapoints.
     ActionMessage       - Carries only an item from the ActionType enum.
     NotificationMessage - Carries a string. Encoded/decoded with UTF-8.
+    SpectrumMessage     - Power spectrum (or band powers) of a single sensor.
+    CaptureDataMessage  - One chunk of a full rate event capture.
 """
 import struct
 import logging
@@ -28,6 +30,18 @@ DOUBLE_FORMAT = struct.Struct("<d")
 USHORT_FORMAT = struct.Struct("<H")
 UINT_FORMAT = struct.Struct("<I")
 
+# Spectrum header: timestamp (float64), sensor ID (uchar8), bin width in Hz
+# (float64). The header is followed by the powers in dB (float32 each).
+SPECTRUM_HEADER_FORMAT = struct.Struct("<dBd")
+
+# Capture chunk header: controller session (uint32), capture ID, chunk index,
+# number of chunks (ushort16 each), trigger time (float64) and the length of
+# the UTF-8 reason (uchar8). The reason follows the header, then the data
+# points.
+CAPTURE_HEADER_FORMAT = struct.Struct("<IHHHdB")
+# Each capture data point is the sensor ID (uchar8), time and reading (float64)
+CAPTURE_DATA_FORMAT = struct.Struct("<Bdd")
+
 # Convert the sensor reading types into compiled struct objects. The raw values
 # are either unsigned shorts or integers.
 SENSOR_READING_FORMATS = {
@@ -46,6 +60,10 @@ def get_message_class(m_type):
             return NotificationMessage
         case MessageType.ENGINE_PROGRAM_SETTINGS:
             return EngineProgramSettingsMessage
+        case MessageType.SPECTRUM:
+            return SpectrumMessage
+        case MessageType.CAPTURE_DATA:
+            return CaptureDataMessage
 
     logger.error(f"Received message of type {m_type}, which is not supported.")
     raise TypeError("Unsupported message type.")
@@ -173,6 +191,85 @@ class EngineProgramSettingsMessage(Message):
         return MessageType.ENGINE_PROGRAM_SETTINGS
 
 
+class SpectrumMessage(Message):
+    """ Power spectrum of a sensor, computed on the controller.
+
+    bin_width - Spacing of the frequency bins in Hz, starting from 0 Hz. Zero if
+                the powers are band powers for the bands configured for the
+                sensor.
+    powers    - Power in dB for each bin or band.
+    """
+    def __init__(self, timestamp, sensor_id, bin_width, powers):
+        self.timestamp = timestamp
+        self.sensor_id = sensor_id
+        self.bin_width = bin_width
+        self.powers = powers
+
+    def serialize_to_bytes(self):
+        return SPECTRUM_HEADER_FORMAT.pack(
+            self.timestamp, self.sensor_id, self.bin_width
+        ) + struct.pack(f"<{len(self.powers)}f", *self.powers)
+
+    @staticmethod
+    def create_from_bytes(msg_bytes):
+        header = msg_bytes[:SPECTRUM_HEADER_FORMAT.size]
+        data = msg_bytes[SPECTRUM_HEADER_FORMAT.size:]
+        return SpectrumMessage(
+            *SPECTRUM_HEADER_FORMAT.unpack(header),
+            list(struct.unpack(f"<{len(data)//4}f", data))
+        )
+
+    @staticmethod
+    def get_type():
+        return MessageType.SPECTRUM
+
+
+class CaptureDataMessage(Message):
+    """ One chunk of an event capture. Large captures are split into chunks
+    which are sent one at a time.
+
+    session - Identifies the controller run, since capture IDs restart with
+              every run.
+    data    - List of (sensor ID, time, reading) points.
+    """
+    def __init__(self, session, capture_id, chunk, num_chunks, trigger_time,
+            reason, data):
+        self.session = session
+        self.capture_id = capture_id
+        self.chunk = chunk
+        self.num_chunks = num_chunks
+        self.trigger_time = trigger_time
+        self.reason = reason
+        self.data = data
+
+    def serialize_to_bytes(self):
+        # Truncated to the length field without splitting a character
+        reason = self.reason.encode("utf-8")[:255]
+        reason = reason.decode("utf-8", errors="ignore").encode("utf-8")
+        return CAPTURE_HEADER_FORMAT.pack(
+            self.session, self.capture_id, self.chunk, self.num_chunks,
+            self.trigger_time, len(reason)
+        ) + reason + b"".join([
+            CAPTURE_DATA_FORMAT.pack(*x) for x in self.data
+        ])
+
+    @staticmethod
+    def create_from_bytes(msg_bytes):
+        *header, reason_len = CAPTURE_HEADER_FORMAT.unpack(
+            msg_bytes[:CAPTURE_HEADER_FORMAT.size]
+        )
+        data_start = CAPTURE_HEADER_FORMAT.size + reason_len
+        return CaptureDataMessage(
+            *header,
+            msg_bytes[CAPTURE_HEADER_FORMAT.size:data_start].decode("utf-8"),
+            list(CAPTURE_DATA_FORMAT.iter_unpack(msg_bytes[data_start:]))
+        )
+
+    @staticmethod
+    def get_type():
+        return MessageType.CAPTURE_DATA
+
+
 class LogForwarder(logging.Handler):
     """
     This class extends the logging.Handler class. It implements the handle
@@ -0,0 +1,50 @@
+""" Data-ready driven NAU7802 reader.
+
+The cedargrove driver is still used to configure the chip. This reader only
+handles the hot path: checking the cycle-ready flag and reading the conversion
+result inside a single bus lock. When the chip sits behind a TCA9548A, each bus
+lock is one channel switch, so a poll costs one switch instead of one per
+register access.
+"""
+from adafruit_bus_device.i2c_device import I2CDevice
+
+DEFAULT_ADDRESS = 0x2A
+
+REG_PU_CTRL = 0x00
+REG_ADCO_B2 = 0x12
+
+# PU_CTRL cycle ready bit. Cleared once the conversion result is read.
+PU_CTRL_CR = 0x20
+
+def decode_conversion(data):
+    # 24 bit two's complement, MSB first
+    value = (data[0] << 16) | (data[1] << 8) | data[2]
+    if value & 0x800000:
+        value -= 1 << 24
+    return value
+
+
+class NAU7802Reader:
+    """ Reads fresh NAU7802 conversions.
+
+    read_fresh returns None if no new conversion has completed since the last
+    read, so the same sample is never returned twice.
+    """
+    def __init__(self, i2c, address=DEFAULT_ADDRESS):
+        self.dev = I2CDevice(i2c, address)
+
+        # Preallocated transfer buffers
+        self.status_cmd = bytes([REG_PU_CTRL])
+        self.data_cmd = bytes([REG_ADCO_B2])
+        self.status = bytearray(1)
+        self.data = bytearray(3)
+
+    def read_fresh(self):
+        with self.dev as i2c:
+            i2c.write_then_readinto(self.status_cmd, self.status)
+            if not self.status[0] & PU_CTRL_CR:
+                return None
+
+            i2c.write_then_readinto(self.data_cmd, self.data)
+
+        return decode_conversion(self.data)
@@ -5,9 +5,17 @@ module).
 """
 import configparser
 
-from zerolib.enums import SensorType, SENSOR_UNITS, SENSOR_RANGE
+from zerolib.enums import ActionType, SensorType, SENSOR_UNITS, SENSOR_RANGE
 from zerolib.enums import SENSOR_NOISE, SENSOR_READING_TYPE
 
+# Sensors with a higher priority are protected when the controller cannot
+# sustain every configured rate. Lower priority sensors are decimated first.
+DEFAULT_PRIORITY = 0
+
+# Redline rules trip after this many consecutive violating samples by default
+DEFAULT_REDLINE_PERSISTENCE = 1
+DEFAULT_REDLINE_ACTION = "ABORT"
+
 
 class SensorConfiguration:
     """ Reads a sensor configuration file.
@@ -48,6 +56,63 @@ class SensorConfiguration:
             else:
                 sensor_rate = None
 
+            if "Priority" in sensor_data:
+                priority = int(sensor_data["Priority"])
+            else:
+                priority = DEFAULT_PRIORITY
+
+            if "Downlink Cutoff" in sensor_data:
+                downlink_cutoff = float(sensor_data["Downlink Cutoff"])
+            else:
+                downlink_cutoff = None
+
+            if "Derived" in sensor_data:
+                derivation = Derivation(
+                    sensor_data["Derived"].strip().lower(),
+                    [int(x) for x in sensor_data["Sources"].split(',')],
+                    scale = float(sensor_data.get("Scale", 1)),
+                    window = int(sensor_data["Window"])
+                        if "Window" in sensor_data else None
+                )
+            else:
+                derivation = None
+
+            if "Spectrum" in sensor_data:
+                spectrum_length = int(sensor_data["Spectrum"])
+            else:
+                spectrum_length = None
+
+            if "Spectrum Bands" in sensor_data:
+                spectrum_bands = [
+                    tuple(float(f) for f in band.split('-'))
+                    for band in sensor_data["Spectrum Bands"].split(',')
+                ]
+            else:
+                spectrum_bands = None
+
+            if any(key.startswith("redline") for key in sensor_data):
+                redline = Redline(
+                    minimum = float(sensor_data["Redline Min"])
+                        if "Redline Min" in sensor_data else None,
+                    maximum = float(sensor_data["Redline Max"])
+                        if "Redline Max" in sensor_data else None,
+                    rate = float(sensor_data["Redline Rate"])
+                        if "Redline Rate" in sensor_data else None,
+                    persistence = int(sensor_data.get(
+                        "Redline Persistence", DEFAULT_REDLINE_PERSISTENCE
+                    )),
+                    action = getattr(ActionType, sensor_data.get(
+                        "Redline Action", DEFAULT_REDLINE_ACTION
+                    ).strip())
+                )
+            else:
+                redline = None
+
+            if "Capture Threshold" in sensor_data:
+                capture_threshold = float(sensor_data["Capture Threshold"])
+            else:
+                capture_threshold = None
+
             if "Tab" in sensor_data:
                 tab = int(sensor_data["Tab"])-1
                 self.num_tabs = max(self.num_tabs, tab+1)
@@ -60,7 +125,14 @@ class SensorConfiguration:
                 sensor_id,
                 rate = sensor_rate,
                 number = sensor_number,
-                tab = tab
+                tab = tab,
+                priority = priority,
+                downlink_cutoff = downlink_cutoff,
+                derivation = derivation,
+                spectrum_length = spectrum_length,
+                spectrum_bands = spectrum_bands,
+                redline = redline,
+                capture_threshold = capture_threshold
             )
 
             self.sensors_by_name[sensor_name] = self.sensors[sensor_id]
@@ -88,13 +160,23 @@ class Sensor:
     
     """
     def __init__(
-            self, name, stype, s_id, rate=None, number=None, tab=0):
+            self, name, stype, s_id, rate=None, number=None, tab=0,
+            priority=DEFAULT_PRIORITY, downlink_cutoff=None, derivation=None,
+            spectrum_length=None, spectrum_bands=None, redline=None,
+            capture_threshold=None):
         self.name = name
         self.type = stype
         self.s_id = s_id
         self.rate = rate
         self.number = number
         self.tab = tab
+        self.priority = priority
+        self.downlink_cutoff = downlink_cutoff
+        self.derivation = derivation
+        self.spectrum_length = spectrum_length
+        self.spectrum_bands = spectrum_bands
+        self.redline = redline
+        self.capture_threshold = capture_threshold
 
     def get_name(self) -> str:
         return self.name
@@ -114,6 +196,33 @@ class Sensor:
     def get_tab(self) -> int:
         return self.tab
 
+    def get_priority(self) -> int:
+        return self.priority
+
+    def get_downlink_cutoff(self) -> float | None:
+        return self.downlink_cutoff
+
+    def get_derivation(self):
+        return self.derivation
+
+    def is_derived(self) -> bool:
+        return self.derivation is not None
+
+    def get_spectrum_length(self) -> int | None:
+        return self.spectrum_length
+
+    def get_spectrum_bands(self) -> list[tuple[float, float]] | None:
+        return self.spectrum_bands
+
+    def has_spectrum(self) -> bool:
+        return self.spectrum_length is not None
+
+    def get_redline(self):
+        return self.redline
+
+    def get_capture_threshold(self) -> float | None:
+        return self.capture_threshold
+
     def get_units(self) -> list[str]:
         return SENSOR_UNITS[self.type]
 
@@ -125,3 +234,36 @@ class Sensor:
 
     def get_reading_type(self) -> str:
         return SENSOR_READING_TYPE[self.type]
+
+
+class Derivation:
+    """ Describes how a computed sensor is derived from other sensors.
+
+    operator - One of "sum", "scale", "ratio" or "derivative".
+    sources  - IDs of the input sensors.
+    scale    - Multiplier applied to the result.
+    window   - Window length in samples, for operators which need one.
+    """
+    def __init__(self, operator, sources, scale=1, window=None):
+        self.operator = operator
+        self.sources = sources
+        self.scale = scale
+        self.window = window
+
+
+class Redline:
+    """ Safety limits of a sensor, checked on the controller for every sample.
+
+    minimum, maximum - Limits on the reading, in the default units.
+    rate             - Limit on the magnitude of the rate of change, per second.
+    persistence      - Consecutive violating samples required to trip.
+    action           - ActionType executed when the rule trips.
+    """
+    def __init__(
+            self, minimum=None, maximum=None, rate=None,
+            persistence=DEFAULT_REDLINE_PERSISTENCE, action=ActionType.ABORT):
+        self.minimum = minimum
+        self.maximum = maximum
+        self.rate = rate
+        self.persistence = persistence
+        self.action = action
@@ -1,47 +1,224 @@
 """ Real-time data interpretation algorithms.
 """
+from collections import deque
+
 import numpy as np
 
 from scipy import signal
 
-def ema(arr, k=0.3):
-    ret = [arr[0]]
-    for x in arr[1:]:
-        ret.append(x * k + ret[-1] * (1-k))
-    return np.array(ret)
+# Denoising modes. STREAMING is a causal filter with constant work per sample.
+# LOOKBACK re-runs a zero-phase filter over the last few samples for every new
+# sample, which is much slower but has less delay.
+STREAMING = "streaming"
+LOOKBACK = "lookback"
+
+# Number of filtered samples retained by a streaming denoiser by default
+HISTORY_LENGTH = 10000
+
+# Default anti-aliasing cutoff as a fraction of the output Nyquist frequency,
+# and the order of the anti-aliasing filter.
+DECIMATION_CUTOFF_FRACTION = 0.8
+DECIMATION_FILTER_ORDER = 4
+
+def ema(arr, k=0.3, axis=-1):
+    """
+    Exponential moving average along an axis, seeded with the first sample.
+    Equivalent to y[n] = k*x[n] + (1-k)*y[n-1] with y[0] = x[0].
+    """
+    arr = np.asarray(arr, dtype=float)
+    zi = (1-k) * np.take(arr, [0], axis=axis)
+    return signal.lfilter([k], [1, k-1], arr, axis=axis, zi=zi)[0]
 
 def get_crit_freq(sr):
     return (sr/1000)**0.5 * 5
 
+def steady_state(sos, data, axis=0):
+    """
+    Initial sosfilt state for data along an axis, assuming every channel
+    started at its first sample. Shape is (n_sections, ..., 2, ...) as required
+    by sosfilt.
+    """
+    data = np.asarray(data, dtype=float)
+    axis = axis % data.ndim
+
+    zi = signal.sosfilt_zi(sos)
+    # Broadcast (n_sections, 2) against the first sample of every channel
+    first = np.take(data, [0], axis=axis)
+    shape = [zi.shape[0]] + [1] * data.ndim
+    shape[axis+1] = 2
+    return zi.reshape(shape) * first[np.newaxis]
+
+def sosfilt_channels(sos, data, axis=0, zi=None):
+    """
+    Causally filter many channels at once along one axis (by default, frames
+    of shape (samples, channels)). Returns the filtered data and the final
+    state, which can be passed back in as zi to continue with the next block.
+    """
+    data = np.asarray(data, dtype=float)
+    if zi is None:
+        zi = steady_state(sos, data, axis)
+    return signal.sosfilt(sos, data, axis=axis, zi=zi)
+
+def filtfilt_channels(sos, data, axis=0):
+    """
+    Zero-phase filter many channels at once along one axis.
+    """
+    return signal.sosfiltfilt(sos, np.asarray(data, dtype=float), axis=axis)
+
+def decimate(data, q, axis=0, zero_phase=True):
+    """
+    Low pass filter and downsample many channels at once by an integer factor.
+    """
+    return signal.decimate(
+        np.asarray(data, dtype=float), q, axis=axis, zero_phase=zero_phase
+    )
+
+def sos_step(sections, state, x):
+    """
+    Filter one sample through a cascade of second order sections. Uses the
+    transposed direct form II state layout of scipy's sosfilt, so the state can
+    be shared with block calls. sections and state are nested lists (much
+    faster than numpy for scalar work) and state is updated in place.
+    """
+    for (b0, b1, b2, _, a1, a2), z in zip(sections, state):
+        y = b0 * x + z[0]
+        z[0] = b1 * x - a1 * y + z[1]
+        z[1] = b2 * x - a2 * y
+        x = y
+    return x
+
+class MultiChannelFilter:
+    """ Stateful causal filter applied to blocks of frames from many sensors.
+
+    Each call to process takes an array of shape (samples, channels) and
+    continues from the state left by the previous call.
+    """
+    def __init__(self, sos):
+        self.sos = sos
+        self.state = None
+
+    def process(self, block):
+        output, self.state = sosfilt_channels(
+            self.sos, block, axis=0, zi=self.state
+        )
+        return output
+
+    def reset(self):
+        self.state = None
+
+def design_decimation_filter(sample_rate, output_rate, cutoff=None):
+    """
+    Design an anti-aliasing low pass filter for resampling a signal from
+    sample_rate down to output_rate. Returns None if no filtering is needed,
+    i.e. the cutoff is at or above the input Nyquist frequency.
+    """
+    if cutoff is None:
+        cutoff = DECIMATION_CUTOFF_FRACTION * output_rate / 2
+
+    if cutoff <= 0 or cutoff >= sample_rate / 2:
+        return None
+
+    return signal.butter(
+        DECIMATION_FILTER_ORDER, cutoff, output="sos", fs=sample_rate
+    )
+
+class StreamingDecimator:
+    """ Band-limits a stream for resampling at a lower rate.
+
+    Every input sample goes through the anti-aliasing filter as it arrives, so
+    the output can be sampled at any time without extra buffering or latency
+    beyond the filter's own group delay.
+    """
+    def __init__(self, sos):
+        self.sections = sos.tolist()
+        self.sos = sos
+        self.state = None
+        self.value = None
+
+    def update(self, x):
+        if self.state is None:
+            self.state = (signal.sosfilt_zi(self.sos) * x).tolist()
+        self.value = sos_step(self.sections, self.state, x)
+        return self.value
+
+    def get_value(self):
+        return self.value
+
 class GenericSensorDenoiser:
     """ Denoising algorithms for analog sensors.
-    
+
+    The default LOOKBACK mode zero-phase filters the last few samples for
+    every update, and get_curve returns every filtered sample. In STREAMING
+    mode, the filter state is carried between samples, so each update costs
+    the same regardless of history, but the output is delayed by the group
+    delay of the causal filter (~100 ms at 400 Hz). Streaming denoisers keep
+    the last history_length filtered samples (HISTORY_LENGTH by default), so
+    memory use is bounded. filter_block provides zero-phase filtering of whole
+    arrays for post-processing.
     """
-    def __init__(self, sample_rate):
+    def __init__(self, sample_rate, mode=LOOKBACK, history_length=None):
         self.freq = sample_rate
+        self.mode = mode
+        if history_length is None and mode == STREAMING:
+            history_length = HISTORY_LENGTH
         self.filter = signal.butter(3, get_crit_freq(sample_rate), output="sos", fs=sample_rate)
         self.lookback = max(int(self.freq**0.75), 20)
 
-        self.signal = []
-        self.filtered_signal = []
-    
+        self.sections = self.filter.tolist()
+        self.state = None
+
+        self.signal = deque(maxlen=self.lookback)
+        # Unbounded if history_length is None
+        self.filtered_signal = deque(maxlen=history_length)
+
+    def initialize_state(self, y):
+        # Start from the steady state for a constant input, which avoids the
+        # filter ramping up from zero.
+        self.state = (signal.sosfilt_zi(self.filter) * y).tolist()
+
     def update(self, y):
-        if not self.signal:
-            self.signal = [y for _ in range(self.lookback)]
+        if self.mode == STREAMING:
+            if self.state is None:
+                self.initialize_state(y)
+            output = sos_step(self.sections, self.state, y)
+        else:
+            if not self.signal:
+                self.signal.extend([y] * self.lookback)
 
-        self.signal.append(y)
-        sample = self.signal[-self.lookback:]
+            self.signal.append(y)
+            output = signal.sosfiltfilt(self.filter, self.signal)[-1]
 
-        output = signal.sosfiltfilt(self.filter, sample)[-1]
         self.filtered_signal.append(output)
 
         return output
-    
+
+    def update_block(self, arr):
+        """
+        Causally filter a block of new samples, continuing from the current
+        state. Returns the filtered block.
+        """
+        arr = np.asarray(arr, dtype=float)
+        if self.state is None:
+            self.initialize_state(arr[0])
+
+        output, state = signal.sosfilt(self.filter, arr, zi=np.array(self.state))
+        self.state = state.tolist()
+        self.filtered_signal.extend(output)
+
+        return output
+
+    def filter_block(self, arr):
+        """
+        Zero-phase filter a complete recording. Does not affect the streaming
+        state.
+        """
+        return signal.sosfiltfilt(self.filter, arr)
+
     def get_value(self):
         if self.filtered_signal:
             return self.filtered_signal[-1]
         else:
             return 0
-    
+
     def get_curve(self):
-        return self.filtered_signal
\ No newline at end of file
+        return list(self.filtered_signal)
@@ -0,0 +1,205 @@
+""" Pluggable SPI transports.
+
+The sensor drivers talk to an SPITransport through ChipSelectDevice handles,
+which behave like adafruit_bus_device's SPIDevice but toggle the chip select
+manually. This allows the same drivers to run on:
+    BusioTransport    - Any busio-compatible SPI object, e.g. bitbangio.SPI.
+    SpidevTransport   - The kernel spidev driver (hardware SPI).
+    LoopbackTransport - Software stand-in for testing without hardware.
+
+Every transport owns a reentrant lock, so several transfers (e.g. reading all
+of the thermocouples) can be grouped into a single locked transaction.
+"""
+import threading
+
+from abc import ABC, abstractmethod
+from contextlib import contextmanager
+
+try:
+    import spidev
+except ImportError:
+    spidev = None
+
+
+class SPITransport(ABC):
+    """ Generic SPI transport ABC. Implementations only need to provide the
+    raw transfers and bus configuration.
+    """
+    def __init__(self):
+        self.lock = threading.RLock()
+        self.depth = 0
+
+        # Only reconfigure the bus when a device with different settings is
+        # selected.
+        self.config = None
+
+    def acquire(self):
+        self.lock.acquire()
+        self.depth += 1
+        if self.depth == 1:
+            self.bus_lock()
+
+    def release(self):
+        self.depth -= 1
+        if self.depth == 0:
+            self.bus_unlock()
+        self.lock.release()
+
+    @contextmanager
+    def locked(self):
+        # Group several device transactions without releasing the bus.
+        self.acquire()
+        try:
+            yield self
+        finally:
+            self.release()
+
+    def bus_lock(self):
+        pass
+
+    def bus_unlock(self):
+        pass
+
+    def set_config(self, config):
+        if config != self.config:
+            self.configure(*config)
+            self.config = config
+
+    def select(self, cs):
+        cs.value = False
+
+    def deselect(self, cs):
+        cs.value = True
+
+    def device(self, cs, baudrate=100000, polarity=0, phase=0):
+        return ChipSelectDevice(self, cs, baudrate, polarity, phase)
+
+    @abstractmethod
+    def configure(self, baudrate, polarity, phase):
+        pass
+
+    @abstractmethod
+    def write(self, data):
+        pass
+
+    @abstractmethod
+    def readinto(self, buf, write_value=0):
+        pass
+
+
+class ChipSelectDevice:
+    """ A device on an SPITransport, used as a context manager in the same
+    way as adafruit_bus_device.spi_device.SPIDevice.
+    """
+    def __init__(self, transport, cs, baudrate, polarity, phase):
+        self.transport = transport
+        self.cs = cs
+        self.config = (baudrate, polarity, phase)
+
+        if hasattr(cs, "switch_to_output"):
+            cs.switch_to_output(value=True)
+
+    def __enter__(self):
+        self.transport.acquire()
+        self.transport.set_config(self.config)
+        self.transport.select(self.cs)
+        return self.transport
+
+    def __exit__(self, *args):
+        self.transport.deselect(self.cs)
+        self.transport.release()
+        return False
+
+
+class BusioTransport(SPITransport):
+    """ Transport wrapping a busio-compatible SPI object.
+    """
+    def __init__(self, spi):
+        super().__init__()
+        self.spi = spi
+
+    def bus_lock(self):
+        while not self.spi.try_lock():
+            pass
+
+    def bus_unlock(self):
+        self.spi.unlock()
+
+    def configure(self, baudrate, polarity, phase):
+        self.spi.configure(baudrate=baudrate, polarity=polarity, phase=phase)
+
+    def write(self, data):
+        self.spi.write(data)
+
+    def readinto(self, buf, write_value=0):
+        self.spi.readinto(buf, write_value=write_value)
+
+
+class SpidevTransport(SPITransport):
+    """ Hardware SPI through the kernel spidev driver. Chip selects are
+    handled manually so any GPIO can be used.
+    """
+    def __init__(self, bus=0, device=0):
+        if spidev is None:
+            raise RuntimeError("spidev is not installed!")
+
+        super().__init__()
+        self.spi = spidev.SpiDev()
+        self.spi.open(bus, device)
+
+        try:
+            self.spi.no_cs = True
+        except OSError:
+            # Not supported by every kernel driver. The hardware CS line is
+            # then also toggled, which is harmless if nothing is attached.
+            pass
+
+        # Cached transmit buffers for reads, indexed by (length, write value)
+        self.tx_buffers = {}
+
+    def configure(self, baudrate, polarity, phase):
+        self.spi.max_speed_hz = baudrate
+        self.spi.mode = (polarity << 1) | phase
+
+    def write(self, data):
+        self.spi.writebytes2(data)
+
+    def readinto(self, buf, write_value=0):
+        key = (len(buf), write_value)
+        if key not in self.tx_buffers:
+            self.tx_buffers[key] = [write_value] * len(buf)
+
+        buf[:] = bytes(self.spi.xfer2(self.tx_buffers[key]))
+
+
+class LoopbackTransport(SPITransport):
+    """ Software transport for testing drivers without hardware.
+
+    responders maps a chip select to a function which is given the number of
+    bytes requested and returns the bytes the device would send. Devices
+    without a responder echo the write value. All writes are recorded in
+    self.written along with the selected chip select.
+    """
+    def __init__(self, responders=None):
+        super().__init__()
+        self.responders = responders or {}
+        self.selected = None
+        self.written = []
+
+    def select(self, cs):
+        self.selected = cs
+
+    def deselect(self, cs):
+        self.selected = None
+
+    def configure(self, baudrate, polarity, phase):
+        pass
+
+    def write(self, data):
+        self.written.append((self.selected, bytes(data)))
+
+    def readinto(self, buf, write_value=0):
+        if self.selected in self.responders:
+            buf[:] = self.responders[self.selected](len(buf))
+        else:
+            buf[:] = bytes([write_value]) * len(buf)
@@ -11,6 +11,12 @@ logging_config = {
     "datefmt" : "%m/%d/%Y %I:%M:%S %p"
 }
 
+# Rate in Hz at which the controller sends sensor data to the monitor
+TELEMETRY_RATE = 60
+
+# Rate in Hz at which the controller sends spectra to the monitor
+SPECTRUM_RATE = 4
+
 formatter_config = {
     "fmt" : logging_config["format"],
     "datefmt" : logging_config["datefmt"]